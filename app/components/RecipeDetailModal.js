@@ -1,9 +1,54 @@
 "use client";
 
-import { useEffect } from "react";
+import { useEffect, useState } from "react";
 import { X } from "lucide-react";
 
-export default function RecipeDetailModal({ recipe, isOpen, onClose }) {
+const API_BASE_URL =
+  process.env.NEXT_PUBLIC_API_BASE_URL || "http://localhost:8000";
+
+export default function RecipeDetailModal({ recipe: listed, isOpen, onClose }) {
+  // Summaries from /recommend have no quantities or steps; fetch them once, when first opened
+  const [details, setDetails] = useState(null);
+  const [loadingDetails, setLoadingDetails] = useState(false);
+  const [detailsError, setDetailsError] = useState("");
+
+  useEffect(() => {
+    if (!isOpen || !listed?.summary || details) return;
+
+    let cancelled = false;
+    setLoadingDetails(true);
+    setDetailsError("");
+    fetch(`${API_BASE_URL}/recipes/${listed.id}`)
+      .then(async (res) => {
+        if (!res.ok) {
+          let errorMsg = `HTTP ${res.status}: `;
+          try {
+            const errorData = await res.json();
+            errorMsg += errorData?.detail || res.statusText;
+          } catch {
+            errorMsg += res.statusText || "Unknown error";
+          }
+          throw new Error(errorMsg);
+        }
+        return res.json();
+      })
+      .then((data) => {
+        if (!cancelled) setDetails(data.recipe);
+      })
+      .catch((err) => {
+        console.error("Error fetching recipe details:", err);
+        if (!cancelled) setDetailsError(err.message || "Could not load the recipe.");
+      })
+      .finally(() => {
+        if (!cancelled) setLoadingDetails(false);
+      });
+
+    return () => {
+      cancelled = true;
+      setLoadingDetails(false);
+    };
+  }, [isOpen, listed?.id, listed?.summary, details]);
+
   useEffect(() => {
     const handleEscape = (e) => {
       if (e.key === "Escape") {
@@ -22,7 +67,9 @@ export default function RecipeDetailModal({ recipe, isOpen, onClose }) {
     };
   }, [isOpen, onClose]);
 
-  if (!isOpen || !recipe) return null;
+  if (!isOpen || !listed) return null;
+
+  const recipe = details || listed;
 
   const coverage =
     typeof recipe.coverageScore === "number"
@@ -237,6 +284,18 @@ export default function RecipeDetailModal({ recipe, isOpen, onClose }) {
               </section>
             )}
 
+          {loadingDetails && (
+            <p className="text-base text-slate-500">
+              Loading quantities and cooking instructions...
+            </p>
+          )}
+
+          {detailsError && (
+            <p className="rounded-xl bg-rose-50 px-4 py-3 text-sm text-rose-700">
+              Could not load the full recipe. {detailsError}
+            </p>
+          )}
+
           {Array.isArray(recipe.steps) && recipe.steps.length > 0 && (
             <section>
               <h3 className="text-xl font-bold text-purple-900 mb-4 flex items-center gap-2">
@@ -0,0 +1,362 @@
+"""
+Micro-benchmarks for the request hot path.
+
+Usage (from the backend directory):
+    python benchmarks.py decode --width 4000 --height 3000 --runs 20
+    MODEL_PATH=best.pt python benchmarks.py prescreen --runs 20
+    python benchmarks.py corpus --recipes 100000 --queries 500
+    python benchmarks.py parse --responses 2000
+"""
+import argparse
+import io
+import json
+import os
+import random
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any, Callable, Dict, FrozenSet, List
+
+import numpy as np
+from PIL import Image
+
+from image_preprocessing import prepare_image, to_model_array
+from image_prescreen import prescreen
+
+INFERENCE_SIZE = 640
+
+
+def synthetic_photo(width: int, height: int, seed: int = 0) -> bytes:
+    """A phone-photo-like JPEG: smooth gradients plus sensor-like noise."""
+    rng = np.random.default_rng(seed)
+    y, x = np.mgrid[0:height, 0:width].astype(np.float32)
+    base = np.stack([x / width * 255, y / height * 255, (x + y) / (width + height) * 255], axis=-1)
+    arr = np.clip(base + rng.normal(0, 12, size=base.shape), 0, 255).astype(np.uint8)
+    buf = io.BytesIO()
+    Image.fromarray(arr, "RGB").save(buf, "JPEG", quality=90)
+    return buf.getvalue()
+
+
+def legacy_decode(contents: bytes) -> Image.Image:
+    """The previous /recommend path: full decode, LANCZOS to 1920px, then resize to 640px."""
+    img = Image.open(io.BytesIO(contents)).convert("RGB")
+    w, h = img.size
+    if w > 1920 or h > 1920:
+        scale = min(1920 / float(w), 1920 / float(h))
+        img = img.resize((int(w * scale), int(h * scale)), Image.Resampling.LANCZOS)
+    w, h = img.size
+    scale = min(INFERENCE_SIZE / float(w), INFERENCE_SIZE / float(h), 1.0)
+    if scale != 1.0:
+        img = img.resize((int(w * scale), int(h * scale)))
+    return img
+
+
+def draft_decode(contents: bytes) -> Image.Image:
+    """The reduced-scale decode path used by /recommend."""
+    return prepare_image(contents, INFERENCE_SIZE)
+
+
+DECODE_PATHS: Dict[str, Callable[[bytes], Any]] = {
+    "legacy": legacy_decode,
+    "draft": draft_decode,
+}
+
+
+def _time_runs(fn: Callable[[], Any], runs: int) -> Dict[str, float]:
+    timings: List[float] = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - started) * 1000)
+    timings.sort()
+    return {
+        "mean_ms": round(statistics.mean(timings), 2),
+        "p50_ms": round(timings[len(timings) // 2], 2),
+        "p95_ms": round(timings[int(0.95 * (len(timings) - 1))], 2),
+    }
+
+
+def _peak_rss_growth_mb(path: str, image_file: str) -> float:
+    """
+    Measure peak RSS growth of a decode path in a fresh interpreter.
+    (Pillow's pixel buffers are not visible to tracemalloc.)
+    """
+    out = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), "peak-rss", path, image_file],
+        check=True, capture_output=True, text=True,
+    )
+    return float(out.stdout.strip().splitlines()[-1])
+
+
+def _peak_rss_kib() -> int:
+    """Peak resident set size of this process in KiB."""
+    # VmHWM is reset on exec, unlike ru_maxrss which a child inherits from its parent
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def _cmd_peak_rss(args: argparse.Namespace) -> int:
+    with open(args.image_file, "rb") as f:
+        contents = f.read()
+    baseline = _peak_rss_kib()
+    DECODE_PATHS[args.path](contents)
+    print(round((_peak_rss_kib() - baseline) / 1024.0, 1))
+    return 0
+
+
+def benchmark_decode(width: int, height: int, runs: int) -> Dict[str, Dict[str, Any]]:
+    contents = synthetic_photo(width, height)
+    report: Dict[str, Dict[str, Any]] = {}
+    with tempfile.NamedTemporaryFile(suffix=".jpg") as image_file:
+        image_file.write(contents)
+        image_file.flush()
+        for name, fn in DECODE_PATHS.items():
+            stats: Dict[str, Any] = _time_runs(lambda: fn(contents), runs)
+            stats["peak_rss_growth_mb"] = _peak_rss_growth_mb(name, image_file.name)
+            stats["output_size"] = fn(contents).size
+            report[name] = stats
+    return report
+
+
+def _cmd_decode(args: argparse.Namespace) -> int:
+    report = benchmark_decode(args.width, args.height, args.runs)
+    print(f"Decode of a {args.width}x{args.height} JPEG to {INFERENCE_SIZE}px ({args.runs} runs):")
+    for name, stats in report.items():
+        print(f"  {name:>8}: {stats}")
+    return 0
+
+
+def benchmark_prescreen(runs: int) -> Dict[str, Dict[str, Any]]:
+    """Pre-screen of a decoded upload vs. a single model pass on the same image."""
+    from model import INFERENCE_IMAGE_SIZE, load_model  # loads torch + ultralytics
+
+    img = draft_decode(synthetic_photo(4000, 3000))
+    pixels = to_model_array(img)
+    model = load_model()
+    model.predict(pixels, imgsz=INFERENCE_IMAGE_SIZE, verbose=False)  # warmup
+    return {
+        "prescreen_pil": _time_runs(lambda: prescreen(img), runs),
+        "prescreen_array": _time_runs(lambda: prescreen(pixels), runs),
+        "inference": _time_runs(lambda: model.predict(pixels, imgsz=INFERENCE_IMAGE_SIZE, verbose=False), runs),
+    }
+
+
+def _cmd_prescreen(args: argparse.Namespace) -> int:
+    report = benchmark_prescreen(args.runs)
+    print(f"Pre-screen vs. one inference at {INFERENCE_SIZE}px ({args.runs} runs):")
+    for name, stats in report.items():
+        print(f"  {name:>15}: {stats}")
+    ratio = report["prescreen_pil"]["mean_ms"] / report["inference"]["mean_ms"]
+    print(f"  pre-screen costs {ratio:.1%} of an inference")
+    return 0
+
+
+_BASE_INGREDIENTS = (
+    "egg tomato onion garlic rice pasta chicken beef pork tofu milk butter cheese flour sugar salt pepper "
+    "potato carrot celery spinach mushroom bean lentil chickpea lemon lime basil parsley cilantro ginger "
+    "soy sauce vinegar honey yogurt cream bread corn pea zucchini eggplant cabbage broccoli apple banana "
+    "oat almond walnut cumin paprika chili shrimp salmon tuna bacon ham noodle coconut avocado"
+).split()
+_MODIFIERS = ("", "red", "green", "fresh", "dried", "smoked", "sweet")
+_DIETARY_TAGS = ("vegetarian", "vegan", "gluten-free", "dairy-free")
+
+
+def synthetic_corpus(size: int, seed: int = 0) -> List[Dict[str, Any]]:
+    """Recipes of 6-12 ingredients drawn from a few hundred names with a skewed (Zipf-like) popularity."""
+    rng = random.Random(seed)
+    names = [f"{modifier} {base}".strip() for base in _BASE_INGREDIENTS for modifier in _MODIFIERS]
+    rng.shuffle(names)
+    weights = [1.0 / (rank + 1) for rank in range(len(names))]
+    recipes = []
+    for i in range(size):
+        ingredients = set(rng.choices(names, weights, k=rng.randint(6, 12)))
+        recipes.append({
+            "title": f"Recipe {i}",
+            "ingredients": [{"name": name, "quantity": "1 cup"} for name in sorted(ingredients)],
+            "dietary": [tag for tag in _DIETARY_TAGS if rng.random() < 0.25],
+            "steps": ["Prepare the ingredients.", "Cook.", "Serve."],
+        })
+    return recipes
+
+
+def linear_search(recipes: List[List[FrozenSet[str]]], ingredients: List[str], min_usage: float,
+                  max_missing: int) -> int:
+    """Baseline for the inverted index: score every recipe (as pre-tokenized ingredient names) against the query."""
+    from recipe_similarity import ingredient_tokens
+
+    available = [ingredient_tokens(ing) for ing in ingredients]
+
+    def same(a: FrozenSet[str], b: FrozenSet[str]) -> bool:
+        return a <= b or b <= a
+
+    matches = 0
+    for names in recipes:
+        used = sum(1 for tokens in available if any(same(tokens, name) for name in names))
+        missing = sum(1 for name in names if not any(same(tokens, name) for tokens in available))
+        matches += used >= min_usage * len(available) and missing <= max_missing
+    return matches
+
+
+def benchmark_corpus(size: int, queries: int, baseline_queries: int) -> Dict[str, Any]:
+    """Load time and search latency of the recipe corpus for queries built from corpus recipes."""
+    from recipe_corpus import RecipeCorpus
+    from recipe_similarity import ingredient_tokens
+
+    recipes = synthetic_corpus(size)
+    rng = random.Random(1)
+    workload = []
+    for _ in range(queries):
+        names = [item["name"] for item in rng.choice(recipes)["ingredients"]]
+        query = rng.sample(names, max(1, int(len(names) * 0.7))) + rng.sample(_BASE_INGREDIENTS, 2)
+        tags = [rng.choice(_DIETARY_TAGS)] if rng.random() < 0.2 else []
+        workload.append((query, tags))
+
+    corpus = RecipeCorpus()
+    with tempfile.NamedTemporaryFile("w", suffix=".jsonl") as corpus_file:
+        for recipe in recipes:
+            corpus_file.write(json.dumps(recipe) + "\n")
+        corpus_file.flush()
+        started = time.perf_counter()
+        corpus.load(corpus_file.name)
+        load_s = time.perf_counter() - started
+
+    results = [len(corpus.search(query, tags)) for query, tags in workload]
+    iterator = iter(workload)
+    search = _time_runs(lambda: corpus.search(*next(iterator)), queries)
+    tokenized = [[ingredient_tokens(item["name"]) for item in recipe["ingredients"]] for recipe in recipes]
+    iterator = iter(workload)
+    linear = _time_runs(
+        lambda: linear_search(tokenized, next(iterator)[0], corpus.min_usage, corpus.max_missing), baseline_queries
+    )
+    return {
+        "load_s": round(load_s, 2),
+        "vocabulary": corpus.stats()["vocabulary"],
+        "search": search,
+        "linear_scan": linear,
+        "queries_with_results": sum(1 for count in results if count) / len(results),
+        "mean_results": round(statistics.mean(results), 2),
+    }
+
+
+def _cmd_corpus(args: argparse.Namespace) -> int:
+    report = benchmark_corpus(args.recipes, args.queries, args.baseline_queries)
+    print(f"Recipe corpus of {args.recipes} synthetic recipes, {args.queries} queries:")
+    for name, value in report.items():
+        print(f"  {name:>20}: {value}")
+    print(f"  inverted index is {report['linear_scan']['mean_ms'] / report['search']['mean_ms']:.0f}x faster than a scan")
+    return 0
+
+
+def synthetic_gemini_answer(recipes: int = 5, seed: int = 0) -> Dict[str, Any]:
+    """A recipe answer shaped like RECIPES_RESPONSE_SCHEMA."""
+    rng = random.Random(seed)
+
+    def ingredients(count: int) -> List[Dict[str, str]]:
+        return [{"name": rng.choice(_BASE_INGREDIENTS), "quantity": f"{rng.randint(1, 4)} tbsp"} for _ in range(count)]
+
+    return {"recipes": [
+        {
+            "title": f"Synthetic dish {i}",
+            "description": "A quick weeknight dish with what is already in the fridge.",
+            "prepTime": 10, "cookTime": 25, "totalTime": 35, "servings": 4, "difficulty": "Medium",
+            "usedIngredients": ingredients(6), "missingIngredients": ingredients(3),
+            "coverageScore": 0.75,
+            "steps": [f"Step {step}: do something sensible with the ingredients." for step in range(8)],
+        }
+        for i in range(recipes)
+    ]}
+
+
+def benchmark_parse(responses: int) -> Dict[str, Dict[str, float]]:
+    """Parse + normalize time per recipe answer: tolerant parser vs. structured one-pass decode."""
+    import recipe_schema
+    from gemini_client import GeminiClient
+
+    answer = synthetic_gemini_answer()
+    ingredients = ["egg", "tomato", "onion", "rice", "garlic"]
+    structured = json.dumps(answer)
+    # What Gemini tends to return without a response schema, as strings where numbers belong
+    loose = json.loads(structured)
+    for recipe in loose["recipes"]:
+        recipe["prepTime"] = str(recipe["prepTime"])
+    fenced = "```json\n" + json.dumps(loose, indent=2) + "\n```"
+
+    def parse_all(fn: Callable[[], Any]) -> None:
+        for _ in range(responses):
+            fn()
+
+    def per_response(fn: Callable[[], Any]) -> Dict[str, float]:
+        stats = _time_runs(lambda: parse_all(fn), 5)
+        return {key.replace("_ms", "_us"): round(value * 1000 / responses, 2) for key, value in stats.items()}
+
+    report = {
+        "tolerant_fenced": per_response(lambda: GeminiClient._parse_recipes(fenced, ingredients)),
+        "tolerant_plain": per_response(lambda: GeminiClient._parse_recipes_tolerant(structured, ingredients)),
+    }
+    fast_loads = recipe_schema.loads
+    try:
+        recipe_schema.loads = json.loads
+        report["structured_json"] = per_response(lambda: GeminiClient._parse_recipes(structured, ingredients))
+    finally:
+        recipe_schema.loads = fast_loads
+    if recipe_schema.orjson is not None:
+        report["structured_orjson"] = per_response(lambda: GeminiClient._parse_recipes(structured, ingredients))
+    assert GeminiClient._parse_recipes(structured, ingredients) == GeminiClient._parse_recipes_tolerant(
+        structured, ingredients
+    )
+    return report
+
+
+def _cmd_parse(args: argparse.Namespace) -> int:
+    report = benchmark_parse(args.responses)
+    print(f"Parse + normalize of a 5-recipe answer ({args.responses} responses x 5 runs, per response):")
+    for name, stats in report.items():
+        print(f"  {name:>17}: {stats}")
+    return 0
+
+
+def main(argv: List[str]) -> int:
+    parser = argparse.ArgumentParser(description="Hot path micro-benchmarks")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    decode = sub.add_parser("decode", help="Upload decode + resize: legacy path vs reduced-scale decode")
+    decode.add_argument("--width", type=int, default=4000)
+    decode.add_argument("--height", type=int, default=3000)
+    decode.add_argument("--runs", type=int, default=20)
+    decode.set_defaults(func=_cmd_decode)
+
+    prescreen_cmd = sub.add_parser("prescreen", help="Image pre-screen cost relative to one model inference")
+    prescreen_cmd.add_argument("--runs", type=int, default=20)
+    prescreen_cmd.set_defaults(func=_cmd_prescreen)
+
+    corpus_cmd = sub.add_parser("corpus", help="Local recipe corpus: load time and inverted-index search latency")
+    corpus_cmd.add_argument("--recipes", type=int, default=100000)
+    corpus_cmd.add_argument("--queries", type=int, default=500)
+    corpus_cmd.add_argument("--baseline-queries", type=int, default=3)
+    corpus_cmd.set_defaults(func=_cmd_corpus)
+
+    parse_cmd = sub.add_parser("parse", help="Recipe answer parse + normalize: tolerant parser vs. structured decode")
+    parse_cmd.add_argument("--responses", type=int, default=2000)
+    parse_cmd.set_defaults(func=_cmd_parse)
+
+    # Internal: runs one decode path in a fresh process for the memory measurement
+    peak_rss = sub.add_parser("peak-rss")
+    peak_rss.add_argument("path", choices=list(DECODE_PATHS))
+    peak_rss.add_argument("image_file")
+    peak_rss.set_defaults(func=_cmd_peak_rss)
+
+    args = parser.parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,154 @@
+"""
+Content-addressed cache of YOLO detection results.
+
+Users often resubmit the same photo while changing dietary preferences or manual
+ingredients. Detection results are cached by a hash of the uploaded bytes, the
+confidence threshold and the inference configuration (backend, image size,
+tiling), so a retry returns the per-ingredient detections without running the
+model again. An optional perceptual hash (dHash) also matches copies
+that were re-encoded or slightly resized.
+"""
+import hashlib
+import io
+import logging
+import os
+import threading
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+from PIL import Image
+
+from ttl_cache import LRUCache
+
+logger = logging.getLogger(__name__)
+
+DETECTION_CACHE_ENABLED = os.environ.get("DETECTION_CACHE_ENABLED", "true").lower() == "true"
+DETECTION_CACHE_SIZE = int(os.environ.get("DETECTION_CACHE_SIZE", "256"))
+DETECTION_CACHE_TTL = int(os.environ.get("DETECTION_CACHE_TTL", "3600"))  # seconds
+# Perceptual matching of re-encoded / resized copies (costs a small decode per upload)
+DETECTION_CACHE_PERCEPTUAL = os.environ.get("DETECTION_CACHE_PERCEPTUAL", "false").lower() == "true"
+# Maximum number of differing dHash bits for two images to count as the same photo
+DETECTION_CACHE_PHASH_DISTANCE = int(os.environ.get("DETECTION_CACHE_PHASH_DISTANCE", "4"))
+
+
+# What besides the image and the threshold decides the detections, e.g.
+# (backend, image size, tiling, augment); built by the caller
+InferenceConfig = Tuple[Any, ...]
+
+
+class DetectionCacheKey(NamedTuple):
+    digest: str  # sha256 of the uploaded bytes, confidence threshold and inference configuration
+    conf: float
+    config: InferenceConfig
+    phash: Optional[int]  # 64-bit dHash, only in perceptual mode
+
+
+def perceptual_hash(contents: bytes) -> Optional[int]:
+    """
+    Compute a 64-bit difference hash (dHash) of an image.
+    Returns None if the bytes can't be decoded.
+    """
+    try:
+        img = Image.open(io.BytesIO(contents))
+        # JPEG can decode straight at a reduced scale, which keeps this cheap
+        img.draft("L", (64, 64))
+        small = img.convert("L").resize((9, 8), Image.Resampling.BILINEAR)
+        pixels = list(small.getdata())
+    except Exception as e:  # noqa: BLE001
+        logger.debug(f"Could not compute perceptual hash: {e}")
+        return None
+
+    value = 0
+    for row in range(8):
+        for col in range(8):
+            left = pixels[row * 9 + col]
+            right = pixels[row * 9 + col + 1]
+            value = (value << 1) | (1 if left > right else 0)
+    return value
+
+
+def make_cache_key(contents: bytes, conf: float, config: InferenceConfig,
+                   perceptual: bool = DETECTION_CACHE_PERCEPTUAL) -> DetectionCacheKey:
+    """Build the cache key of an upload. CPU-bound for large files; call it off the event loop."""
+    hasher = hashlib.sha256(contents)
+    hasher.update(f"|conf={conf:.4f}|config={config!r}".encode())
+    phash = perceptual_hash(contents) if perceptual else None
+    return DetectionCacheKey(hasher.hexdigest(), conf, config, phash)
+
+
+class DetectionCache:
+    """
+    Thread-safe LRU cache of detection results with TTL and a bounded number of
+    entries (a ttl_cache.LRUCache keyed by digest), plus perceptual matching.
+    """
+
+    def __init__(self, max_size: int = DETECTION_CACHE_SIZE, ttl: int = DETECTION_CACHE_TTL,
+                 max_phash_distance: int = DETECTION_CACHE_PHASH_DISTANCE) -> None:
+        self.max_phash_distance = max_phash_distance
+        # digest -> (key, detections)
+        self._entries: "LRUCache[Tuple[DetectionCacheKey, List[Any]]]" = LRUCache(max_size, ttl=ttl)
+        self._lock = threading.Lock()
+        self._exact_hits = 0
+        self._perceptual_hits = 0
+        self._misses = 0
+
+    def _find_perceptual(self, key: DetectionCacheKey) -> Optional[str]:
+        """Return the digest of the closest live entry within the Hamming distance limit."""
+        best_digest = None
+        best_distance = self.max_phash_distance + 1
+        for digest, (entry_key, _) in self._entries.items():
+            if entry_key.phash is None or entry_key.conf != key.conf or entry_key.config != key.config:
+                continue
+            distance = bin(entry_key.phash ^ key.phash).count("1")
+            if distance < best_distance:
+                best_digest, best_distance = digest, distance
+        return best_digest
+
+    def get(self, key: DetectionCacheKey) -> Optional[List[Any]]:
+        """Return the cached detections for this upload, or None on a miss."""
+        entry = self._entries.get(key.digest)
+        perceptual = False
+        if entry is None and key.phash is not None:
+            digest = self._find_perceptual(key)
+            if digest is not None:
+                # Refreshes the entry (None if it expired in the meantime)
+                entry = self._entries.get(digest)
+                perceptual = entry is not None
+        with self._lock:
+            if entry is None:
+                self._misses += 1
+                return None
+            if perceptual:
+                self._perceptual_hits += 1
+            else:
+                self._exact_hits += 1
+        return list(entry[1])
+
+    def put(self, key: DetectionCacheKey, detections: List[Any]) -> None:
+        """Store a detection result, evicting the least recently used entries when full."""
+        self._entries.put(key.digest, (key, list(detections)))
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit/miss counters and current size of the cache."""
+        entries = self._entries.stats()
+        with self._lock:
+            lookups = self._exact_hits + self._perceptual_hits + self._misses
+            hits = self._exact_hits + self._perceptual_hits
+            return {
+                "enabled": DETECTION_CACHE_ENABLED,
+                "perceptual": DETECTION_CACHE_PERCEPTUAL,
+                "size": entries["size"],
+                "max_size": entries["max_size"],
+                "ttl": entries["ttl"],
+                "exact_hits": self._exact_hits,
+                "perceptual_hits": self._perceptual_hits,
+                "misses": self._misses,
+                "evictions": entries["evictions"],
+                "expirations": entries["expirations"],
+                "hit_rate": round(hits / lookups, 3) if lookups else 0.0,
+            }
+
+
+detection_cache = DetectionCache()
@@ -0,0 +1,161 @@
+"""
+Per-class confidence thresholds and aggregation of raw YOLO boxes into
+per-ingredient detections.
+
+Boxes of a result are filtered and grouped with array operations on the whole
+(boxes, confidences, classes) tensor instead of one Python call per box. Each
+ingredient keeps its highest confidence, its instance count and its boxes.
+"""
+import json
+import logging
+import os
+from functools import lru_cache
+from typing import Any, Dict, List, NamedTuple, Tuple, Union
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Threshold for classes without their own entry in YOLO_CLASS_THRESHOLDS_FILE
+YOLO_CONFIDENCE_THRESHOLD = float(os.environ.get("YOLO_CONFIDENCE_THRESHOLD", "0.25"))
+# JSON file with per-class thresholds, keyed by model class name:
+#   {"default": 0.25, "classes": {"garlic": 0.4, "chili": 0.15}}
+YOLO_CLASS_THRESHOLDS_FILE = os.environ.get("YOLO_CLASS_THRESHOLDS_FILE", "")
+
+Box = Tuple[float, float, float, float]  # x0, y0, x1, y1 as fractions of the image size
+
+
+class ClassDetection(NamedTuple):
+    """Kept boxes of one model class."""
+
+    name: str  # raw model class name
+    confidence: float  # highest box confidence
+    count: int
+    boxes: List[Box]
+
+
+class IngredientDetection(NamedTuple):
+    """Detections of one normalized ingredient (possibly merged from several model classes)."""
+
+    name: str
+    confidence: float
+    count: int
+    boxes: List[Box]
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "confidence": self.confidence,
+            "count": self.count,
+            "boxes": [list(box) for box in self.boxes],
+        }
+
+
+@lru_cache(maxsize=1)
+def load_class_thresholds() -> Tuple[float, Dict[str, float]]:
+    """
+    Read the per-class threshold file once.
+
+    Returns:
+        The default threshold and a {lowercase class name: threshold} mapping.
+    """
+    if not YOLO_CLASS_THRESHOLDS_FILE:
+        return YOLO_CONFIDENCE_THRESHOLD, {}
+    try:
+        with open(YOLO_CLASS_THRESHOLDS_FILE) as f:
+            config = json.load(f)
+        default = float(config.get("default", YOLO_CONFIDENCE_THRESHOLD))
+        classes = {str(name).strip().lower(): float(value) for name, value in config.get("classes", {}).items()}
+    except (OSError, ValueError, AttributeError, TypeError) as e:
+        logger.error(f"Could not load class thresholds from {YOLO_CLASS_THRESHOLDS_FILE}, using defaults: {e}")
+        return YOLO_CONFIDENCE_THRESHOLD, {}
+    logger.info(f"Loaded {len(classes)} per-class confidence thresholds (default {default})")
+    return default, classes
+
+
+def min_confidence_threshold() -> float:
+    """Lowest configured threshold; the model has to run at this confidence."""
+    default, classes = load_class_thresholds()
+    return min([default, *classes.values()])
+
+
+@lru_cache(maxsize=4)
+def _threshold_vector(names: Tuple[Tuple[int, str], ...]) -> np.ndarray:
+    """Threshold of every class id of a model, indexable by the class column of a result."""
+    default, classes = load_class_thresholds()
+    thresholds = np.full(max((idx for idx, _ in names), default=-1) + 1, default, dtype=np.float32)
+    for idx, name in names:
+        thresholds[idx] = classes.get(name.strip().lower(), default)
+    return thresholds
+
+
+def group_detections(
+    xyxy: np.ndarray,
+    confidences: np.ndarray,
+    classes: np.ndarray,
+    names: Dict[int, str],
+    image_size: Tuple[int, int],
+) -> List[ClassDetection]:
+    """
+    Apply the per-class thresholds to all boxes at once and group the kept boxes by class.
+
+    Args:
+        xyxy: (n, 4) boxes in pixels of an image of `image_size` (w, h).
+        confidences: (n,) box confidences.
+        classes: (n,) class ids.
+        names: Model class names by id.
+
+    Returns:
+        One entry per detected class, highest confidence first.
+    """
+    classes = classes.astype(np.int64)
+    keep = confidences >= _threshold_vector(tuple(sorted(names.items())))[classes]
+    if not keep.any():
+        return []
+
+    width, height = image_size
+    boxes = np.round(xyxy[keep].astype(np.float64) / np.array([width, height, width, height]), 4)
+    confidences, classes = confidences[keep], classes[keep]
+
+    # Sort by class, then by confidence (descending) within a class
+    order = np.lexsort((-confidences, classes))
+    boxes, confidences, classes = boxes[order], confidences[order], classes[order]
+    class_ids, starts, counts = np.unique(classes, return_index=True, return_counts=True)
+
+    grouped = []
+    for cls_idx, start, count, class_boxes in zip(class_ids, starts, counts, np.split(boxes, starts[1:])):
+        name = names.get(int(cls_idx), "").strip()
+        if name:
+            grouped.append(ClassDetection(
+                name,
+                round(float(confidences[start]), 4),
+                int(count),
+                [tuple(box) for box in class_boxes.tolist()],
+            ))
+    grouped.sort(key=lambda detection: -detection.confidence)
+    return grouped
+
+
+def merge_by_ingredient(
+    detections: List[Union[ClassDetection, IngredientDetection]],
+    normalized: Dict[str, str],
+) -> List[IngredientDetection]:
+    """
+    Merge detections whose names normalize to the same ingredient.
+    `normalized` maps their names to ingredient names (see normalize_ingredients_mapping).
+    """
+    merged: Dict[str, IngredientDetection] = {}
+    for detection in detections:
+        name = normalized.get(detection.name) or detection.name.lower()
+        key = name.lower()
+        current = merged.get(key)
+        if current is None:
+            merged[key] = IngredientDetection(name, detection.confidence, detection.count, list(detection.boxes))
+        else:
+            merged[key] = IngredientDetection(
+                current.name,
+                max(current.confidence, detection.confidence),
+                current.count + detection.count,
+                current.boxes + detection.boxes,
+            )
+    return list(merged.values())
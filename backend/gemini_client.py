@@ -1,28 +1,291 @@
+import asyncio
 import json
 import logging
 import os
 import time
 import hashlib
-from typing import Any, Dict, List, Optional
+from functools import partial
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Tuple
 
-import requests
+import httpx
 
-logger = logging.getLogger(__name__)
+from rate_limiter import estimate_tokens, get_rate_limiter
+from recipe_cache import RECIPE_CACHE_MEMORY_SIZE, build_recipe_cache
+from recipe_schema import (
+    GEMINI_STRUCTURED_OUTPUT,
+    RECIPE_SCHEMA,
+    RECIPES_RESPONSE_SCHEMA,
+    SUMMARIES_RESPONSE_SCHEMA,
+    Recipe,
+    decode_recipe,
+    decode_recipes,
+    decode_summaries,
+    generation_config,
+    is_valid_recipe,
+    is_valid_summary,
+    loads,
+)
+from recipe_similarity import SimilarRecipeIndex, adapt_recipes
+from recipe_stream import RecipeStreamParser
+from single_flight import SingleFlight
 
-# Rate limiting: track last API call time to prevent rapid successive calls
-_last_api_call_time = 0.0
-_min_time_between_calls = 1.0  # Minimum 1 second between API calls
+logger = logging.getLogger(__name__)
 
 # Recipe cache to reduce API calls for same ingredient combinations
-_recipe_cache: Dict[str, tuple] = {}  # key: md5 hash, value: (recipes, timestamp)
-_cache_ttl = 3600  # Cache for 1 hour
-_max_cache_size = 100  # Maximum cache entries
+# (per-process memory tier in front of an on-disk tier shared by all workers)
+_recipe_cache = build_recipe_cache()
+# Ingredient sets of cached answers, for serving a close-enough set (same dietary preferences)
+_similar_recipes = SimilarRecipeIndex()
+# Concurrent requests for the same ingredient set share one Gemini call
+_recipe_flights = SingleFlight()
+# Two-phase generation: each summarized recipe's context (summary, ingredients, dietary
+# preferences) under its ID, and its generated details under "<ID>:full"
+_recipe_details = build_recipe_cache(table="recipe_details", memory_size=RECIPE_CACHE_MEMORY_SIZE * 5)
 
 GEMINI_API_KEY_ENV = "GEMINI_API_KEY"
 GEMINI_API_URL = (
     "https://generativelanguage.googleapis.com/v1beta/models/"
     "gemini-2.5-flash:generateContent"
 )
+# Same model, answer streamed as server-sent events
+GEMINI_STREAM_API_URL = (
+    "https://generativelanguage.googleapis.com/v1beta/models/"
+    "gemini-2.5-flash:streamGenerateContent?alt=sse"
+)
+
+# HTTP connection pool shared by every Gemini call of the process (keep-alive, HTTP/2 if h2 is installed)
+GEMINI_HTTP2 = os.environ.get("GEMINI_HTTP2", "true").lower() == "true"
+GEMINI_MAX_CONNECTIONS = int(os.environ.get("GEMINI_MAX_CONNECTIONS", "20"))
+GEMINI_MAX_KEEPALIVE = int(os.environ.get("GEMINI_MAX_KEEPALIVE", "10"))
+GEMINI_KEEPALIVE_EXPIRY = float(os.environ.get("GEMINI_KEEPALIVE_EXPIRY", "30"))
+GEMINI_CONNECT_TIMEOUT = float(os.environ.get("GEMINI_CONNECT_TIMEOUT", "10"))
+GEMINI_READ_TIMEOUT = float(os.environ.get("GEMINI_READ_TIMEOUT", "90"))
+# Seconds to wait for a free connection when the pool is exhausted
+GEMINI_POOL_TIMEOUT = float(os.environ.get("GEMINI_POOL_TIMEOUT", "10"))
+
+# Retry logic for 429 errors and timeouts with exponential backoff
+_max_retries = 3
+_base_wait_time = 2.0
+
+# The async client is bound to the event loop it was created on
+_async_client: Optional[httpx.AsyncClient] = None
+_async_client_loop: Optional[asyncio.AbstractEventLoop] = None
+_sync_client: Optional[httpx.Client] = None
+_default_client: Optional["GeminiClient"] = None
+
+
+def _http2_available() -> bool:
+    if not GEMINI_HTTP2:
+        return False
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def _client_options() -> Dict[str, Any]:
+    return {
+        "http2": _http2_available(),
+        "limits": httpx.Limits(
+            max_connections=GEMINI_MAX_CONNECTIONS,
+            max_keepalive_connections=GEMINI_MAX_KEEPALIVE,
+            keepalive_expiry=GEMINI_KEEPALIVE_EXPIRY,
+        ),
+        "timeout": httpx.Timeout(
+            connect=GEMINI_CONNECT_TIMEOUT,
+            read=GEMINI_READ_TIMEOUT,
+            write=GEMINI_CONNECT_TIMEOUT,
+            pool=GEMINI_POOL_TIMEOUT,
+        ),
+    }
+
+
+def get_async_http_client() -> httpx.AsyncClient:
+    """Process-wide pooled async HTTP client for the running event loop."""
+    global _async_client, _async_client_loop
+    loop = asyncio.get_running_loop()
+    if _async_client is None or _async_client_loop is not loop or _async_client.is_closed:
+        _async_client = httpx.AsyncClient(**_client_options())
+        _async_client_loop = loop
+        logger.info(f"Created Gemini HTTP connection pool (http2={_http2_available()})")
+    return _async_client
+
+
+def get_sync_http_client() -> httpx.Client:
+    """Process-wide pooled HTTP client for blocking callers (scripts, worker threads)."""
+    global _sync_client
+    if _sync_client is None or _sync_client.is_closed:
+        _sync_client = httpx.Client(**_client_options())
+    return _sync_client
+
+
+async def close_http_clients() -> None:
+    """Close the pooled connections (on application shutdown)."""
+    global _async_client, _sync_client
+    if _async_client is not None and _async_client_loop is asyncio.get_running_loop():
+        await _async_client.aclose()
+    _async_client = None
+    if _sync_client is not None:
+        _sync_client.close()
+        _sync_client = None
+
+
+def get_client() -> "GeminiClient":
+    """
+    Shared GeminiClient of the process.
+
+    Raises:
+        RuntimeError: If the API key is not set.
+    """
+    global _default_client
+    if _default_client is None:
+        _default_client = GeminiClient()
+    return _default_client
+
+
+def _retry_delay(exc: Exception, attempt: int) -> Optional[float]:
+    """Backoff before retrying a failed call, or None if the error is final."""
+    if attempt >= _max_retries:
+        return None
+    timed_out = isinstance(exc, httpx.TimeoutException)
+    rate_limited = isinstance(exc, httpx.HTTPStatusError) and exc.response.status_code == 429
+    if not (timed_out or rate_limited):
+        return None
+    wait_time = _base_wait_time * (2 ** attempt)
+    reason = "Request timed out" if timed_out else "Rate limited"
+    logger.warning(f"{reason}, retrying in {wait_time}s (attempt {attempt + 1}/{_max_retries + 1})")
+    return wait_time
+
+
+def _final_error(exc: Exception) -> RuntimeError:
+    if isinstance(exc, httpx.TimeoutException):
+        return RuntimeError(
+            "Request to Gemini API timed out after multiple attempts. "
+            "Please try again with fewer ingredients or try again later."
+        )
+    if isinstance(exc, httpx.HTTPStatusError) and exc.response.status_code == 429:
+        return RuntimeError("Gemini API rate limit exceeded after multiple attempts.")
+    return RuntimeError(f"Failed to call Gemini API: {exc}")
+
+
+def _extract_text(data: Dict[str, Any]) -> str:
+    """Extract the first text part of a generateContent response."""
+    candidates = data.get("candidates") or []
+    if not candidates:
+        raise RuntimeError("No candidates returned from Gemini API.")
+    content = candidates[0].get("content") or {}
+    parts = content.get("parts") or []
+    if not parts:
+        raise RuntimeError("No content parts returned from Gemini API.")
+    text = parts[0].get("text") or ""
+    if not text:
+        raise RuntimeError("Empty text returned from Gemini API.")
+    return text
+
+
+def get_recipe_cache_stats() -> Dict[str, Any]:
+    """Hit/miss counters and sizes of the recipe cache tiers."""
+    return _recipe_cache.stats()
+
+
+def get_recipe_similarity_stats() -> Dict[str, Any]:
+    """Near-match lookups after exact cache misses (exact hits are in get_recipe_cache_stats)."""
+    return _similar_recipes.stats()
+
+
+def get_recipe_details_stats() -> Dict[str, Any]:
+    """Sizes of the cache holding summary contexts and generated recipe details."""
+    return _recipe_details.stats()
+
+
+def _variant(summary: bool) -> str:
+    return "summary" if summary else ""
+
+
+def _summary_id(recipe: Dict[str, Any], scope: str) -> str:
+    """
+    ID of a summary generated for the request whose cache key is `scope`. The
+    details context is keyed by it, so the same title and description from
+    another ingredient set or dietary list gets a context of its own.
+    """
+    return hashlib.md5(f"{scope}-{recipe['title']}-{recipe['description']}".encode("utf-8")).hexdigest()
+
+
+def _remember_summaries(recipes: List[Dict[str, Any]], ingredients: List[str],
+                        dietary_preferences: Optional[List[str]]) -> None:
+    """Keep what generating each summary's details needs. Blocking (writes the disk tier)."""
+    for recipe in recipes:
+        _recipe_details.set(recipe["id"], [{
+            "recipe": recipe,
+            "ingredients": ingredients,
+            "dietary": dietary_preferences or [],
+        }])
+
+
+def _remember_recipes(cache_key: str, ingredients: List[str], dietary_preferences: Optional[List[str]],
+                      recipes: List[Dict[str, Any]], summary: bool = False) -> None:
+    """Cache an answer and index its ingredient set for near matches. Blocking (writes the disk tier)."""
+    _recipe_cache.set(cache_key, recipes)
+    _similar_recipes.add(cache_key, ingredients, dietary_preferences, _variant(summary))
+    if summary:
+        _remember_summaries(recipes, ingredients, dietary_preferences)
+
+
+def _near_match(ingredients: List[str], dietary_preferences: Optional[List[str]],
+                summary: bool = False) -> Optional[List[Dict[str, Any]]]:
+    """
+    Cached recipes of the most similar ingredient set, adapted to `ingredients`,
+    or None. Blocking (may read the disk tier).
+    """
+    if not _similar_recipes.enabled:
+        return None
+    for similarity, key in _similar_recipes.candidates(ingredients, dietary_preferences, _variant(summary)):
+        recipes = _recipe_cache.get(key)
+        if recipes is None:
+            # Expired or evicted from the cache
+            _similar_recipes.discard(key)
+            continue
+        _similar_recipes.record_lookup(similarity)
+        logger.info(f"Near cache hit for key: {key[:8]}... (similarity {similarity:.2f})")
+        return adapt_recipes(recipes, ingredients)
+    _similar_recipes.record_lookup(None)
+    return None
+
+
+def _stored_recipes(cache_key: str, ingredients: List[str], dietary_preferences: Optional[List[str]],
+                    summary: bool = False) -> Optional[List[Dict[str, Any]]]:
+    """
+    Recipes for `cache_key` from the disk tier, else a near match, else None.
+    Blocking; callers check the memory tier first.
+    """
+    cached = _recipe_cache.get_disk(cache_key)
+    if cached is not None:
+        logger.info(f"Disk cache hit for key: {cache_key[:8]}...")
+        _similar_recipes.add(cache_key, ingredients, dietary_preferences, _variant(summary))
+        return cached
+    return _near_match(ingredients, dietary_preferences, summary)
+
+
+def get_single_flight_stats() -> Dict[str, int]:
+    """Upstream recipe generations vs. requests that joined one already in flight."""
+    return _recipe_flights.stats()
+
+
+def _chunk_text(data: Dict[str, Any]) -> str:
+    """Text of one streamed chunk (may be empty, e.g. for the final usage-only chunk)."""
+    candidates = data.get("candidates") or []
+    if not candidates:
+        return ""
+    parts = (candidates[0].get("content") or {}).get("parts") or []
+    return "".join(part.get("text") or "" for part in parts)
+
+
+def _usage_tokens(data: Dict[str, Any]) -> Optional[int]:
+    """Total tokens the API reports for a call, if any."""
+    usage = data.get("usageMetadata") or {}
+    total = usage.get("totalTokenCount")
+    return int(total) if isinstance(total, (int, float)) else None
 
 
 class GeminiClient:
@@ -35,6 +298,7 @@ class GeminiClient:
     - Improved JSON parsing with markdown cleanup
     - LRU-style cache eviction
     - Enhanced error handling
+    - One keep-alive connection pool per process, awaited from async endpoints
     """
 
     def __init__(self, api_key: Optional[str] = None) -> None:
@@ -44,23 +308,12 @@ class GeminiClient:
                 f"Gemini API key not set. Please export {GEMINI_API_KEY_ENV} environment variable."
             )
 
-    def _call_gemini(self, prompt: str) -> str:
+    def _request_kwargs(self, prompt: str, schema: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
         """
-        Call Gemini API using the official REST format.
+        Request in the official REST format.
         Uses x-goog-api-key header as per: https://ai.google.dev/gemini-api/docs/quickstart
+        With a `schema` (and GEMINI_STRUCTURED_OUTPUT), the answer is JSON following it.
         """
-        global _last_api_call_time
-        
-        # Rate limiting: ensure minimum time between API calls
-        current_time = time.time()
-        time_since_last_call = current_time - _last_api_call_time
-        if _last_api_call_time > 0 and time_since_last_call < _min_time_between_calls:
-            wait_time = _min_time_between_calls - time_since_last_call
-            time.sleep(wait_time)
-        
-        call_start_time = time.time()
-        _last_api_call_time = call_start_time
-        
         payload = {
             "contents": [
                 {
@@ -72,109 +325,121 @@ class GeminiClient:
                 }
             ]
         }
+        if schema is not None and GEMINI_STRUCTURED_OUTPUT:
+            payload["generationConfig"] = generation_config(schema)
         headers = {
             "x-goog-api-key": self.api_key,
             "Content-Type": "application/json",
         }
-        
-        # Retry logic for 429 errors with exponential backoff
-        max_retries = 3
-        base_wait_time = 2.0
-        
-        for attempt in range(max_retries + 1):
+        return {"json": payload, "headers": headers}
+
+    async def _call_gemini_async(self, prompt: str, schema: Optional[Dict[str, Any]] = None) -> str:
+        """Call the Gemini API over the shared async connection pool."""
+        # Rate limiting: wait for RPM/TPM budget without blocking the event loop
+        limiter = get_rate_limiter()
+        estimated_tokens = estimate_tokens(prompt)
+        await limiter.acquire(estimated_tokens)
+        client = get_async_http_client()
+        request = self._request_kwargs(prompt, schema)
+
+        for attempt in range(_max_retries + 1):
             try:
-                resp = requests.post(
-                    GEMINI_API_URL, json=payload, headers=headers, timeout=90
-                )
-                
-                # Handle 429 rate limit errors with retry
-                if resp.status_code == 429:
-                    if attempt < max_retries:
-                        wait_time = base_wait_time * (2 ** attempt)
-                        logger.warning(f"Rate limited, retrying in {wait_time}s (attempt {attempt + 1}/{max_retries + 1})")
-                        time.sleep(wait_time)
-                        _last_api_call_time = time.time()
-                        continue
-                    else:
-                        resp.raise_for_status()
-                
+                resp = await client.post(GEMINI_API_URL, **request)
                 resp.raise_for_status()
-                data = resp.json()
+                data = loads(resp.content)
                 break
-                
-            except requests.exceptions.Timeout as e:
-                if attempt < max_retries:
-                    wait_time = base_wait_time * (2 ** attempt)
-                    logger.warning(f"Request timed out, retrying in {wait_time}s (attempt {attempt + 1}/{max_retries + 1})")
-                    time.sleep(wait_time)
-                    _last_api_call_time = time.time()
-                    continue
-                else:
-                    raise RuntimeError(
-                        "Request to Gemini API timed out after multiple attempts. "
-                        "Please try again with fewer ingredients or try again later."
-                    ) from e
-            except requests.exceptions.HTTPError as e:
-                if hasattr(e, 'response') and e.response is not None and e.response.status_code == 429:
-                    if attempt < max_retries:
-                        wait_time = base_wait_time * (2 ** attempt)
-                        time.sleep(wait_time)
-                        _last_api_call_time = time.time()
-                        continue
-                raise RuntimeError(f"Failed to call Gemini API: {e}") from e
-            except requests.exceptions.RequestException as e:
-                raise RuntimeError(f"Failed to call Gemini API: {e}") from e
-        
-        # Extract first text part
-        candidates = data.get("candidates") or []
-        if not candidates:
-            raise RuntimeError("No candidates returned from Gemini API.")
-        content = candidates[0].get("content") or {}
-        parts = content.get("parts") or []
-        if not parts:
-            raise RuntimeError("No content parts returned from Gemini API.")
-        text = parts[0].get("text") or ""
-        if not text:
-            raise RuntimeError("Empty text returned from Gemini API.")
-        return text
+            except (httpx.TimeoutException, httpx.HTTPStatusError) as e:
+                wait_time = _retry_delay(e, attempt)
+                if wait_time is None:
+                    raise _final_error(e) from e
+                await asyncio.sleep(wait_time)
+                # The tokens are reserved once per call; a retry is one more request
+                await limiter.acquire()
+            except (httpx.HTTPError, ValueError) as e:
+                raise _final_error(e) from e
 
-    def generate_recipes(
-        self, 
-        ingredients: List[str], 
-        dietary_preferences: Optional[List[str]] = None
-    ) -> List[Dict[str, Any]]:
-        """
-        Ask Gemini to propose recipes given a list of ingredients.
+        await limiter.record_usage_async(estimated_tokens, _usage_tokens(data))
+        return _extract_text(data)
 
-        Improvements:
-        - Uses MD5 hash for stable cache keys
-        - Better JSON parsing with markdown cleanup
-        - Stable MD5-based recipe IDs (consistent across restarts)
-        - LRU cache eviction strategy
+    async def _stream_gemini_async(self, prompt: str, schema: Optional[Dict[str, Any]] = None) -> AsyncIterator[str]:
+        """Stream the answer text of a Gemini call chunk by chunk (server-sent events)."""
+        limiter = get_rate_limiter()
+        estimated_tokens = estimate_tokens(prompt)
+        await limiter.acquire(estimated_tokens)
+        client = get_async_http_client()
+        request = self._request_kwargs(prompt, schema)
+        usage: Optional[int] = None
+        streamed = False
 
-        Returns:
-            List of recipe dictionaries with stable IDs and consistent structure
-        """
-        if not ingredients:
-            return []
-        
+        for attempt in range(_max_retries + 1):
+            try:
+                async with client.stream("POST", GEMINI_STREAM_API_URL, **request) as resp:
+                    resp.raise_for_status()
+                    async for line in resp.aiter_lines():
+                        if not line.startswith("data:"):
+                            continue
+                        data = loads(line[len("data:"):])
+                        usage = _usage_tokens(data) or usage
+                        text = _chunk_text(data)
+                        if text:
+                            streamed = True
+                            yield text
+                break
+            except (httpx.TimeoutException, httpx.HTTPStatusError) as e:
+                # Once text was passed on, a retry would repeat it
+                wait_time = None if streamed else _retry_delay(e, attempt)
+                if wait_time is None:
+                    raise _final_error(e) from e
+                await asyncio.sleep(wait_time)
+                # The tokens are reserved once per call; a retry is one more request
+                await limiter.acquire()
+            except (httpx.HTTPError, ValueError) as e:
+                raise _final_error(e) from e
+
+        await limiter.record_usage_async(estimated_tokens, usage)
+
+    def _call_gemini(self, prompt: str, schema: Optional[Dict[str, Any]] = None) -> str:
+        """Blocking variant of _call_gemini_async, over the shared sync connection pool."""
+        limiter = get_rate_limiter()
+        estimated_tokens = estimate_tokens(prompt)
+        limiter.acquire_sync(estimated_tokens)
+        client = get_sync_http_client()
+        request = self._request_kwargs(prompt, schema)
+
+        for attempt in range(_max_retries + 1):
+            try:
+                resp = client.post(GEMINI_API_URL, **request)
+                resp.raise_for_status()
+                data = loads(resp.content)
+                break
+            except (httpx.TimeoutException, httpx.HTTPStatusError) as e:
+                wait_time = _retry_delay(e, attempt)
+                if wait_time is None:
+                    raise _final_error(e) from e
+                time.sleep(wait_time)
+                # The tokens are reserved once per call; a retry is one more request
+                limiter.acquire_sync()
+            except (httpx.HTTPError, ValueError) as e:
+                raise _final_error(e) from e
+
+        limiter.record_usage(estimated_tokens, _usage_tokens(data))
+        return _extract_text(data)
+
+    @staticmethod
+    def recipe_cache_key(ingredients: List[str], dietary_preferences: Optional[List[str]] = None,
+                         summary: bool = False) -> str:
+        """Stable MD5 key of an ingredient list and dietary preferences (order-insensitive)."""
         # IMPROVEMENT: Use MD5 hash for stable cache keys
         clean_ingredients = sorted([ing.lower().strip() for ing in ingredients])
         clean_dietary = sorted([dp.lower().strip() for dp in dietary_preferences]) if dietary_preferences else []
         
         cache_key_string = ",".join(clean_ingredients + clean_dietary)
-        cache_key = hashlib.md5(cache_key_string.encode()).hexdigest()
-        
-        current_time = time.time()
-        if cache_key in _recipe_cache:
-            cached_recipes, cache_time = _recipe_cache[cache_key]
-            if current_time - cache_time < _cache_ttl:
-                logger.info(f"Cache hit for key: {cache_key[:8]}...")
-                return cached_recipes
-            else:
-                # Cache expired, remove it
-                del _recipe_cache[cache_key]
+        if summary:
+            cache_key_string += "|summary"
+        return hashlib.md5(cache_key_string.encode()).hexdigest()
 
+    @staticmethod
+    def _recipe_prompt(ingredients: List[str], dietary_preferences: Optional[List[str]]) -> str:
         ingredients_str = ", ".join(ingredients)
         dietary_constraint = ""
         if dietary_preferences:
@@ -222,10 +487,153 @@ Important:
 - servings is a number
 - difficulty must be exactly "Easy", "Medium", or "Hard"
 - Make sure usedIngredients and missingIngredients are consistent with the given list and the rules above.
+"""
+        return prompt
+
+    @staticmethod
+    def _summary_prompt(ingredients: List[str], dietary_preferences: Optional[List[str]]) -> str:
+        ingredients_str = ", ".join(ingredients)
+        dietary_constraint = ""
+        if dietary_preferences:
+            dietary_str = ", ".join(dietary_preferences)
+            dietary_constraint = f"\n- Must be {dietary_str}."
+
+        return f"""
+You are a cooking assistant. The user has the following ingredients available:
+{ingredients_str}
+
+Generate up to 5 recipe ideas that:
+- Use at least 60–70% of the listed ingredients.
+- Have at most 5 missing ingredients beyond what the user has.
+- Are realistic and cookable.{dietary_constraint}
+
+Only summarize each recipe; the quantities and steps are asked for separately.
+Return your answer as strict JSON with this structure (and nothing else, no prose):
+{{
+  "recipes": [
+    {{
+      "title": "string",
+      "description": "short description of the dish",
+      "prepTime": 15,
+      "cookTime": 30,
+      "totalTime": 45,
+      "servings": 4,
+      "difficulty": "Medium",
+      "usedIngredients": ["ingredient name", "another ingredient"],
+      "missingIngredients": ["ingredient name"],
+      "coverageScore": 0.0
+    }}
+  ]
+}}
+
+Important:
+- usedIngredients and missingIngredients are arrays of ingredient names only (no quantities)
+- prepTime, cookTime, and totalTime are in minutes
+- servings is a number
+- difficulty must be exactly "Easy", "Medium", or "Hard"
+- Make sure usedIngredients and missingIngredients are consistent with the given list and the rules above.
 """
 
-        text = self._call_gemini(prompt)
+    @staticmethod
+    def _details_prompt(summary: Dict[str, Any], ingredients: List[str],
+                        dietary_preferences: Optional[List[str]]) -> str:
+        ingredients_str = ", ".join(ingredients)
+        title, description = summary["title"], summary["description"]
+        used_str = ", ".join(item["name"] for item in summary["usedIngredients"])
+        missing_str = ", ".join(item["name"] for item in summary["missedIngredients"]) or "none"
+        dietary_constraint = ""
+        if dietary_preferences:
+            dietary_constraint = f"\nThe recipe must be {', '.join(dietary_preferences)}."
+
+        return f"""
+You are a cooking assistant. The user has the following ingredients available:
+{ingredients_str}
 
+Write the full recipe for "{title}": {description}
+It uses: {used_str}
+Missing ingredients the user has to buy: {missing_str}{dietary_constraint}
+
+Return your answer as strict JSON with this structure (and nothing else, no prose):
+{{
+  "title": "{title}",
+  "description": "short description of the dish",
+  "prepTime": 15,
+  "cookTime": 30,
+  "totalTime": 45,
+  "servings": 4,
+  "difficulty": "Medium",
+  "usedIngredients": [{{"name": "ingredient name", "quantity": "2 cups"}}],
+  "missingIngredients": [{{"name": "ingredient name", "quantity": "1 cup"}}],
+  "coverageScore": 0.0,
+  "steps": ["step 1", "step 2", "..."]
+}}
+
+Important:
+- Keep the title, the ingredients and the times of the summary above
+- Quantities should be in common cooking units (cups, tbsp, tsp, oz, lb, etc.)
+- difficulty must be exactly "Easy", "Medium", or "Hard"
+"""
+
+    @staticmethod
+    def _parse_recipes(text: str, ingredients: List[str]) -> List[Dict[str, Any]]:
+        """Parse Gemini's JSON answer into normalized recipe dictionaries."""
+        # Structured output: one decode and a compiled schema check, no per-field conversions
+        recipes = decode_recipes(text)
+        if recipes is not None:
+            return [recipe.as_dict() for recipe in recipes]
+        return GeminiClient._parse_recipes_tolerant(text, ingredients)
+
+    @staticmethod
+    def _parse_summaries(text: str, ingredients: List[str], scope: str) -> List[Dict[str, Any]]:
+        """
+        Parse a summary answer for the request with cache key `scope`; the
+        recipes are marked so clients fetch their details.
+        """
+        summaries = decode_summaries(text)
+        if summaries is not None:
+            recipes = [summary.as_dict() for summary in summaries]
+        else:
+            recipes = GeminiClient._parse_recipes_tolerant(text, ingredients)
+        for recipe in recipes:
+            recipe["id"] = _summary_id(recipe, scope)
+            recipe["summary"] = True
+        return recipes
+
+    @staticmethod
+    def _recipes_request(
+        ingredients: List[str], dietary_preferences: Optional[List[str]], summary: bool
+    ) -> Tuple[str, Dict[str, Any], Callable[[str, List[str]], List[Dict[str, Any]]]]:
+        """Prompt, response schema and parser of a recipe generation (summaries or full recipes)."""
+        if summary:
+            prompt = GeminiClient._summary_prompt(ingredients, dietary_preferences)
+            scope = GeminiClient.recipe_cache_key(ingredients, dietary_preferences, summary)
+            return prompt, SUMMARIES_RESPONSE_SCHEMA, partial(GeminiClient._parse_summaries, scope=scope)
+        prompt = GeminiClient._recipe_prompt(ingredients, dietary_preferences)
+        return prompt, RECIPES_RESPONSE_SCHEMA, GeminiClient._parse_recipes
+
+    @staticmethod
+    def _parse_recipe_details(text: str, summary: Dict[str, Any], ingredients: List[str]) -> Dict[str, Any]:
+        """
+        Parse a single-recipe details answer. The summary's ID, title,
+        description and coverage are kept, so the recipe the user opened doesn't change.
+        """
+        recipe = decode_recipe(text)
+        if recipe is not None:
+            details = recipe.as_dict()
+        else:
+            data = GeminiClient._load_json_tolerant(text)
+            if isinstance(data, dict) and isinstance(data.get("recipes"), list) and data["recipes"]:
+                data = data["recipes"][0]
+            if not isinstance(data, dict):
+                raise RuntimeError("Failed to parse JSON response from Gemini API.")
+            details = GeminiClient._normalize_recipe(data, ingredients)
+        for key in ("id", "title", "description", "coverageScore"):
+            details[key] = summary[key]
+        return details
+
+    @staticmethod
+    def _load_json_tolerant(text: str) -> Any:
+        """Decode a free-form answer (markdown fences, prose around the JSON)."""
         # IMPROVEMENT: Better JSON parsing with markdown cleanup
         try:
             # Clean markdown syntax that Gemini often adds
@@ -243,111 +651,298 @@ Important:
                     raise RuntimeError("Failed to parse JSON response from Gemini API.")
             else:
                 raise RuntimeError("Failed to parse JSON response from Gemini API.")
+        return data
 
-        recipes = data.get("recipes") or []
-        normalized: List[Dict[str, Any]] = []
-        
-        for r in recipes:
-            title = r.get("title") or "Untitled recipe"
-            description = r.get("description") or ""
-            
-            # Handle ingredients - support both old format (array of strings) and new format (array of objects)
-            used_raw = r.get("usedIngredients") or []
-            missing_raw = r.get("missingIngredients") or []
-            
-            # Normalize ingredients to object format
-            used = []
-            for u in used_raw:
-                if isinstance(u, dict):
-                    used.append({"name": u.get("name", ""), "quantity": u.get("quantity", "")})
-                else:
-                    used.append({"name": str(u), "quantity": ""})
-            
-            missing = []
-            for m in missing_raw:
-                if isinstance(m, dict):
-                    missing.append({"name": m.get("name", ""), "quantity": m.get("quantity", "")})
-                else:
-                    missing.append({"name": str(m), "quantity": ""})
-            
-            # Extract metadata with defaults
-            prep_time = r.get("prepTime")
-            cook_time = r.get("cookTime")
-            total_time = r.get("totalTime")
-            servings = r.get("servings")
-            difficulty = r.get("difficulty", "Medium")
-            
-            # Validate and normalize metadata
-            try:
-                prep_time = int(prep_time) if prep_time is not None else None
-            except (TypeError, ValueError):
-                prep_time = None
-            
-            try:
-                cook_time = int(cook_time) if cook_time is not None else None
-            except (TypeError, ValueError):
-                cook_time = None
-            
-            # Calculate total time if not provided
-            if total_time is None and prep_time is not None and cook_time is not None:
-                total_time = prep_time + cook_time
-            try:
-                total_time = int(total_time) if total_time is not None else None
-            except (TypeError, ValueError):
-                total_time = None
-            
-            try:
-                servings = int(servings) if servings is not None else None
-            except (TypeError, ValueError):
-                servings = None
-            
-            # Validate difficulty
-            if difficulty not in ["Easy", "Medium", "Hard"]:
-                difficulty = "Medium"
-            
-            coverage = r.get("coverageScore")
-            try:
-                coverage_val = float(coverage)
-            except (TypeError, ValueError):
-                # Recompute coverage if not provided/invalid
-                used_names = {u.get("name", "").lower() if isinstance(u, dict) else str(u).lower() for u in used_raw}
-                total = len(ingredients) or 1
-                hits = sum(1 for ing in ingredients if ing.lower() in used_names)
-                coverage_val = hits / total
-
-            # IMPROVEMENT: Stable MD5-based ID generation (consistent across restarts)
-            # Python's hash() changes every restart, MD5 is stable
-            id_source = f"{title}-{description}".encode('utf-8')
-            stable_id = hashlib.md5(id_source).hexdigest()
-
-            normalized.append(
-                {
-                    "id": stable_id,  # Stable string ID
-                    "title": title,
-                    "description": description,
-                    "prepTime": prep_time,
-                    "cookTime": cook_time,
-                    "totalTime": total_time,
-                    "servings": servings,
-                    "difficulty": difficulty,
-                    "usedIngredients": used,
-                    "missedIngredients": missing,
-                    "usedIngredientCount": len(used),
-                    "missedIngredientCount": len(missing),
-                    "coverageScore": coverage_val,
-                    "steps": r.get("steps") or [],
-                }
-            )
+    @staticmethod
+    def _parse_recipes_tolerant(text: str, ingredients: List[str]) -> List[Dict[str, Any]]:
+        """Parse a free-form answer (markdown fences, prose, loosely typed fields)."""
+        data = GeminiClient._load_json_tolerant(text)
+        recipes = (data.get("recipes") if isinstance(data, dict) else None) or []
+        return [GeminiClient._normalize_recipe(r, ingredients) for r in recipes]
+
+    @staticmethod
+    def _normalize_streamed_recipe(r: Dict[str, Any], ingredients: List[str]) -> Dict[str, Any]:
+        if is_valid_recipe(r):
+            return Recipe.from_valid(r).as_dict()
+        return GeminiClient._normalize_recipe(r, ingredients)
 
-        # IMPROVEMENT: LRU-style cache eviction
-        # Cache the results
-        _recipe_cache[cache_key] = (normalized, current_time)
+    @staticmethod
+    def _normalize_streamed_summary(r: Dict[str, Any], ingredients: List[str], scope: str) -> Dict[str, Any]:
+        """Like _parse_summaries, for one summary object of a streamed answer."""
+        if is_valid_summary(r):
+            recipe = Recipe.from_valid_summary(r).as_dict()
+        else:
+            recipe = GeminiClient._normalize_recipe(r, ingredients)
+        recipe["id"] = _summary_id(recipe, scope)
+        recipe["summary"] = True
+        return recipe
+
+    @staticmethod
+    def _normalize_recipe(r: Dict[str, Any], ingredients: List[str]) -> Dict[str, Any]:
+        """Normalize one recipe object from Gemini's answer (defaults, types, stable ID)."""
+        title = r.get("title") or "Untitled recipe"
+        description = r.get("description") or ""
+        
+        # Handle ingredients - support both old format (array of strings) and new format (array of objects)
+        used_raw = r.get("usedIngredients") or []
+        missing_raw = r.get("missingIngredients") or []
         
-        # Limit cache size with smarter eviction
-        if len(_recipe_cache) > _max_cache_size:
-            # Remove oldest entry by timestamp
-            oldest_key = min(_recipe_cache.keys(), key=lambda k: _recipe_cache[k][1])
-            del _recipe_cache[oldest_key]
-            logger.info(f"Cache evicted oldest entry, size: {len(_recipe_cache)}")
+        # Normalize ingredients to object format
+        used = []
+        for u in used_raw:
+            if isinstance(u, dict):
+                used.append({"name": u.get("name", ""), "quantity": u.get("quantity", "")})
+            else:
+                used.append({"name": str(u), "quantity": ""})
         
-        return normalized
\ No newline at end of file
+        missing = []
+        for m in missing_raw:
+            if isinstance(m, dict):
+                missing.append({"name": m.get("name", ""), "quantity": m.get("quantity", "")})
+            else:
+                missing.append({"name": str(m), "quantity": ""})
+        
+        # Extract metadata with defaults
+        prep_time = r.get("prepTime")
+        cook_time = r.get("cookTime")
+        total_time = r.get("totalTime")
+        servings = r.get("servings")
+        difficulty = r.get("difficulty", "Medium")
+        
+        # Validate and normalize metadata
+        try:
+            prep_time = int(prep_time) if prep_time is not None else None
+        except (TypeError, ValueError):
+            prep_time = None
+        
+        try:
+            cook_time = int(cook_time) if cook_time is not None else None
+        except (TypeError, ValueError):
+            cook_time = None
+        
+        # Calculate total time if not provided
+        if total_time is None and prep_time is not None and cook_time is not None:
+            total_time = prep_time + cook_time
+        try:
+            total_time = int(total_time) if total_time is not None else None
+        except (TypeError, ValueError):
+            total_time = None
+        
+        try:
+            servings = int(servings) if servings is not None else None
+        except (TypeError, ValueError):
+            servings = None
+        
+        # Validate difficulty
+        if difficulty not in ["Easy", "Medium", "Hard"]:
+            difficulty = "Medium"
+        
+        coverage = r.get("coverageScore")
+        try:
+            coverage_val = float(coverage)
+        except (TypeError, ValueError):
+            # Recompute coverage if not provided/invalid
+            used_names = {u.get("name", "").lower() if isinstance(u, dict) else str(u).lower() for u in used_raw}
+            total = len(ingredients) or 1
+            hits = sum(1 for ing in ingredients if ing.lower() in used_names)
+            coverage_val = hits / total
+
+        # IMPROVEMENT: Stable MD5-based ID generation (consistent across restarts)
+        # Python's hash() changes every restart, MD5 is stable
+        id_source = f"{title}-{description}".encode('utf-8')
+        stable_id = hashlib.md5(id_source).hexdigest()
+
+        return {
+            "id": stable_id,  # Stable string ID
+            "title": title,
+            "description": description,
+            "prepTime": prep_time,
+            "cookTime": cook_time,
+            "totalTime": total_time,
+            "servings": servings,
+            "difficulty": difficulty,
+            "usedIngredients": used,
+            "missedIngredients": missing,
+            "usedIngredientCount": len(used),
+            "missedIngredientCount": len(missing),
+            "coverageScore": coverage_val,
+            "steps": r.get("steps") or [],
+        }
+
+    async def generate_recipes_async(
+        self, 
+        ingredients: List[str], 
+        dietary_preferences: Optional[List[str]] = None,
+        summary: bool = False
+    ) -> List[Dict[str, Any]]:
+        """
+        Ask Gemini to propose recipes given a list of ingredients.
+
+        Improvements:
+        - Uses MD5 hash for stable cache keys
+        - Structured (schema-constrained) JSON answers, decoded in one pass
+        - Stable MD5-based recipe IDs (consistent across restarts)
+        - LRU memory cache in front of a persistent cache shared by all workers
+        - Near-match cache hits for a similar ingredient set (same dietary preferences)
+        - Awaits the shared connection pool instead of blocking the event loop
+        - With `summary`, only summaries (no quantities or steps); the details of
+          a recipe come from generate_recipe_details_async when it is opened
+
+        Returns:
+            List of recipe dictionaries with stable IDs and consistent structure
+        """
+        if not ingredients:
+            return []
+        cache_key = self.recipe_cache_key(ingredients, dietary_preferences, summary)
+        cached = _recipe_cache.get_memory(cache_key)
+        if cached is not None:
+            logger.info(f"Cache hit for key: {cache_key[:8]}...")
+            return cached
+
+        async def generate() -> List[Dict[str, Any]]:
+            # The disk tier is read and written off the event loop
+            cached = await asyncio.to_thread(_stored_recipes, cache_key, ingredients, dietary_preferences, summary)
+            if cached is not None:
+                return cached
+            prompt, schema, parse = self._recipes_request(ingredients, dietary_preferences, summary)
+            normalized = parse(await self._call_gemini_async(prompt, schema), ingredients)
+            await asyncio.to_thread(
+                _remember_recipes, cache_key, ingredients, dietary_preferences, normalized, summary
+            )
+            return normalized
+
+        return await _recipe_flights.run(cache_key, generate)
+
+    async def generate_recipe_details_async(self, recipe_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Full recipe (quantities and steps) for a summary returned by
+        generate_recipes_async(summary=True), generated on first request and
+        cached, as {"recipe": ..., "dietary": [...]} with the dietary
+        preferences the summary was generated for. None if the ID isn't a
+        known summary (or its context expired).
+        """
+        details_key = f"{recipe_id}:full"
+        cached = _recipe_details.get_memory(details_key)
+        if cached is not None:
+            return cached[0]
+
+        async def generate() -> Optional[Dict[str, Any]]:
+            cached = await asyncio.to_thread(_recipe_details.get_disk, details_key)
+            if cached is not None:
+                return cached[0]
+            context = await asyncio.to_thread(_recipe_details.get, recipe_id)
+            if context is None:
+                return None
+            summary = context[0]["recipe"]
+            ingredients = context[0]["ingredients"]
+            dietary = context[0]["dietary"]
+            prompt = self._details_prompt(summary, ingredients, dietary)
+            text = await self._call_gemini_async(prompt, RECIPE_SCHEMA)
+            details = {
+                "recipe": self._parse_recipe_details(text, summary, ingredients),
+                "dietary": dietary,
+            }
+            await asyncio.to_thread(_recipe_details.set, details_key, [details])
+            return details
+
+        return await _recipe_flights.run(details_key, generate)
+
+    async def generate_recipes_stream(
+        self,
+        ingredients: List[str],
+        dietary_preferences: Optional[List[str]] = None,
+        summary: bool = False
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Like generate_recipes_async, but yields each normalized recipe (or, with
+        `summary`, each summary) as soon as Gemini has finished writing it. Cached
+        results are yielded right away, and a completely streamed answer is
+        cached like a regular one.
+
+        The Gemini stream is a single-flight call under the same key as
+        generate_recipes_async: a request for the same ingredients made while
+        it runs (streamed or not) waits for its result instead of calling
+        Gemini again, and a stream started while a call is in flight yields
+        that call's recipes once it completes.
+        """
+        if not ingredients:
+            return
+        cache_key = self.recipe_cache_key(ingredients, dietary_preferences, summary)
+        cached = _recipe_cache.get_memory(cache_key)
+        if cached is not None:
+            logger.info(f"Cache hit for key: {cache_key[:8]}...")
+        else:
+            cached = await asyncio.to_thread(_stored_recipes, cache_key, ingredients, dietary_preferences, summary)
+        if cached is not None:
+            for recipe in cached:
+                yield recipe
+            return
+
+        streamed: "asyncio.Queue[Optional[Dict[str, Any]]]" = asyncio.Queue()
+
+        async def generate() -> List[Dict[str, Any]]:
+            # Runs as its own task: a disconnected client doesn't stop it for the others
+            try:
+                parser = RecipeStreamParser()
+                normalized: List[Dict[str, Any]] = []
+                prompt, schema, parse = self._recipes_request(ingredients, dietary_preferences, summary)
+                if summary:
+                    normalize_one = partial(self._normalize_streamed_summary, scope=cache_key)
+                else:
+                    normalize_one = self._normalize_streamed_recipe
+                async for chunk in self._stream_gemini_async(prompt, schema):
+                    for raw in parser.feed(chunk):
+                        recipe = normalize_one(raw, ingredients)
+                        normalized.append(recipe)
+                        streamed.put_nowait(recipe)
+
+                if not parser.recipes_seen:
+                    # Unexpected answer shape; fall back to parsing it as a whole
+                    normalized = parse(parser.text, ingredients)
+                    for recipe in normalized:
+                        streamed.put_nowait(recipe)
+                await asyncio.to_thread(
+                    _remember_recipes, cache_key, ingredients, dietary_preferences, normalized, summary
+                )
+                return normalized
+            finally:
+                streamed.put_nowait(None)
+
+        flight, leader = _recipe_flights.start(cache_key, generate)
+        if not leader:
+            for recipe in await asyncio.shield(flight):
+                yield recipe
+            return
+        while True:
+            recipe = await streamed.get()
+            if recipe is None:
+                break
+            yield recipe
+        # Raises the stream's error, if it failed
+        await asyncio.shield(flight)
+
+    def generate_recipes(
+        self, 
+        ingredients: List[str], 
+        dietary_preferences: Optional[List[str]] = None,
+        summary: bool = False
+    ) -> List[Dict[str, Any]]:
+        """Blocking variant of generate_recipes_async (for scripts and worker threads)."""
+        if not ingredients:
+            return []
+        cache_key = self.recipe_cache_key(ingredients, dietary_preferences, summary)
+        cached = _recipe_cache.get_memory(cache_key)
+        if cached is not None:
+            logger.info(f"Cache hit for key: {cache_key[:8]}...")
+            return cached
+
+        def generate() -> List[Dict[str, Any]]:
+            cached = _stored_recipes(cache_key, ingredients, dietary_preferences, summary)
+            if cached is not None:
+                return cached
+            prompt, schema, parse = self._recipes_request(ingredients, dietary_preferences, summary)
+            normalized = parse(self._call_gemini(prompt, schema), ingredients)
+            _remember_recipes(cache_key, ingredients, dietary_preferences, normalized, summary)
+            return normalized
+
+        return _recipe_flights.run_sync(cache_key, generate)
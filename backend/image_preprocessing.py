@@ -0,0 +1,163 @@
+"""
+Image preparation for inference.
+
+Uploaded photos are decoded straight to (roughly) the inference size using the
+decoder's reduced-scale mode (JPEG draft mode, 1/2, 1/4 or 1/8 scale), EXIF
+orientation is applied, and the result is resampled at most once. The pixels are
+then handed to the model as one contiguous uint8 BGR array, which ultralytics
+uses as-is instead of converting a PIL image itself.
+
+Every pixel buffer allocated or copied on the way is recorded, so the cost per
+request can be checked under /metrics.
+"""
+import io
+import threading
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, Optional, Tuple
+
+import numpy as np
+from PIL import ExifTags, Image, ImageOps, UnidentifiedImageError
+
+
+class ImageDecodeError(ValueError):
+    """Raised when uploaded bytes cannot be turned into an RGB image."""
+
+
+class CopyLedger:
+    """Pixel buffers allocated and bytes copied while preparing one request."""
+
+    __slots__ = ("allocations", "copies", "bytes_copied")
+
+    def __init__(self) -> None:
+        self.allocations = 0
+        self.copies = 0
+        self.bytes_copied = 0
+
+    def as_dict(self) -> Dict[str, int]:
+        return {"allocations": self.allocations, "copies": self.copies, "bytes_copied": self.bytes_copied}
+
+
+_current = threading.local()
+_totals_lock = threading.Lock()
+_totals = {"requests": 0, "allocations": 0, "copies": 0, "bytes_copied": 0}
+
+
+def _record(nbytes: int, copy: bool = True) -> None:
+    """Record a new pixel buffer of `nbytes` (a copy unless it is fresh decoder output)."""
+    ledger: Optional[CopyLedger] = getattr(_current, "ledger", None)
+    if ledger is None:
+        return
+    ledger.allocations += 1
+    if copy:
+        ledger.copies += 1
+        ledger.bytes_copied += nbytes
+
+
+def _image_nbytes(img: Image.Image) -> int:
+    return img.width * img.height * len(img.getbands())
+
+
+@contextmanager
+def track_copies() -> Iterator[CopyLedger]:
+    """Count pixel buffer allocations/copies made by this thread while preparing one request."""
+    ledger = CopyLedger()
+    _current.ledger = ledger
+    try:
+        yield ledger
+    finally:
+        _current.ledger = None
+        with _totals_lock:
+            _totals["requests"] += 1
+            _totals["allocations"] += ledger.allocations
+            _totals["copies"] += ledger.copies
+            _totals["bytes_copied"] += ledger.bytes_copied
+
+
+def get_copy_stats() -> Dict[str, Any]:
+    """Average pixel allocations and bytes copied per request (in this process)."""
+    with _totals_lock:
+        requests = _totals["requests"]
+        stats: Dict[str, Any] = dict(_totals)
+    for key in ("allocations", "copies", "bytes_copied"):
+        stats[f"avg_{key}"] = round(stats[key] / requests, 2) if requests else 0.0
+    return stats
+
+
+def _target_size(size: Tuple[int, int], max_size: int) -> Tuple[int, int]:
+    """Scale (w, h) so the longest side is at most max_size, preserving aspect ratio."""
+    w, h = size
+    scale = min(max_size / float(w), max_size / float(h), 1.0)
+    return max(1, int(w * scale)), max(1, int(h * scale))
+
+
+def peek_image_size(contents: bytes) -> Tuple[int, int]:
+    """
+    Read the stored (w, h) of an image from its header without decoding the pixels.
+
+    Raises:
+        UnidentifiedImageError: If the bytes are not a recognised image format.
+    """
+    with Image.open(io.BytesIO(contents)) as img:
+        return img.size
+
+
+def prepare_image(contents: bytes, max_size: int) -> Image.Image:
+    """
+    Decode uploaded image bytes into an upright RGB image whose longest side is at most max_size.
+
+    Raises:
+        UnidentifiedImageError: If the bytes are not a recognised image format.
+        ImageDecodeError: If the image could not be decoded for any other reason.
+    """
+    try:
+        img = Image.open(io.BytesIO(contents))
+
+        # Reduced-scale decode: the decoder picks the smallest 1/2^n scale that still
+        # covers the target size, so the one resample below never upsamples.
+        # (The target is computed on the stored orientation, before EXIF rotation.)
+        if max(img.size) > max_size:
+            img.draft("RGB", _target_size(img.size, max_size))
+
+        img.load()
+        _record(_image_nbytes(img), copy=False)
+
+        if img.getexif().get(ExifTags.Base.Orientation, 1) != 1:
+            ImageOps.exif_transpose(img, in_place=True)
+            _record(_image_nbytes(img))
+        if img.mode != "RGB":
+            img = img.convert("RGB")
+            _record(_image_nbytes(img))
+
+        target = _target_size(img.size, max_size)
+        if target != img.size:
+            img = img.resize(target, Image.Resampling.LANCZOS)
+            _record(_image_nbytes(img))
+        return img
+    except UnidentifiedImageError:
+        raise
+    except Exception as e:
+        raise ImageDecodeError(str(e)) from e
+
+
+def to_model_array(img: Image.Image) -> np.ndarray:
+    """
+    Convert an RGB image into the contiguous uint8 HWC BGR array ultralytics expects.
+
+    Pillow packs the pixels straight into BGR order (one copy) and numpy wraps that
+    buffer without copying. Passing a PIL image instead makes ultralytics copy it
+    twice (to numpy, then RGB->BGR). The array is read-only; the model never writes to it.
+    """
+    if img.mode != "RGB":
+        img = img.convert("RGB")
+        _record(_image_nbytes(img))
+    data = img.tobytes("raw", "BGR")
+    _record(len(data))
+    return np.frombuffer(data, dtype=np.uint8).reshape(img.height, img.width, 3)
+
+
+def crop_array(pixels: np.ndarray, box: Tuple[int, int, int, int]) -> np.ndarray:
+    """Copy the (x0, y0, x1, y1) region of an HWC array into its own contiguous array."""
+    x0, y0, x1, y1 = box
+    crop = np.ascontiguousarray(pixels[y0:y1, x0:x1])
+    _record(crop.nbytes)
+    return crop
@@ -0,0 +1,127 @@
+"""
+Cheap pre-screen of uploaded photos before running YOLO.
+
+Blurry, nearly black/white or blank images (e.g. a photo of the inside of a
+pocket) can't produce detections, but still cost a full model pass. The
+pre-screen works on a small grayscale downsample of the decoded image and
+computes:
+
+- blur: variance of the Laplacian (low = no edges in focus)
+- exposure: mean brightness and the share of crushed shadows / blown highlights
+- entropy: Shannon entropy of the brightness histogram (low = nearly uniform image)
+
+Only images that clearly fail are rejected; the thresholds are deliberately conservative.
+"""
+import os
+import threading
+from typing import Any, Dict, NamedTuple, Optional, Union
+
+import cv2
+import numpy as np
+from PIL import Image
+
+IMAGE_PRESCREEN = os.environ.get("IMAGE_PRESCREEN", "true").lower() == "true"
+# Longest side of the downsample the metrics are computed on
+PRESCREEN_SIZE = int(os.environ.get("PRESCREEN_SIZE", "256"))
+PRESCREEN_MIN_SHARPNESS = float(os.environ.get("PRESCREEN_MIN_SHARPNESS", "8"))
+PRESCREEN_MIN_ENTROPY = float(os.environ.get("PRESCREEN_MIN_ENTROPY", "2.5"))
+PRESCREEN_MIN_BRIGHTNESS = float(os.environ.get("PRESCREEN_MIN_BRIGHTNESS", "20"))
+PRESCREEN_MAX_BRIGHTNESS = float(os.environ.get("PRESCREEN_MAX_BRIGHTNESS", "240"))
+# Share of pixels allowed to be crushed to black / blown to white
+PRESCREEN_MAX_CLIPPED = float(os.environ.get("PRESCREEN_MAX_CLIPPED", "0.95"))
+
+REJECTION_MESSAGES = {
+    "too_dark": "The photo is too dark to detect ingredients. Please turn on a light or use the flash and try again.",
+    "too_bright": "The photo is overexposed, so no ingredients can be detected. Please avoid direct light and try again.",
+    "blank": "The image looks blank. Please take a photo of your ingredients and try again.",
+    "blurry": "The photo is too blurry to detect ingredients. Please hold the camera steady and try again.",
+}
+
+
+class ImageRejected(ValueError):
+    """Raised when an upload fails the pre-screen and is not worth running through the model."""
+
+    def __init__(self, reason: str, metrics: Optional[Dict[str, float]] = None) -> None:
+        super().__init__(REJECTION_MESSAGES[reason])
+        self.reason = reason
+        self.message = REJECTION_MESSAGES[reason]
+        self.metrics = metrics or {}
+
+    def __reduce__(self) -> Any:  # keeps the exception picklable across the process executor
+        return (ImageRejected, (self.reason, self.metrics))
+
+
+class PrescreenResult(NamedTuple):
+    reason: Optional[str]  # None if the image passed
+    metrics: Dict[str, float]
+
+
+_stats_lock = threading.Lock()
+_stats: Dict[str, int] = {"screened": 0, "rejected": 0, **{reason: 0 for reason in REJECTION_MESSAGES}}
+
+
+def _small_gray(img: Union[Image.Image, np.ndarray], size: int) -> np.ndarray:
+    """Grayscale downsample (longest side `size`) of a PIL image or a BGR array."""
+    if isinstance(img, Image.Image):
+        gray = img.convert("L")
+        gray.thumbnail((size, size), Image.Resampling.BILINEAR)
+        return np.asarray(gray)
+    height, width = img.shape[:2]
+    scale = min(size / float(max(width, height)), 1.0)
+    small = cv2.resize(img, (max(1, int(width * scale)), max(1, int(height * scale))), interpolation=cv2.INTER_AREA)
+    return cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+
+
+def image_metrics(img: Union[Image.Image, np.ndarray], size: int = PRESCREEN_SIZE) -> Dict[str, float]:
+    """Blur, exposure and entropy metrics of an image, computed on a small downsample."""
+    gray = _small_gray(img, size)
+    histogram = np.bincount(gray.ravel(), minlength=256).astype(np.float64)
+    probabilities = histogram[histogram > 0] / gray.size
+    return {
+        "sharpness": round(float(cv2.Laplacian(gray, cv2.CV_64F).var()), 2),
+        "brightness": round(float(gray.mean()), 2),
+        "dark_fraction": round(float(histogram[:16].sum() / gray.size), 4),
+        "bright_fraction": round(float(histogram[240:].sum() / gray.size), 4),
+        "entropy": round(float(-(probabilities * np.log2(probabilities)).sum()), 3),
+    }
+
+
+def prescreen(img: Union[Image.Image, np.ndarray]) -> PrescreenResult:
+    """Decide whether an image is worth running through the model."""
+    metrics = image_metrics(img)
+    reason = None
+    if metrics["brightness"] < PRESCREEN_MIN_BRIGHTNESS or metrics["dark_fraction"] > PRESCREEN_MAX_CLIPPED:
+        reason = "too_dark"
+    elif metrics["brightness"] > PRESCREEN_MAX_BRIGHTNESS or metrics["bright_fraction"] > PRESCREEN_MAX_CLIPPED:
+        reason = "too_bright"
+    elif metrics["entropy"] < PRESCREEN_MIN_ENTROPY:
+        reason = "blank"
+    elif metrics["sharpness"] < PRESCREEN_MIN_SHARPNESS:
+        reason = "blurry"
+
+    with _stats_lock:
+        _stats["screened"] += 1
+        if reason:
+            _stats["rejected"] += 1
+            _stats[reason] += 1
+    return PrescreenResult(reason, metrics)
+
+
+def check_image(img: Union[Image.Image, np.ndarray]) -> None:
+    """
+    Run the pre-screen when enabled (IMAGE_PRESCREEN).
+
+    Raises:
+        ImageRejected: If the image clearly can't produce detections.
+    """
+    if not IMAGE_PRESCREEN:
+        return
+    result = prescreen(img)
+    if result.reason:
+        raise ImageRejected(result.reason, result.metrics)
+
+
+def get_prescreen_stats() -> Dict[str, Any]:
+    """Screened/rejected counts per rejection reason (in this process)."""
+    with _stats_lock:
+        return {"enabled": IMAGE_PRESCREEN, **_stats}
@@ -0,0 +1,196 @@
+"""
+Micro-batching scheduler for YOLO inference.
+
+Images submitted by concurrent requests are queued and flushed to the model
+as a single batched call once either the batch is full or the oldest queued
+image has waited longer than the configured deadline. Each caller gets back
+its own result through a Future.
+"""
+import logging
+import os
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Micro-batching of concurrent inference calls (disabled by default). In thread mode each
+# inference job waits for its batch on an executor worker, so a batch only grows as large
+# as the number of workers: INFERENCE_MAX_WORKERS then defaults to YOLO_BATCH_MAX_SIZE.
+# In process mode each worker batches only the images of its own job.
+ENABLE_YOLO_BATCHING = os.environ.get("ENABLE_YOLO_BATCHING", "false").lower() == "true"
+YOLO_BATCH_MAX_SIZE = int(os.environ.get("YOLO_BATCH_MAX_SIZE", "8"))
+YOLO_BATCH_MAX_WAIT_MS = float(os.environ.get("YOLO_BATCH_MAX_WAIT_MS", "10"))
+
+
+class _PendingItem:
+    """A single queued image waiting to be batched."""
+
+    __slots__ = ("image", "group", "kwargs", "future", "enqueued_at")
+
+    def __init__(self, image: Any, kwargs: Dict[str, Any]) -> None:
+        self.image = image
+        self.kwargs = kwargs
+        # Images can only share a batch when they use the same model arguments
+        self.group: Tuple = tuple(sorted(kwargs.items()))
+        self.future: Future = Future()
+        self.enqueued_at = time.perf_counter()
+
+
+class MicroBatcher:
+    """
+    Collects images from concurrent callers and runs them through
+    `predict_fn(images, **kwargs)` in batches.
+
+    Args:
+        predict_fn: Callable that takes a list of images plus keyword arguments
+            and returns one result per image, in order.
+        max_batch_size: Flush as soon as this many images are queued.
+        max_wait_ms: Flush once the oldest queued image has waited this long.
+    """
+
+    def __init__(
+        self,
+        predict_fn: Callable[..., List[Any]],
+        max_batch_size: int = 8,
+        max_wait_ms: float = 10.0,
+    ) -> None:
+        self.predict_fn = predict_fn
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max(0.0, float(max_wait_ms)) / 1000.0
+
+        self._queue: "queue.Queue[_PendingItem]" = queue.Queue()
+        self._carry: Deque[_PendingItem] = deque()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="yolo-batcher", daemon=True)
+
+        # Stats
+        self._stats_lock = threading.Lock()
+        self._batches = 0
+        self._images = 0
+        self._errors = 0
+        self._batch_sizes: Dict[int, int] = {}
+        self._recent_waits: Deque[float] = deque(maxlen=1000)
+        self._max_wait_seen = 0.0
+        self._total_predict_time = 0.0
+
+        self._thread.start()
+        logger.info(
+            f"YOLO micro-batcher started (max_batch_size={self.max_batch_size}, "
+            f"max_wait_ms={self.max_wait * 1000:.1f})"
+        )
+
+    def submit(self, image: Any, **kwargs: Any) -> Future:
+        """Queue an image for inference and return a Future for its result."""
+        if self._stop.is_set():
+            raise RuntimeError("Micro-batcher has been shut down.")
+        item = _PendingItem(image, kwargs)
+        self._queue.put(item)
+        return item.future
+
+    def predict(self, image: Any, timeout: Optional[float] = None, **kwargs: Any) -> Any:
+        """Queue an image and block until its result is available."""
+        return self.submit(image, **kwargs).result(timeout=timeout)
+
+    def shutdown(self) -> None:
+        """Stop the worker thread after the current batch finishes."""
+        self._stop.set()
+        self._thread.join(timeout=5)
+
+    def _next_item(self, timeout: Optional[float]) -> Optional[_PendingItem]:
+        if self._carry:
+            return self._carry.popleft()
+        try:
+            return self._queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def _next_nowait(self) -> Optional[_PendingItem]:
+        if self._carry:
+            return self._carry.popleft()
+        try:
+            return self._queue.get_nowait()
+        except queue.Empty:
+            return None
+
+    def _collect_batch(self) -> List[_PendingItem]:
+        """Block for the first item, then gather compatible items until full or deadline."""
+        first = self._next_item(timeout=0.5)
+        if first is None:
+            return []
+
+        batch = [first]
+        deadline = first.enqueued_at + self.max_wait
+        skipped: List[_PendingItem] = []
+
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            # Past the deadline, still take whatever is already queued
+            # (e.g. images that arrived while the previous batch was running)
+            item = self._next_item(timeout=remaining) if remaining > 0 else self._next_nowait()
+            if item is None:
+                break
+            if item.group == first.group:
+                batch.append(item)
+            else:
+                skipped.append(item)
+
+        # Items with different model arguments go to the front of the next batch
+        self._carry.extendleft(reversed(skipped))
+        return batch
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            batch = self._collect_batch()
+            if not batch:
+                continue
+
+            started = time.perf_counter()
+            waits = [started - item.enqueued_at for item in batch]
+            try:
+                results = self.predict_fn([item.image for item in batch], **batch[0].kwargs)
+                if len(results) != len(batch):
+                    raise RuntimeError(
+                        f"Batched inference returned {len(results)} results for {len(batch)} images."
+                    )
+                for item, result in zip(batch, results):
+                    item.future.set_result(result)
+            except Exception as e:  # noqa: BLE001
+                logger.error(f"Batched YOLO inference failed for {len(batch)} images: {e}")
+                with self._stats_lock:
+                    self._errors += 1
+                for item in batch:
+                    if not item.future.done():
+                        item.future.set_exception(e)
+
+            elapsed = time.perf_counter() - started
+            with self._stats_lock:
+                self._batches += 1
+                self._images += len(batch)
+                self._batch_sizes[len(batch)] = self._batch_sizes.get(len(batch), 0) + 1
+                self._recent_waits.extend(waits)
+                self._max_wait_seen = max(self._max_wait_seen, max(waits))
+                self._total_predict_time += elapsed
+
+    def stats(self) -> Dict[str, Any]:
+        """Return batch-size and queue-wait statistics for tuning."""
+        with self._stats_lock:
+            waits = sorted(self._recent_waits)
+            batches = self._batches
+            return {
+                "max_batch_size": self.max_batch_size,
+                "max_wait_ms": round(self.max_wait * 1000, 2),
+                "queued": self._queue.qsize() + len(self._carry),
+                "batches": batches,
+                "images": self._images,
+                "errors": self._errors,
+                "avg_batch_size": round(self._images / batches, 2) if batches else 0.0,
+                "batch_size_histogram": dict(sorted(self._batch_sizes.items())),
+                "avg_queue_wait_ms": round(sum(waits) / len(waits) * 1000, 2) if waits else 0.0,
+                "p95_queue_wait_ms": round(waits[int(0.95 * (len(waits) - 1))] * 1000, 2) if waits else 0.0,
+                "max_queue_wait_ms": round(self._max_wait_seen * 1000, 2),
+                "avg_batch_inference_ms": round(self._total_predict_time / batches * 1000, 2) if batches else 0.0,
+            }
@@ -0,0 +1,188 @@
+"""
+Bounded executor that keeps image decoding and YOLO inference off the asyncio event loop.
+
+CPU-heavy work is submitted to a dedicated thread or process pool and awaited,
+so a slow inference no longer stalls other requests (including /health) on the
+same uvicorn worker. The number of in-flight jobs is bounded; once the limit is
+reached new jobs are rejected instead of piling up behind the model.
+"""
+import asyncio
+import logging
+import os
+import threading
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from functools import lru_cache, partial
+from typing import Any, Callable, Dict, Optional, Set
+
+from inference_batcher import ENABLE_YOLO_BATCHING, YOLO_BATCH_MAX_SIZE
+
+logger = logging.getLogger(__name__)
+
+# "thread" shares one model between workers; "process" loads one model per worker
+INFERENCE_EXECUTOR = os.environ.get("INFERENCE_EXECUTOR", "thread").lower()
+# With micro-batching in thread mode, each job holds its worker while it waits for its
+# batch, so batches never grow past the worker count: enough workers to fill one by default
+_DEFAULT_MAX_WORKERS = YOLO_BATCH_MAX_SIZE if ENABLE_YOLO_BATCHING and INFERENCE_EXECUTOR == "thread" else 2
+INFERENCE_MAX_WORKERS = max(1, int(os.environ.get("INFERENCE_MAX_WORKERS", str(_DEFAULT_MAX_WORKERS))))
+# Jobs allowed to wait for a free worker before new ones are rejected
+INFERENCE_MAX_QUEUE = max(0, int(os.environ.get("INFERENCE_MAX_QUEUE", "16")))
+
+
+def _default_torch_threads() -> int:
+    """Split the available cores between workers so torch doesn't oversubscribe them."""
+    cpus = os.cpu_count() or 1
+    if INFERENCE_EXECUTOR == "process":
+        return max(1, cpus // INFERENCE_MAX_WORKERS)
+    return cpus
+
+
+TORCH_NUM_THREADS = int(os.environ.get("TORCH_NUM_THREADS", "0")) or _default_torch_threads()
+
+
+class InferenceQueueFull(RuntimeError):
+    """Raised when the inference executor already has the maximum number of jobs queued."""
+
+
+def _init_worker(num_threads: int, preload: bool = False) -> None:
+    """Limit torch intra-op threads in each worker and optionally load + warm up its model."""
+    try:
+        import torch
+
+        torch.set_num_threads(num_threads)
+    except Exception as e:  # noqa: BLE001
+        logger.warning(f"Could not set torch thread count: {e}")
+
+    if preload:
+        # Each worker process holds its own model copy
+        from model import warmup_model
+
+        try:
+            warmup_model()
+        except Exception as e:  # noqa: BLE001
+            logger.error(f"Model preload failed in inference worker: {e}")
+
+
+def _preload_enabled() -> bool:
+    return os.environ.get("PRELOAD_MODEL", "true").lower() == "true"
+
+
+_state_lock = threading.Lock()
+_in_flight = 0
+_completed = 0
+_failed = 0
+_rejected = 0
+
+
+@lru_cache(maxsize=1)
+def get_executor() -> Executor:
+    """
+    Lazily create the inference executor configured by INFERENCE_EXECUTOR.
+    """
+    if INFERENCE_EXECUTOR == "process":
+        executor: Executor = ProcessPoolExecutor(
+            max_workers=INFERENCE_MAX_WORKERS,
+            initializer=_init_worker,
+            initargs=(TORCH_NUM_THREADS, _preload_enabled()),
+        )
+    else:
+        if INFERENCE_EXECUTOR != "thread":
+            logger.warning(f"Unknown INFERENCE_EXECUTOR '{INFERENCE_EXECUTOR}', using thread pool")
+        _init_worker(TORCH_NUM_THREADS)
+        executor = ThreadPoolExecutor(
+            max_workers=INFERENCE_MAX_WORKERS,
+            thread_name_prefix="inference",
+        )
+    logger.info(
+        f"Inference executor started: {INFERENCE_EXECUTOR} pool, "
+        f"{INFERENCE_MAX_WORKERS} workers, max queue {INFERENCE_MAX_QUEUE}, "
+        f"{TORCH_NUM_THREADS} torch threads"
+    )
+    return executor
+
+
+async def run_inference(fn: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+    """
+    Run `fn(*args, **kwargs)` on the inference executor and await the result.
+
+    Raises:
+        InferenceQueueFull: If the executor already has the maximum number of jobs queued.
+    """
+    global _in_flight, _completed, _failed, _rejected
+
+    with _state_lock:
+        if _in_flight >= INFERENCE_MAX_WORKERS + INFERENCE_MAX_QUEUE:
+            _rejected += 1
+            raise InferenceQueueFull(
+                f"Inference queue is full ({_in_flight} jobs in flight)."
+            )
+        _in_flight += 1
+
+    loop = asyncio.get_running_loop()
+    try:
+        result = await loop.run_in_executor(get_executor(), partial(fn, *args, **kwargs))
+        with _state_lock:
+            _completed += 1
+        return result
+    except Exception:
+        with _state_lock:
+            _failed += 1
+        raise
+    finally:
+        with _state_lock:
+            _in_flight -= 1
+
+
+def _worker_pid() -> int:
+    # Workers only take jobs once their initializer (model load + warmup) has finished
+    return os.getpid()
+
+
+async def warm_all_workers(timeout: float = 300.0) -> int:
+    """
+    In process mode, wait until every worker process is running and has been through
+    its initializer (so none of them loads its model on a user's request).
+    Returns the number of warm workers.
+    """
+    if INFERENCE_EXECUTOR != "process":
+        return 1
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    pids: Set[int] = set()
+    while len(pids) < INFERENCE_MAX_WORKERS:
+        if loop.time() > deadline:
+            raise RuntimeError(
+                f"Only {len(pids)} of {INFERENCE_MAX_WORKERS} inference workers started in {timeout:.0f}s."
+            )
+        # Processes are created on demand: jobs submitted together start one each
+        jobs = [run_inference(_worker_pid) for _ in range(INFERENCE_MAX_WORKERS)]
+        pids.update(await asyncio.gather(*jobs))
+    return len(pids)
+
+
+def get_queue_depth() -> int:
+    """Number of jobs waiting for a free worker."""
+    with _state_lock:
+        return max(0, _in_flight - INFERENCE_MAX_WORKERS)
+
+
+def get_executor_stats() -> Dict[str, Any]:
+    """Get queue depth and throughput counters of the inference executor."""
+    with _state_lock:
+        return {
+            "type": INFERENCE_EXECUTOR,
+            "max_workers": INFERENCE_MAX_WORKERS,
+            "max_queue": INFERENCE_MAX_QUEUE,
+            "torch_threads": TORCH_NUM_THREADS,
+            "in_flight": _in_flight,
+            "queue_depth": max(0, _in_flight - INFERENCE_MAX_WORKERS),
+            "completed": _completed,
+            "failed": _failed,
+            "rejected": _rejected,
+        }
+
+
+def shutdown_executor(wait: Optional[bool] = True) -> None:
+    """Shut down the inference executor if it was started."""
+    if get_executor.cache_info().currsize:
+        get_executor().shutdown(wait=bool(wait))
+        get_executor.cache_clear()
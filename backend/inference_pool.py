@@ -0,0 +1,567 @@
+"""
+Multi-process inference server with shared-memory image transport.
+
+One pool process supervises several inference workers. Each worker loads its own
+model and is pinned to a share of the CPU threads. Web workers (any number of
+uvicorn processes) connect to the pool over a local socket and send decoded
+images through shared memory instead of pickling the pixels, so a host runs one
+set of model copies no matter how many web workers it has.
+
+The supervisor restarts crashed workers (with a backoff, and gives up on one
+that keeps crashing before it gets ready, which marks the pool unhealthy),
+answers health checks and keeps per-worker throughput metrics.
+
+Run the pool (from the backend directory):
+    INFERENCE_POOL_AUTHKEY=$(python -c 'import secrets; print(secrets.token_hex(32))') \
+        python inference_pool.py --workers 4 --threads-per-worker 2
+
+and point the API at it with INFERENCE_POOL_ADDRESS and the same
+INFERENCE_POOL_AUTHKEY (start.sh generates a fresh key on every boot).
+Messages on the socket are pickled, so there is no default key: the pool
+refuses to start without one, and its socket lives in a directory only
+its owner can enter (mode 0700), with the socket itself at 0600.
+"""
+import argparse
+import itertools
+import logging
+import multiprocessing
+import os
+import signal
+import stat
+import sys
+import tempfile
+import threading
+import time
+from multiprocessing import AuthenticationError, shared_memory
+from multiprocessing.connection import Client, Connection, Listener, wait
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+INFERENCE_POOL_ADDRESS = os.environ.get("INFERENCE_POOL_ADDRESS", "")
+# Shared secret between the API and the pool; required (see start.sh)
+INFERENCE_POOL_AUTHKEY = os.environ.get("INFERENCE_POOL_AUTHKEY", "").encode()
+INFERENCE_POOL_WORKERS = int(os.environ.get("INFERENCE_POOL_WORKERS", "2"))
+INFERENCE_POOL_TIMEOUT = float(os.environ.get("INFERENCE_POOL_TIMEOUT", "30"))
+# Restarts in a row of a worker that crashes before it gets ready (e.g. its model fails
+# to load) after which it is given up and the pool reported unhealthy
+INFERENCE_POOL_MAX_RESTARTS = int(os.environ.get("INFERENCE_POOL_MAX_RESTARTS", "5"))
+DEFAULT_POOL_ADDRESS = os.path.join(
+    tempfile.gettempdir(), f"recipe-inference-{os.getuid()}", "pool.sock"
+)
+
+# Minimum time between two starts of the same worker (avoids a tight crash loop)
+_RESTART_BACKOFF = 2.0
+
+
+class InferencePoolError(RuntimeError):
+    """Raised when the inference pool is unreachable or a request fails inside it."""
+
+
+def _require_authkey(authkey: bytes) -> bytes:
+    if not authkey:
+        raise InferencePoolError(
+            "INFERENCE_POOL_AUTHKEY is not set; the inference pool needs a secret key "
+            "(e.g. python -c 'import secrets; print(secrets.token_hex(32))')."
+        )
+    return authkey
+
+
+def _private_socket_dir(address: str) -> None:
+    """Create the socket's directory (mode 0700), or check that an existing one is private."""
+    directory = os.path.dirname(os.path.abspath(address))
+    os.makedirs(directory, mode=0o700, exist_ok=True)
+    info = os.stat(directory)
+    if info.st_uid != os.getuid() or stat.S_IMODE(info.st_mode) & 0o077:
+        raise InferencePoolError(
+            f"Inference pool socket directory {directory} must be owned by this user "
+            "and not accessible to others (mode 0700)."
+        )
+
+
+def _attach_shared_memory(name: str) -> shared_memory.SharedMemory:
+    """Attach to a segment owned by the client without registering it for cleanup here."""
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)  # type: ignore[call-arg]
+    except TypeError:  # Python < 3.13
+        from multiprocessing import resource_tracker
+
+        shm = shared_memory.SharedMemory(name=name)
+        resource_tracker.unregister(shm._name, "shared_memory")  # type: ignore[attr-defined]
+        return shm
+
+
+def _worker_main(worker_id: int, conn: Connection, num_threads: int, backend: str) -> None:
+    """Inference worker: loads one model and serves requests sent by the supervisor."""
+    signal.signal(signal.SIGINT, signal.SIG_IGN)  # the supervisor handles shutdown
+    logging.basicConfig(level=logging.INFO)
+    import torch
+
+    torch.set_num_threads(num_threads)
+    from model import load_model
+
+    model = load_model(backend)
+    model(np.zeros((64, 64, 3), dtype=np.uint8), verbose=False)  # warmup
+    conn.send(("ready", os.getpid(), {int(k): v for k, v in model.names.items()}))
+
+    # The predictor keeps a reference to the last batch, so a segment can only be
+    # closed once the next request has replaced it
+    pending_close: List[shared_memory.SharedMemory] = []
+    while True:
+        try:
+            message = conn.recv()
+        except (EOFError, OSError):
+            break
+        if message is None:
+            break
+
+        request_id, shm_name, shape, dtype, kwargs = message
+        started = time.perf_counter()
+        try:
+            shm = _attach_shared_memory(shm_name)
+            pending_close.append(shm)
+            pixels = np.ndarray(shape, dtype=np.dtype(dtype), buffer=shm.buf)
+            result = model(pixels, verbose=False, **kwargs)[0]
+            data = result.boxes.data.cpu().numpy()
+            del pixels, result
+            conn.send(("result", request_id, data, (time.perf_counter() - started) * 1000))
+        except Exception as e:  # noqa: BLE001
+            conn.send(("error", request_id, str(e), (time.perf_counter() - started) * 1000))
+
+        still_open = []
+        for segment in pending_close:
+            try:
+                segment.close()
+            except BufferError:
+                still_open.append(segment)
+        pending_close = still_open
+
+
+class _Worker:
+    """Supervisor-side state of one inference worker process."""
+
+    def __init__(self, worker_id: int) -> None:
+        self.id = worker_id
+        self.process: Optional[multiprocessing.Process] = None
+        self.conn: Optional[Connection] = None
+        self.send_lock = threading.Lock()
+        self.ready = False
+        self.pid: Optional[int] = None
+        self.started_at = 0.0
+        self.inflight: Dict[int, Tuple["_ClientHandler", int]] = {}
+        self.completed = 0
+        self.errors = 0
+        self.restarts = 0
+        self.busy_ms = 0.0
+        self.restart_at: Optional[float] = None  # scheduled restart after a crash
+        self.failed_starts = 0  # crashes in a row before getting ready
+        self.given_up = False
+
+    def stats(self) -> Dict[str, Any]:
+        uptime = time.time() - self.started_at if self.started_at else 0.0
+        return {
+            "worker": self.id,
+            "pid": self.pid,
+            "alive": bool(self.process and self.process.is_alive()),
+            "ready": self.ready,
+            "inflight": len(self.inflight),
+            "completed": self.completed,
+            "errors": self.errors,
+            "restarts": self.restarts,
+            "given_up": self.given_up,
+            "avg_inference_ms": round(self.busy_ms / self.completed, 2) if self.completed else 0.0,
+            "throughput_per_s": round(self.completed / uptime, 3) if uptime else 0.0,
+            "utilization": round(self.busy_ms / 1000 / uptime, 3) if uptime else 0.0,
+        }
+
+
+class _ClientHandler:
+    """One connected web worker."""
+
+    def __init__(self, conn: Connection) -> None:
+        self.conn = conn
+        self.send_lock = threading.Lock()
+
+    def send(self, message: Any) -> None:
+        try:
+            with self.send_lock:
+                self.conn.send(message)
+        except (OSError, EOFError, ValueError):
+            pass  # client went away; its request is dropped
+
+
+class InferencePoolServer:
+    """
+    Supervisor that accepts client connections, dispatches requests to the least
+    loaded worker, restarts crashed workers and collects per-worker metrics.
+    """
+
+    def __init__(self, address: str, num_workers: int, threads_per_worker: int, backend: str,
+                 authkey: bytes = INFERENCE_POOL_AUTHKEY, max_restarts: int = INFERENCE_POOL_MAX_RESTARTS) -> None:
+        self.address = address
+        self.max_restarts = max_restarts
+        self.authkey = _require_authkey(authkey)
+        self.threads_per_worker = threads_per_worker
+        self.backend = backend
+        self.names: Dict[int, str] = {}
+        self._ctx = multiprocessing.get_context("spawn")
+        self._workers = [_Worker(i) for i in range(num_workers)]
+        self._lock = threading.Lock()
+        self._ids = itertools.count()
+        self._stop = threading.Event()
+        self._started_at = time.time()
+        self._rejected = 0
+
+    # --- worker management -------------------------------------------------
+
+    def _start_worker(self, worker: _Worker) -> None:
+        parent_conn, child_conn = self._ctx.Pipe(duplex=True)
+        process = self._ctx.Process(
+            target=_worker_main,
+            args=(worker.id, child_conn, self.threads_per_worker, self.backend),
+            name=f"inference-worker-{worker.id}",
+            daemon=True,
+        )
+        process.start()
+        child_conn.close()
+        worker.process, worker.conn = process, parent_conn
+        worker.ready, worker.pid, worker.started_at = False, process.pid, time.time()
+        logger.info(f"Started inference worker {worker.id} (pid {process.pid})")
+
+    def _handle_crash(self, worker: _Worker) -> None:
+        """Fail the worker's requests and schedule its restart (the router keeps routing meanwhile)."""
+        with self._lock:
+            failed = list(worker.inflight.values())
+            worker.inflight.clear()
+            if not worker.ready:
+                worker.failed_starts += 1
+            worker.ready = False
+            worker.errors += len(failed)
+        for client, request_id in failed:
+            client.send(("error", request_id, "Inference worker crashed while processing the image."))
+
+        if worker.process is not None:
+            worker.process.join(timeout=1)
+        exitcode = worker.process.exitcode if worker.process else None
+        if worker.conn is not None:
+            worker.conn.close()
+        worker.process, worker.conn = None, None
+        if worker.failed_starts > self.max_restarts:
+            worker.given_up = True
+            logger.error(
+                f"Inference worker {worker.id} died (exit code {exitcode}) before getting ready "
+                f"{worker.failed_starts} times in a row; giving up on it"
+            )
+            return
+        # Minimum time between two starts of the same worker (avoids a tight crash loop)
+        worker.restart_at = max(time.time(), worker.started_at + _RESTART_BACKOFF)
+        logger.error(f"Inference worker {worker.id} died (exit code {exitcode}), restarting")
+
+    def _restart_due(self) -> Optional[float]:
+        """Start the workers whose restart is due; seconds until the next one, if any."""
+        now = time.time()
+        next_in: Optional[float] = None
+        for worker in self._workers:
+            if worker.restart_at is None or self._stop.is_set():
+                continue
+            if worker.restart_at <= now:
+                worker.restart_at = None
+                worker.restarts += 1
+                self._start_worker(worker)
+            else:
+                wait_for = worker.restart_at - now
+                next_in = wait_for if next_in is None else min(next_in, wait_for)
+        return next_in
+
+    def _route_results(self) -> None:
+        """Read worker messages, answer clients, watch worker liveness and restart crashed workers."""
+        while not self._stop.is_set():
+            next_restart = self._restart_due()
+            timeout = 1.0 if next_restart is None else min(1.0, next_restart)
+            by_conn = {w.conn: w for w in self._workers if w.conn is not None}
+            if not by_conn:
+                time.sleep(timeout)
+                continue
+            for conn in wait(list(by_conn), timeout=timeout):
+                worker = by_conn[conn]
+                try:
+                    message = conn.recv()
+                except (EOFError, OSError):
+                    self._handle_crash(worker)
+                    continue
+                self._handle_worker_message(worker, message)
+
+            for worker in self._workers:
+                if worker.process is not None and not worker.process.is_alive() and not self._stop.is_set():
+                    self._handle_crash(worker)
+
+    def _handle_worker_message(self, worker: _Worker, message: Tuple) -> None:
+        kind = message[0]
+        if kind == "ready":
+            _, pid, names = message
+            with self._lock:
+                worker.ready, worker.pid, worker.failed_starts = True, pid, 0
+                self.names = names
+            logger.info(f"Inference worker {worker.id} ready")
+            return
+
+        _, internal_id, payload, elapsed_ms = message
+        with self._lock:
+            target = worker.inflight.pop(internal_id, None)
+            worker.busy_ms += elapsed_ms
+            if kind == "result":
+                worker.completed += 1
+            else:
+                worker.errors += 1
+        if target is not None:
+            client, request_id = target
+            client.send((kind, request_id, payload))
+
+    # --- client handling ---------------------------------------------------
+
+    def _dispatch(self, client: _ClientHandler, message: Tuple) -> None:
+        _, request_id, shm_name, shape, dtype, kwargs = message
+        with self._lock:
+            candidates = [w for w in self._workers if w.ready]
+            worker = min(candidates, key=lambda w: len(w.inflight)) if candidates else None
+            if worker is not None:
+                internal_id = next(self._ids)
+                worker.inflight[internal_id] = (client, request_id)
+            else:
+                self._rejected += 1
+        if worker is None:
+            client.send(("error", request_id, "No inference workers are ready."))
+            return
+        try:
+            with worker.send_lock:
+                worker.conn.send((internal_id, shm_name, shape, dtype, kwargs))
+        except (OSError, ValueError) as e:
+            with self._lock:
+                worker.inflight.pop(internal_id, None)
+            client.send(("error", request_id, f"Inference worker unavailable: {e}"))
+
+    def _serve_client(self, conn: Connection) -> None:
+        client = _ClientHandler(conn)
+        while not self._stop.is_set():
+            try:
+                message = conn.recv()
+            except (EOFError, OSError):
+                break
+            kind = message[0]
+            if kind == "detect":
+                self._dispatch(client, message)
+            elif kind == "info":
+                client.send(("info", message[1], {"names": self.names, "workers": len(self._workers)}))
+            elif kind == "stats":
+                client.send(("stats", message[1], self.stats()))
+            elif kind == "ping":
+                client.send(("pong", message[1], {
+                    "ready_workers": sum(w.ready for w in self._workers),
+                    "workers": len(self._workers),
+                    "failed_workers": sum(w.given_up for w in self._workers),
+                }))
+        conn.close()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            workers = [w.stats() for w in self._workers]
+        return {
+            "address": self.address,
+            "backend": self.backend,
+            "workers": workers,
+            "ready_workers": sum(w["ready"] for w in workers),
+            "healthy": not any(w["given_up"] for w in workers),
+            "completed": sum(w["completed"] for w in workers),
+            "errors": sum(w["errors"] for w in workers),
+            "restarts": sum(w["restarts"] for w in workers),
+            "rejected": self._rejected,
+            "uptime_s": round(time.time() - self._started_at, 1),
+        }
+
+    def serve_forever(self) -> None:
+        _private_socket_dir(self.address)
+        if os.path.exists(self.address):
+            os.unlink(self.address)
+        for worker in self._workers:
+            self._start_worker(worker)
+        threading.Thread(target=self._route_results, name="pool-router", daemon=True).start()
+
+        # The socket is created owner-only (no window in which others could connect)
+        previous_umask = os.umask(0o177)
+        try:
+            listener = Listener(self.address, family="AF_UNIX", authkey=self.authkey)
+        finally:
+            os.umask(previous_umask)
+        os.chmod(self.address, 0o600)
+        with listener:
+            logger.info(f"Inference pool listening on {self.address} with {len(self._workers)} workers")
+            while not self._stop.is_set():
+                try:
+                    conn = listener.accept()
+                except (OSError, EOFError, AuthenticationError) as e:
+                    logger.warning(f"Rejected inference pool connection: {e}")
+                    continue
+                threading.Thread(target=self._serve_client, args=(conn,), daemon=True).start()
+
+    def shutdown(self) -> None:
+        self._stop.set()
+        for worker in self._workers:
+            try:
+                if worker.conn is not None:
+                    worker.conn.send(None)
+            except (OSError, ValueError):
+                pass
+        for worker in self._workers:
+            if worker.process is not None:
+                worker.process.join(timeout=5)
+
+
+class InferencePoolClient:
+    """
+    Client used by the web workers. Each thread keeps its own connection, and the
+    images of one call are sent together so the pool can run them in parallel.
+    """
+
+    def __init__(self, address: str, authkey: bytes = INFERENCE_POOL_AUTHKEY,
+                 timeout: float = INFERENCE_POOL_TIMEOUT) -> None:
+        self.address = address
+        self.authkey = authkey
+        self.timeout = timeout
+        self._local = threading.local()
+        self._ids = itertools.count()
+        self._names: Optional[Dict[int, str]] = None
+
+    def _connection(self) -> Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            try:
+                conn = Client(self.address, family="AF_UNIX", authkey=_require_authkey(self.authkey))
+            except (OSError, EOFError, AuthenticationError) as e:
+                raise InferencePoolError(f"Inference pool unavailable at {self.address}: {e}") from e
+            self._local.conn = conn
+        return conn
+
+    def _drop_connection(self) -> None:
+        conn = getattr(self._local, "conn", None)
+        self._local.conn = None
+        if conn is not None:
+            conn.close()
+
+    def _request(self, kind: str) -> Any:
+        request_id = next(self._ids)
+        conn = self._connection()
+        try:
+            conn.send((kind, request_id))
+            if not conn.poll(self.timeout):
+                raise InferencePoolError(f"Inference pool did not answer '{kind}' in time.")
+            _, _, payload = conn.recv()
+            return payload
+        except (OSError, EOFError) as e:
+            self._drop_connection()
+            raise InferencePoolError(f"Inference pool connection lost: {e}") from e
+
+    def names(self) -> Dict[int, str]:
+        """Class names of the model served by the pool."""
+        if not self._names:
+            self._names = self._request("info")["names"]
+        return self._names  # type: ignore[return-value]
+
+    def ping(self) -> Dict[str, Any]:
+        return self._request("ping")
+
+    def wait_ready(self, timeout: float = 120.0) -> None:
+        """Block until every pool worker has loaded and warmed up its model."""
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                status = self.ping()
+                if status["ready_workers"] >= status.get("workers", 1):
+                    return
+            except InferencePoolError:
+                status = {}
+            if status.get("failed_workers"):
+                raise InferencePoolError(
+                    f"{status['failed_workers']} of {status['workers']} inference pool workers "
+                    "kept crashing on startup and were given up."
+                )
+            if time.monotonic() > deadline:
+                raise InferencePoolError(f"Not all inference pool workers ready after {timeout:.0f}s.")
+            time.sleep(0.5)
+
+    def stats(self) -> Dict[str, Any]:
+        return self._request("stats")
+
+    def predict_many(self, images: List[np.ndarray], **kwargs: Any) -> List[np.ndarray]:
+        """
+        Run detection on uint8 HWC images. Returns one (n, 6) array per image with
+        x0, y0, x1, y1, confidence, class rows.
+        """
+        conn = self._connection()
+        segments: Dict[int, shared_memory.SharedMemory] = {}
+        try:
+            for img in images:
+                request_id = next(self._ids)
+                shm = shared_memory.SharedMemory(create=True, size=max(1, img.nbytes))
+                segments[request_id] = shm
+                np.ndarray(img.shape, dtype=img.dtype, buffer=shm.buf)[...] = img
+                conn.send(("detect", request_id, shm.name, img.shape, img.dtype.str, kwargs))
+
+            results: Dict[int, np.ndarray] = {}
+            deadline = time.monotonic() + self.timeout
+            while len(results) < len(segments):
+                if not conn.poll(max(0.0, deadline - time.monotonic())):
+                    self._drop_connection()
+                    raise InferencePoolError("Inference pool timed out.")
+                kind, request_id, payload = conn.recv()
+                if kind == "error":
+                    # Remaining answers of this call are unusable on this connection
+                    self._drop_connection()
+                    raise InferencePoolError(f"Inference failed in pool: {payload}")
+                results[request_id] = payload
+            return [results[request_id] for request_id in segments]
+        except (OSError, EOFError) as e:
+            self._drop_connection()
+            raise InferencePoolError(f"Inference pool connection lost: {e}") from e
+        finally:
+            for shm in segments.values():
+                shm.close()
+                shm.unlink()
+
+
+def main(argv: List[str]) -> int:
+    parser = argparse.ArgumentParser(description="Run the shared inference worker pool")
+    parser.add_argument("--address", default=INFERENCE_POOL_ADDRESS or DEFAULT_POOL_ADDRESS,
+                        help="Unix socket path the pool listens on")
+    parser.add_argument("--workers", type=int, default=INFERENCE_POOL_WORKERS)
+    parser.add_argument("--threads-per-worker", type=int, default=0,
+                        help="Torch threads per worker (default: CPU count / workers)")
+    parser.add_argument("--backend", default=os.environ.get("YOLO_BACKEND", "torch"))
+    args = parser.parse_args(argv)
+
+    workers = max(1, args.workers)
+    threads = args.threads_per_worker or max(1, (os.cpu_count() or 1) // workers)
+    try:
+        server = InferencePoolServer(args.address, workers, threads, args.backend.lower())
+    except InferencePoolError as e:
+        logger.error(str(e))
+        return 2
+
+    def _terminate(signum: int, frame: Any) -> None:
+        server.shutdown()
+        sys.exit(0)
+
+    signal.signal(signal.SIGTERM, _terminate)
+    signal.signal(signal.SIGINT, _terminate)
+    try:
+        server.serve_forever()
+    except InferencePoolError as e:
+        logger.error(str(e))
+        return 2
+    return 0
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    sys.exit(main(sys.argv[1:]))
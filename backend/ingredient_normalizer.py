@@ -5,12 +5,18 @@ Falls back to dictionary lookup for performance, then uses AI for unknown ingred
 import json
 import logging
 import os
-from typing import Dict, List, Optional
+from typing import Any, Dict, List, Optional, Tuple
 
-from gemini_client import GeminiClient
+from gemini_client import get_client, get_recipe_cache_stats
+from recipe_schema import INGREDIENT_NAMES_SCHEMA, decode_ingredient_names
+from single_flight import SingleFlight
+from ttl_cache import LRUCache
 
 logger = logging.getLogger(__name__)
 
+AI_NORMALIZATION_CACHE_SIZE = int(os.environ.get("AI_NORMALIZATION_CACHE_SIZE", "2048"))
+AI_NORMALIZATION_CACHE_TTL = int(os.environ.get("AI_NORMALIZATION_CACHE_TTL", str(7 * 24 * 3600)))  # seconds
+
 # Fast dictionary lookup for common ingredients (performance optimization)
 # This is used as a first-pass before calling AI
 COMMON_INGREDIENT_MAPPING: Dict[str, str] = {
@@ -155,8 +161,12 @@ COMMON_INGREDIENT_MAPPING: Dict[str, str] = {
     "fasol_": "beans",
 }
 
+_NORMALIZED_NAMES = frozenset(COMMON_INGREDIENT_MAPPING.values())
+
 # Cache for AI-normalized ingredients (reduces API calls)
-_ai_cache: Dict[str, str] = {}
+_ai_cache: "LRUCache[str]" = LRUCache(AI_NORMALIZATION_CACHE_SIZE, ttl=AI_NORMALIZATION_CACHE_TTL)
+# Concurrent batch normalizations of the same unknown names share one Gemini call
+_batch_flights = SingleFlight()
 
 
 def normalize_ingredient(raw_name: str, use_ai: Optional[bool] = None) -> str:
@@ -200,8 +210,8 @@ def normalize_ingredient(raw_name: str, use_ai: Optional[bool] = None) -> str:
     
     # Step 2: Check AI cache
     cache_key = raw_lower
-    if cache_key in _ai_cache:
-        normalized = _ai_cache[cache_key]
+    normalized = _ai_cache.get(cache_key)
+    if normalized is not None:
         return normalized
     
     # Step 3: Use AI normalization if enabled
@@ -210,7 +220,7 @@ def normalize_ingredient(raw_name: str, use_ai: Optional[bool] = None) -> str:
             normalized = _normalize_with_ai(raw_name)
             if normalized:
                 # Cache the result
-                _ai_cache[cache_key] = normalized
+                _ai_cache.put(cache_key, normalized)
                 return normalized
         except Exception as e:
             logger.warning(f"AI normalization failed for '{raw_name}': {e}")
@@ -236,22 +246,103 @@ def normalize_ingredients_batch(raw_names: List[str], use_ai: Optional[bool] = N
     if not raw_names:
         return []
     
+    return _dedupe_in_order(raw_names, normalize_ingredients_mapping(raw_names, use_ai=use_ai))
+
+
+def _dedupe_in_order(raw_names: List[str], normalized_dict: Dict[str, str]) -> List[str]:
+    # Build final list preserving order
+    result: List[str] = []
+    seen = set()
+    for raw in raw_names:
+        if not raw or not raw.strip():
+            continue
+        
+        normalized = normalized_dict[raw]
+        
+        # Deduplicate
+        normalized_lower = normalized.lower()
+        if normalized_lower not in seen:
+            seen.add(normalized_lower)
+            result.append(normalized)
+    
+    return result
+
+
+def normalize_ingredients_mapping(raw_names: List[str], use_ai: Optional[bool] = None) -> Dict[str, str]:
+    """
+    Normalize multiple ingredients and return the raw -> normalized name mapping
+    (needed to merge per-class detection details into per-ingredient ones).
+    
+    Args:
+        raw_names: List of raw ingredient names
+        use_ai: Whether to use AI for normalization. If None, uses ENABLE_AI_NORMALIZATION env var (default: True)
+    
+    Returns:
+        Mapping of every non-empty raw name to its normalized name
+    """
+    normalized_dict, needs_ai = _lookup_known(raw_names)
+    
+    # Second pass: AI normalization for unknown ingredients
+    if needs_ai and _use_ai(use_ai):
+        try:
+            _store_ai_results(normalized_dict, needs_ai, _normalize_batch_with_ai(needs_ai))
+        except Exception as e:
+            logger.warning(f"Batch AI normalization failed: {e}")
+            # Fall through to individual fallback
+    
+    return _fill_fallbacks(normalized_dict, raw_names)
+
+
+async def normalize_ingredients_mapping_async(raw_names: List[str], use_ai: Optional[bool] = None) -> Dict[str, str]:
+    """
+    Async variant of normalize_ingredients_mapping; awaits the Gemini call instead
+    of blocking. The request path runs it on the event loop over the names that
+    detection produced (see main._normalize_detections), so inference threads
+    never wait on Gemini.
+    """
+    normalized_dict, needs_ai = _lookup_known(raw_names)
+    
+    if needs_ai and _use_ai(use_ai):
+        try:
+            _store_ai_results(normalized_dict, needs_ai, await _normalize_batch_with_ai_async(needs_ai))
+        except Exception as e:
+            logger.warning(f"Batch AI normalization failed: {e}")
+    
+    return _fill_fallbacks(normalized_dict, raw_names)
+
+
+def ai_normalization_enabled() -> bool:
+    """Whether unknown names are normalized with Gemini (ENABLE_AI_NORMALIZATION)."""
+    return _use_ai(None)
+
+
+def _use_ai(use_ai: Optional[bool]) -> bool:
     # Check environment variable if use_ai is not explicitly set
     # Default to False to avoid rate limits - dictionary lookup handles most cases
     if use_ai is None:
         use_ai = os.environ.get("ENABLE_AI_NORMALIZATION", "false").lower() == "true"
+    return use_ai
+
+
+def _lookup_known(raw_names: List[str]) -> Tuple[Dict[str, str], List[str]]:
+    """
+    First pass: dictionary lookup, then the AI cache.
     
-    # First pass: dictionary lookup
+    Returns:
+        The names resolved so far, and the raw names still needing AI normalization
+    """
     normalized_dict: Dict[str, str] = {}
     needs_ai: List[str] = []
-    dict_hits = 0
-    cache_hits = 0
     
     for raw in raw_names:
         if not raw or not raw.strip():
             continue
         
         raw_lower = raw.lower().strip()
+        if raw_lower in _NORMALIZED_NAMES:
+            # Already a normalized name (detections are normalized again on the event loop)
+            normalized_dict[raw] = raw_lower
+            continue
         key_variations = [
             raw_lower.replace(" ", "_"),
             raw_lower.replace("-", "_"),
@@ -264,65 +355,41 @@ def normalize_ingredients_batch(raw_names: List[str], use_ai: Optional[bool] = N
             if key in COMMON_INGREDIENT_MAPPING:
                 normalized_dict[raw] = COMMON_INGREDIENT_MAPPING[key]
                 found = True
-                dict_hits += 1
                 break
         
         if not found:
             # Check cache
             cache_key = raw_lower
-            if cache_key in _ai_cache:
-                normalized_dict[raw] = _ai_cache[cache_key]
-                cache_hits += 1
+            cached = _ai_cache.get(cache_key)
+            if cached is not None:
+                normalized_dict[raw] = cached
             else:
                 needs_ai.append(raw)
     
-    # Second pass: AI normalization for unknown ingredients
-    if needs_ai and use_ai:
-        try:
-            ai_normalized = _normalize_batch_with_ai(needs_ai)
-            for raw, normalized in zip(needs_ai, ai_normalized):
-                if normalized:
-                    normalized_dict[raw] = normalized
-                    # Cache the result
-                    _ai_cache[raw.lower().strip()] = normalized
-        except Exception as e:
-            logger.warning(f"Batch AI normalization failed: {e}")
-            # Fall through to individual fallback
-    
-    # Build final list preserving order
-    result: List[str] = []
-    seen = set()
+    # Sorted and deduplicated, so the same unknown names always form the same batch
+    return normalized_dict, sorted(set(needs_ai))
+
+
+def _store_ai_results(normalized_dict: Dict[str, str], needs_ai: List[str], ai_normalized: List[str]) -> None:
+    for raw, normalized in zip(needs_ai, ai_normalized):
+        if normalized:
+            normalized_dict[raw] = normalized
+            # Cache the result; a normalized name maps to itself
+            _ai_cache.put(raw.lower().strip(), normalized)
+            _ai_cache.put(normalized.lower(), normalized)
+
+
+def _fill_fallbacks(normalized_dict: Dict[str, str], raw_names: List[str]) -> Dict[str, str]:
     for raw in raw_names:
-        if not raw or not raw.strip():
-            continue
-        
-        normalized = normalized_dict.get(raw)
-        if not normalized:
+        if raw and raw.strip() and not normalized_dict.get(raw):
             # Fallback to cleaned raw name
-            normalized = raw.lower().strip()
-        
-        # Deduplicate
-        normalized_lower = normalized.lower()
-        if normalized_lower not in seen:
-            seen.add(normalized_lower)
-            result.append(normalized)
+            normalized_dict[raw] = raw.lower().strip()
     
-    return result
+    return normalized_dict
 
 
-def _normalize_with_ai(raw_name: str) -> str:
-    """
-    Use Gemini AI to normalize a single ingredient name.
-    
-    Args:
-        raw_name: Raw ingredient name
-    
-    Returns:
-        Normalized ingredient name
-    """
-    try:
-        client = GeminiClient()
-        prompt = f"""Normalize this cooking ingredient name to a standard, common name.
+def _single_prompt(raw_name: str) -> str:
+    return f"""Normalize this cooking ingredient name to a standard, common name.
 Return ONLY the normalized ingredient name, nothing else. No explanations, no quotes, just the name.
 
 Examples:
@@ -335,36 +402,23 @@ Examples:
 
 Ingredient to normalize: "{raw_name}"
 Normalized name:"""
-        
-        response = client._call_gemini(prompt)
-        normalized = response.strip().strip('"').strip("'").strip()
-        
-        # Validate: if response looks wrong, use fallback
-        if len(normalized) > 50 or not normalized:
-            logger.warning(f"AI returned invalid normalization for '{raw_name}': '{normalized}'")
-            return raw_name.lower().strip()
-        
-        return normalized.lower().strip()
-    except Exception as e:
-        logger.error(f"Error normalizing '{raw_name}' with AI: {e}")
-        raise
 
 
-def _normalize_batch_with_ai(raw_names: List[str]) -> List[str]:
-    """
-    Use Gemini AI to normalize multiple ingredient names in one call.
+def _parse_single(raw_name: str, response: str) -> str:
+    normalized = response.strip().strip('"').strip("'").strip()
     
-    Args:
-        raw_names: List of raw ingredient names
+    # Validate: if response looks wrong, use fallback
+    if len(normalized) > 50 or not normalized:
+        logger.warning(f"AI returned invalid normalization for '{raw_name}': '{normalized}'")
+        return raw_name.lower().strip()
     
-    Returns:
-        List of normalized ingredient names
-    """
-    try:
-        client = GeminiClient()
-        ingredients_str = ", ".join([f'"{name}"' for name in raw_names])
-        
-        prompt = f"""Normalize these cooking ingredient names to standard, common names.
+    return normalized.lower().strip()
+
+
+def _batch_prompt(raw_names: List[str]) -> str:
+    ingredients_str = ", ".join([f'"{name}"' for name in raw_names])
+    
+    return f"""Normalize these cooking ingredient names to standard, common names.
 Return ONLY a JSON array of normalized names in the same order, nothing else.
 
 Examples:
@@ -378,27 +432,81 @@ Examples:
 Ingredients to normalize: [{ingredients_str}]
 
 Return format: ["normalized1", "normalized2", ...]"""
-        
-        response = client._call_gemini(prompt)
-        
-        # Try to parse JSON array
-        try:
-            # Try direct JSON parse
-            normalized_list = json.loads(response)
+
+
+def _parse_batch(raw_names: List[str], response: str) -> List[str]:
+    # Structured output: the answer is exactly the JSON array of names
+    names = decode_ingredient_names(response, len(raw_names))
+    if names is not None:
+        return [name.lower().strip() for name in names]
+
+    # Try to parse JSON array
+    try:
+        # Try direct JSON parse
+        normalized_list = json.loads(response)
+        if isinstance(normalized_list, list) and len(normalized_list) == len(raw_names):
+            return [str(n).lower().strip() for n in normalized_list]
+    except json.JSONDecodeError:
+        # Try to extract JSON array from text
+        start = response.find("[")
+        end = response.rfind("]")
+        if start != -1 and end != -1 and end > start:
+            normalized_list = json.loads(response[start : end + 1])
             if isinstance(normalized_list, list) and len(normalized_list) == len(raw_names):
                 return [str(n).lower().strip() for n in normalized_list]
-        except json.JSONDecodeError:
-            # Try to extract JSON array from text
-            start = response.find("[")
-            end = response.rfind("]")
-            if start != -1 and end != -1 and end > start:
-                normalized_list = json.loads(response[start : end + 1])
-                if isinstance(normalized_list, list) and len(normalized_list) == len(raw_names):
-                    return [str(n).lower().strip() for n in normalized_list]
-        
-        # Fallback: parse individual names
-        logger.warning("Failed to parse batch AI response as JSON, falling back to individual normalization")
-        return [raw_name.lower().strip() for raw_name in raw_names]
+    
+    # Fallback: parse individual names
+    logger.warning("Failed to parse batch AI response as JSON, falling back to individual normalization")
+    return [raw_name.lower().strip() for raw_name in raw_names]
+
+
+def _normalize_with_ai(raw_name: str) -> str:
+    """
+    Use Gemini AI to normalize a single ingredient name.
+    
+    Args:
+        raw_name: Raw ingredient name
+    
+    Returns:
+        Normalized ingredient name
+    """
+    try:
+        return _parse_single(raw_name, get_client()._call_gemini(_single_prompt(raw_name)))
+    except Exception as e:
+        logger.error(f"Error normalizing '{raw_name}' with AI: {e}")
+        raise
+
+
+def _normalize_batch_with_ai(raw_names: List[str]) -> List[str]:
+    """
+    Use Gemini AI to normalize multiple ingredient names in one call.
+    
+    Args:
+        raw_names: List of raw ingredient names
+    
+    Returns:
+        List of normalized ingredient names
+    """
+    try:
+        return _batch_flights.run_sync(
+            tuple(raw_names),
+            lambda: _parse_batch(
+                raw_names, get_client()._call_gemini(_batch_prompt(raw_names), INGREDIENT_NAMES_SCHEMA)
+            ),
+        )
+    except Exception as e:
+        logger.error(f"Error batch normalizing with AI: {e}")
+        raise
+
+
+async def _normalize_batch_with_ai_async(raw_names: List[str]) -> List[str]:
+    """Async variant of _normalize_batch_with_ai."""
+    async def normalize() -> List[str]:
+        response = await get_client()._call_gemini_async(_batch_prompt(raw_names), INGREDIENT_NAMES_SCHEMA)
+        return _parse_batch(raw_names, response)
+
+    try:
+        return await _batch_flights.run(tuple(raw_names), normalize)
     except Exception as e:
         logger.error(f"Error batch normalizing with AI: {e}")
         raise
@@ -406,15 +514,19 @@ Return format: ["normalized1", "normalized2", ...]"""
 
 def clear_cache():
     """Clear the AI normalization cache."""
-    global _ai_cache
     _ai_cache.clear()
     logger.info("AI normalization cache cleared")
 
 
-def get_cache_stats() -> Dict[str, int]:
-    """Get statistics about the normalization cache."""
+def get_cache_stats() -> Dict[str, Any]:
+    """Get statistics about the normalization and recipe caches."""
+    flights = _batch_flights.stats()
     return {
         "cached_items": len(_ai_cache),
         "dictionary_items": len(COMMON_INGREDIENT_MAPPING),
+        "batch_calls": flights["upstream_calls"],
+        "coalesced_batches": flights["coalesced"],
+        "ai_cache": _ai_cache.stats(),
+        "recipe_cache": get_recipe_cache_stats(),
     }
 
@@ -1,19 +1,75 @@
-import io
+import asyncio
+import json
 import os
 import logging
 import re
-from typing import List, Optional
+import tempfile
+import time
+from typing import Any, AsyncIterator, Dict, List, NamedTuple, Optional, Tuple, Union
 
-import requests
+import httpx
 
 from fastapi import FastAPI, File, HTTPException, UploadFile, Form  # type: ignore[import]
 from fastapi.middleware.cors import CORSMiddleware  # type: ignore[import]
-from fastapi.responses import JSONResponse  # type: ignore[import]
-from PIL import Image
+from fastapi.responses import JSONResponse, StreamingResponse  # type: ignore[import]
 from PIL import UnidentifiedImageError
 
-from gemini_client import GeminiClient
-from model import detect_ingredients
+from detection_cache import DETECTION_CACHE_ENABLED, InferenceConfig, detection_cache, make_cache_key
+from detections import IngredientDetection, merge_by_ingredient
+from gemini_client import (
+    close_http_clients,
+    get_client,
+    get_recipe_cache_stats,
+    get_recipe_details_stats,
+    get_recipe_similarity_stats,
+    get_single_flight_stats,
+)
+from image_preprocessing import get_copy_stats
+from image_prescreen import ImageRejected, get_prescreen_stats
+from ingredient_normalizer import (
+    ai_normalization_enabled,
+    get_cache_stats as get_normalizer_stats,
+    normalize_ingredients_mapping_async,
+)
+from inference_executor import (
+    InferenceQueueFull,
+    get_executor_stats,
+    get_queue_depth,
+    run_inference,
+    shutdown_executor,
+    warm_all_workers,
+)
+from model import (
+    INFERENCE_IMAGE_SIZE,
+    PRELOAD_MODEL,
+    YOLO_BACKEND,
+    ImageDecodeError,
+    detect_ingredients_batch_from_bytes,
+    detect_ingredients_from_bytes,
+    get_batching_stats,
+    get_confidence_threshold,
+    get_pool_health,
+    get_pool_stats,
+    merge_image_detections,
+    warmup_model,
+)
+from video_ingest import (
+    VIDEO_MAX_FILE_SIZE_MB,
+    VIDEO_MAX_FRAME_UPLOADS,
+    detect_ingredients_from_frames,
+    detect_ingredients_from_video,
+)
+from quality_controller import QualityController, QualityLevel, build_levels
+from rate_limiter import get_rate_limit_stats
+from tiling import YOLO_TILING
+from recipe_corpus import (
+    RECIPE_CORPUS_HEDGE_MS,
+    RECIPE_CORPUS_LEARN,
+    RECIPE_CORPUS_MIN_RESULTS,
+    RECIPE_CORPUS_PATH,
+    get_corpus_stats,
+    get_recipe_corpus,
+)
 
 # Set up logging
 logging.basicConfig(level=logging.INFO)
@@ -21,6 +77,16 @@ logger = logging.getLogger(__name__)
 
 app = FastAPI(title="Recipe Recommender API")
 
+MAX_FILE_SIZE = 10 * 1024 * 1024  # 10MB
+# Images accepted in one multi-image upload (fridge, pantry, counter, ...)
+MAX_BATCH_IMAGES = int(os.environ.get("MAX_BATCH_IMAGES", "8"))
+# /recommend asks Gemini for recipe summaries only; GET /recipes/{id} generates the opened one in full
+RECIPE_SUMMARY_MODE = os.environ.get("RECIPE_SUMMARY_MODE", "true").lower() == "true"
+_RECIPE_ID = re.compile(r"[0-9a-f]{32}")
+
+# Picks the detection quality level (inference size, tiling) from the current load
+quality_controller = QualityController(build_levels(INFERENCE_IMAGE_SIZE), get_queue_depth)
+
 # CORS configuration - use environment variable for production
 allowed_origins = os.environ.get("ALLOWED_ORIGINS", "*").split(",")
 if allowed_origins == ["*"]:
@@ -45,9 +111,56 @@ else:
     )
 
 
+# Model readiness, filled in by the startup preload task
+_readiness: Dict[str, Any] = {
+    "ready": not PRELOAD_MODEL,
+    "model_loaded": False,
+    "warmed_up": False,
+    "preload": PRELOAD_MODEL,
+    "degraded": False,
+    "error": None,
+}
+_preload_task: Optional[asyncio.Task] = None
+
+
+async def _preload_model() -> None:
+    started = time.perf_counter()
+    try:
+        stats = await run_inference(warmup_model)
+        stats["warm_workers"] = await warm_all_workers()
+        _readiness.update(stats)
+        _readiness.update(model_loaded=True, warmed_up=True, ready=True)
+    except Exception as exc:  # noqa: BLE001
+        logger.error(f"Model preload failed: {exc}", exc_info=True)
+        # Recipes don't need the model: take traffic, with detection reported as degraded
+        _readiness.update(ready=True, degraded=True, error=str(exc))
+    finally:
+        _readiness["startup_ms"] = round((time.perf_counter() - started) * 1000, 2)
+
+
+@app.on_event("startup")
+async def preload_model_on_startup() -> None:
+    """Load + warm up the model in the background so /health answers right away."""
+    global _preload_task
+    if PRELOAD_MODEL:
+        _preload_task = asyncio.create_task(_preload_model())
+    if RECIPE_CORPUS_PATH:
+        # Index the corpus in the background instead of on the first request
+        asyncio.create_task(asyncio.to_thread(get_recipe_corpus))
+
+
+@app.on_event("shutdown")
+async def shutdown_inference() -> None:
+    shutdown_executor(wait=False)
+    await close_http_clients()
+
+
 @app.get("/")
 def root() -> dict:
-    return {"message": "Recipe Recommender API", "endpoints": ["/health", "/recommend"]}
+    return {
+        "message": "Recipe Recommender API",
+        "endpoints": ["/health", "/ready", "/metrics", "/detect/batch", "/detect/video", "/recommend", "/recommend/stream", "/recipes/{id}"],
+    }
 
 
 @app.get("/health")
@@ -55,6 +168,334 @@ def health_check() -> dict:
     return {"status": "ok"}
 
 
+@app.get("/ready")
+async def readiness_check() -> JSONResponse:
+    """
+    503 while the model is preloading; 200 once it is loaded and warmed up in every
+    inference worker, or with `degraded` and the error if the preload failed or the
+    inference pool is unhealthy (recipes are still served, detection may not be).
+    """
+    content = dict(_readiness)
+    if content["ready"]:
+        pool_error = await asyncio.to_thread(get_pool_health)
+        if pool_error:
+            content.update(degraded=True, error=pool_error)
+    return JSONResponse(status_code=200 if content["ready"] else 503, content=content)
+
+
+@app.get("/metrics")
+def metrics() -> dict:
+    """Runtime statistics used to tune inference performance."""
+    return {
+        "executor": get_executor_stats(),
+        "batching": get_batching_stats(),
+        "inference_pool": get_pool_stats(),
+        "detection_cache": detection_cache.stats(),
+        "image_copies": get_copy_stats(),
+        "prescreen": get_prescreen_stats(),
+        "gemini_rate_limit": get_rate_limit_stats(),
+        "recipe_cache": get_recipe_cache_stats(),
+        "recipe_near_matches": get_recipe_similarity_stats(),
+        "recipe_details": get_recipe_details_stats(),
+        "recipe_single_flight": get_single_flight_stats(),
+        "recipe_corpus": get_corpus_stats(),
+        "normalizer": get_normalizer_stats(),
+        "adaptive_quality": quality_controller.stats(),
+    }
+
+
+async def _run_detection(fn: Any, contents: Any, quality: QualityLevel) -> Any:
+    """Run a detection job at the given quality level and record its latency for the controller."""
+    started = time.perf_counter()
+    try:
+        return await run_inference(fn, contents, quality.image_size, quality.tiling, quality.augment)
+    finally:
+        quality_controller.record_latency((time.perf_counter() - started) * 1000)
+
+
+def _inference_config(quality: QualityLevel) -> InferenceConfig:
+    """The settings, besides the image and threshold, that decide a detection result."""
+    tiling = YOLO_TILING if quality.tiling else "off"
+    return (YOLO_BACKEND, quality.image_size, tiling, quality.augment)
+
+
+async def _ai_normalized_names(names: List[str]) -> Optional[Dict[str, str]]:
+    """
+    Normalize the detected names the dictionary doesn't know with Gemini
+    (ENABLE_AI_NORMALIZATION). This runs on the event loop after detection, so
+    inference workers never wait on Gemini. None if no name changes.
+    """
+    if not names or not ai_normalization_enabled():
+        return None
+    normalized = await normalize_ingredients_mapping_async(sorted(set(names)), use_ai=True)
+    if all(normalized.get(name, name) == name for name in names):
+        return None
+    return normalized
+
+
+async def _normalize_detections(per_image: List[Any]) -> List[Any]:
+    """Apply _ai_normalized_names to the detections of several images (errors pass through)."""
+    normalized = await _ai_normalized_names([
+        detection.name for result in per_image if not isinstance(result, Exception) for detection in result
+    ])
+    if normalized is None:
+        return per_image
+    return [
+        result if isinstance(result, Exception) else merge_by_ingredient(result, normalized)
+        for result in per_image
+    ]
+
+
+async def _detect_with_cache(contents: bytes, quality: QualityLevel) -> Tuple[List[IngredientDetection], QualityLevel]:
+    """
+    Run ingredient detection on an upload, reusing the result of an identical
+    (or, in perceptual mode, visually identical) earlier upload.
+
+    Returns:
+        The detections and the quality level they were produced at.
+    """
+    if not DETECTION_CACHE_ENABLED:
+        detected = await _run_detection(detect_ingredients_from_bytes, contents, quality)
+        return (await _normalize_detections([detected]))[0], quality
+
+    # Only full-quality results are cached, so look up the full-quality configuration
+    full_config = _inference_config(quality_controller.levels[0])
+    cache_key = await asyncio.to_thread(make_cache_key, contents, get_confidence_threshold(), full_config)
+    cached = detection_cache.get(cache_key)
+    if cached is not None:
+        logger.info(f"Detection cache hit: {[detection.name for detection in cached]}")
+        return (await _normalize_detections([cached]))[0], quality_controller.levels[0]
+
+    detected = await _run_detection(detect_ingredients_from_bytes, contents, quality)
+    # Degraded results are not cached, so they aren't served once the load drops
+    if quality.level == 0:
+        detection_cache.put(cache_key, detected)
+    return (await _normalize_detections([detected]))[0], quality
+
+
+async def _detect_many_with_cache(
+    uploads: List[bytes],
+    quality: QualityLevel,
+) -> List[Union[List[IngredientDetection], Exception]]:
+    """
+    Run ingredient detection on several uploads. Cached images are answered from the
+    detection cache; the others are decoded and run through the model as one batch.
+    Undecodable images are returned as their decode error.
+    """
+    keys: List[Any] = [None] * len(uploads)
+    results: List[Any] = [None] * len(uploads)
+    if DETECTION_CACHE_ENABLED:
+        conf = get_confidence_threshold()
+        full_config = _inference_config(quality_controller.levels[0])
+        keys = await asyncio.gather(*(
+            asyncio.to_thread(make_cache_key, contents, conf, full_config) for contents in uploads
+        ))
+        results = [detection_cache.get(key) for key in keys]
+
+    missing = [i for i, result in enumerate(results) if result is None]
+    if missing:
+        detected = await _run_detection(detect_ingredients_batch_from_bytes, [uploads[i] for i in missing], quality)
+        for i, result in zip(missing, detected):
+            results[i] = result
+            if keys[i] is not None and quality.level == 0 and not isinstance(result, Exception):
+                detection_cache.put(keys[i], result)
+    return await _normalize_detections(results)
+
+
+async def _read_upload(file: UploadFile) -> bytes:
+    """Read an uploaded image, rejecting non-images and files over the size limit."""
+    if not file.content_type or not file.content_type.startswith("image/"):
+        raise HTTPException(status_code=400, detail="Uploaded file must be an image.")
+
+    contents = await file.read()
+    if len(contents) > MAX_FILE_SIZE:
+        size_mb = len(contents) / (1024 * 1024)
+        raise HTTPException(
+            status_code=400,
+            detail=f"File is too large ({size_mb:.2f}MB). Maximum size is 10MB."
+        )
+    return contents
+
+
+def _check_batch_size(uploads: List[UploadFile]) -> None:
+    if len(uploads) > MAX_BATCH_IMAGES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Too many images ({len(uploads)}). Upload at most {MAX_BATCH_IMAGES} images at once.",
+        )
+
+
+def _decode_error_message(exc: Exception) -> str:
+    if isinstance(exc, ImageRejected):
+        return exc.message
+    if isinstance(exc, UnidentifiedImageError):
+        return "Unable to read image file. The file may be corrupted or not a valid image format. Please try a different image."
+    return f"Unable to process image file: {str(exc)}. Please ensure the file is a valid image and try again."
+
+
+@app.post("/detect/batch")
+async def detect_batch(files: List[UploadFile] = File(...)) -> JSONResponse:
+    """
+    Detect ingredients in several photos of one session (fridge, pantry, counter, ...)
+    with a single batched model call.
+    Returns the merged, deduplicated ingredient list and the detections of every image.
+    """
+    _check_batch_size(files)
+    uploads = [await _read_upload(file) for file in files]
+    quality = quality_controller.select()
+    try:
+        per_image = await _detect_many_with_cache(uploads, quality)
+    except InferenceQueueFull as exc:
+        logger.warning(f"Rejecting batch upload: {exc}")
+        raise HTTPException(
+            status_code=503,
+            detail="The server is busy processing other images. Please try again in a moment.",
+        ) from exc
+    except RuntimeError as exc:
+        logger.error(f"Runtime error during batch ingredient detection: {exc}", exc_info=True)
+        raise HTTPException(status_code=500, detail="Ingredient detection failed. Please try again.") from exc
+
+    images: List[Dict[str, Any]] = []
+    for file, result in zip(files, per_image):
+        if isinstance(result, ImageRejected):
+            images.append({"filename": file.filename, "rejected": result.reason, "error": result.message})
+        elif isinstance(result, Exception):
+            images.append({"filename": file.filename, "error": _decode_error_message(result)})
+        else:
+            images.append({
+                "filename": file.filename,
+                "ingredients": [detection.name for detection in result],
+                "detections": [detection.as_dict() for detection in result],
+            })
+
+    merged = merge_image_detections([result for result in per_image if not isinstance(result, Exception)])
+    return JSONResponse(
+        status_code=200,
+        content={
+            "ingredients": [detection.name for detection in merged],
+            "detections": [detection.as_dict() for detection in merged],
+            "images": images,
+            "detectionQuality": quality.as_dict(),
+        },
+    )
+
+
+async def _spool_upload(file: UploadFile, destination: Any, max_bytes: int, too_large: str) -> int:
+    """Copy an upload to a file in chunks; a 400 with `too_large` once it exceeds max_bytes."""
+    written = 0
+    while True:
+        chunk = await file.read(1024 * 1024)
+        if not chunk:
+            break
+        written += len(chunk)
+        if written > max_bytes:
+            raise HTTPException(status_code=400, detail=too_large)
+        destination.write(chunk)
+    destination.flush()
+    return written
+
+
+async def _spool_video(file: UploadFile, destination: Any) -> None:
+    """Copy an uploaded video to a temporary file in chunks, enforcing the size limit."""
+    await _spool_upload(
+        file, destination, VIDEO_MAX_FILE_SIZE_MB * 1024 * 1024,
+        f"Video is too large. Maximum size is {VIDEO_MAX_FILE_SIZE_MB}MB.",
+    )
+
+
+async def _spool_frames(frames: List[UploadFile], directory: str) -> List[str]:
+    """
+    Copy uploaded frames to one file each in `directory` (in order), enforcing the
+    per-image limit and VIDEO_MAX_FILE_SIZE_MB for the whole sequence.
+    """
+    remaining = VIDEO_MAX_FILE_SIZE_MB * 1024 * 1024
+    paths: List[str] = []
+    for index, frame in enumerate(frames):
+        if not frame.content_type or not frame.content_type.startswith("image/"):
+            raise HTTPException(status_code=400, detail="Uploaded file must be an image.")
+        if MAX_FILE_SIZE <= remaining:
+            limit, too_large = MAX_FILE_SIZE, "File is too large. Maximum size is 10MB."
+        else:
+            limit = remaining
+            too_large = f"Frames are too large in total. Maximum size is {VIDEO_MAX_FILE_SIZE_MB}MB."
+        path = os.path.join(directory, f"{index:04d}")
+        with open(path, "wb") as destination:
+            remaining -= await _spool_upload(frame, destination, limit, too_large)
+        paths.append(path)
+    return paths
+
+
+@app.post("/detect/video")
+async def detect_video(
+    file: Optional[UploadFile] = File(None),
+    frames: Optional[List[UploadFile]] = File(None),
+) -> JSONResponse:
+    """
+    Detect ingredients in a short sweep video (`file`) or in a sequence of still
+    frames (`frames`, in order). Frames are sampled adaptively, near-duplicates are
+    skipped, and an ingredient must be seen in several frames to be reported.
+    """
+    if not file and not frames:
+        raise HTTPException(status_code=400, detail="Upload a video file or a sequence of frames.")
+
+    try:
+        if file:
+            if not file.content_type or not file.content_type.startswith("video/"):
+                raise HTTPException(status_code=400, detail="Uploaded file must be a video.")
+            # OpenCV reads from a path; the clip is streamed to disk instead of held in memory
+            suffix = os.path.splitext(file.filename or "")[1] or ".mp4"
+            with tempfile.NamedTemporaryFile(suffix=suffix) as video_file:
+                await _spool_video(file, video_file)
+                result = await run_inference(detect_ingredients_from_video, video_file.name)
+        else:
+            if len(frames) > VIDEO_MAX_FRAME_UPLOADS:  # type: ignore[arg-type]
+                raise HTTPException(status_code=400, detail=f"Too many frames. Upload at most {VIDEO_MAX_FRAME_UPLOADS}.")
+            # Spooled to disk and decoded one at a time by the job, so neither this process
+            # nor an inference worker holds the whole sequence (only paths are sent to it)
+            with tempfile.TemporaryDirectory(prefix="frames-") as frames_dir:
+                paths = await _spool_frames(frames, frames_dir)  # type: ignore[arg-type]
+                result = await run_inference(detect_ingredients_from_frames, paths)
+    except (UnidentifiedImageError, ImageDecodeError) as exc:
+        detail = str(exc) if file else _decode_error_message(exc)
+        raise HTTPException(status_code=400, detail=detail) from exc
+    except InferenceQueueFull as exc:
+        logger.warning(f"Rejecting video upload: {exc}")
+        raise HTTPException(
+            status_code=503,
+            detail="The server is busy processing other images. Please try again in a moment.",
+        ) from exc
+    except RuntimeError as exc:
+        logger.error(f"Runtime error during video ingredient detection: {exc}", exc_info=True)
+        raise HTTPException(status_code=500, detail="Ingredient detection failed. Please try again.") from exc
+    except HTTPException:
+        raise
+    except Exception as exc:  # noqa: BLE001
+        logger.error(f"Unexpected error during video ingredient detection: {exc}", exc_info=True)
+        raise HTTPException(status_code=500, detail="Ingredient detection failed. Please try again.") from exc
+
+    normalized = await _ai_normalized_names([detection.name for detection in result.detections])
+    if normalized is not None:
+        # A renamed ingredient keeps the most frames any of its detected names was seen in
+        frames_seen: Dict[str, int] = {}
+        for name, seen in result.frames_seen.items():
+            target = (normalized.get(name) or name).lower()
+            frames_seen[target] = max(frames_seen.get(target, 0), seen)
+        detections = merge_by_ingredient(result.detections, normalized)
+        result = result._replace(detections=detections, frames_seen=frames_seen)
+
+    return JSONResponse(
+        status_code=200,
+        content={
+            "ingredients": [detection.name for detection in result.detections],
+            "detections": [
+                {**detection.as_dict(), "framesSeen": result.frames_seen.get(detection.name.lower(), 0)}
+                for detection in result.detections
+            ],
+            "frames": result.stats,
+        },
+    )
+
+
 @app.options("/recommend")
 async def recommend_recipes_options():
     """Handle CORS preflight requests."""
@@ -69,62 +510,113 @@ async def recommend_recipes_options():
     )
 
 
-@app.post("/recommend")
-async def recommend_recipes(
-    file: Optional[UploadFile] = File(None),
-    extra_ingredients: Optional[str] = Form(None),
-    dietary_preferences: Optional[str] = Form(None),
-) -> JSONResponse:
+class _RecommendInput(NamedTuple):
+    """Ingredients and detection details gathered for a recipe request."""
+
+    merged: List[str]
+    detected_ingredients: List[str]
+    user_ingredients: List[str]
+    dietary_list: List[str]
+    detections: List[IngredientDetection]
+    image_detections: List[Dict[str, Any]]
+    quality: Optional[QualityLevel]
+    # Set when the pre-screen finds the photo(s) too dark, blank or blurry to run the model on
+    rejection: Optional[ImageRejected]
+    # Shown when detection failed but manually added ingredients are used
+    message: Optional[str]
+
+    def detection_fields(self, include_detections: bool) -> Dict[str, Any]:
+        """Optional detection details added to a response."""
+        fields: Dict[str, Any] = {}
+        if include_detections:
+            fields["detections"] = [detection.as_dict() for detection in self.detections]
+            if self.image_detections:
+                fields["imageDetections"] = self.image_detections
+        if self.quality is not None:
+            fields["detectionQuality"] = self.quality.as_dict()
+        return fields
+
+    def no_ingredients_content(self, had_uploads: bool) -> Dict[str, Any]:
+        """Response content when neither detection nor the user provided any ingredient."""
+        message = "No ingredients detected from the image. Please add ingredients manually or try uploading a clearer image with visible ingredients."
+        if had_uploads:
+            message = "No ingredients were detected in your image. Please add ingredients manually or try uploading a different image with clearly visible ingredients."
+        if self.rejection is not None:
+            message = self.rejection.message
+        content: Dict[str, Any] = {
+            "ingredients": [],
+            "detectedIngredients": [],
+            "manualIngredients": [],
+            "recipes": [],
+            "message": message,
+        }
+        if self.quality is not None:
+            content["detectionQuality"] = self.quality.as_dict()
+        if self.rejection is not None:
+            content["imageRejected"] = self.rejection.reason
+        return content
+
+
+async def _gather_ingredients(
+    uploads: List[UploadFile],
+    extra_ingredients: Optional[str],
+    dietary_preferences: Optional[str],
+) -> _RecommendInput:
     """
-    Main endpoint:
-    - Accepts an optional image file and optional comma-separated extra ingredients.
-    - Detects ingredients via YOLO if image is provided.
-    - Merges + deduplicates all ingredients.
-    - Queries Gemini to generate recipe ideas.
+    Detect ingredients in the uploaded images, then merge them with the
+    manually added ones (steps 1-4 of a recipe request).
+
+    Raises:
+        HTTPException: For undecodable images (400) or a full inference queue (503).
     """
     detected_ingredients: List[str] = []
+    detections: List[IngredientDetection] = []
+    image_detections: List[Dict[str, Any]] = []
+    quality: Optional[QualityLevel] = None
+    rejection: Optional[ImageRejected] = None
     
-    # 1) YOLO ingredient detection (only if image is provided)
-    if file:
-        if not file.content_type or not file.content_type.startswith("image/"):
-            raise HTTPException(status_code=400, detail="Uploaded file must be an image.")
-        
+    # 1) YOLO ingredient detection (only if images are provided)
+    if uploads:
         # Read file contents to check size and process
-        contents = await file.read()
-        MAX_FILE_SIZE = 10 * 1024 * 1024  # 10MB
-        if len(contents) > MAX_FILE_SIZE:
-            size_mb = len(contents) / (1024 * 1024)
-            raise HTTPException(
-                status_code=400,
-                detail=f"File is too large ({size_mb:.2f}MB). Maximum size is 10MB."
-            )
+        contents_list = [await _read_upload(upload) for upload in uploads]
 
-        # Process image fully in-memory with optimization
+        # Decode + run YOLO detection on the inference executor so the event loop stays free
+        detected_ingredients = []
+        # Under load, detection runs at a reduced inference size instead of timing out
+        quality = quality_controller.select()
         try:
-            img = Image.open(io.BytesIO(contents)).convert("RGB")
-            # Resize large images early to reduce memory usage and processing time
-            # YOLO model works best with 640px max dimension anyway
-            w, h = img.size
-            max_dimension = 1920  # Resize if larger than 1920px to reduce processing overhead
-            if w > max_dimension or h > max_dimension:
-                scale = min(max_dimension / float(w), max_dimension / float(h))
-                new_w, new_h = int(w * scale), int(h * scale)
-                img = img.resize((new_w, new_h), Image.Resampling.LANCZOS)
-        except UnidentifiedImageError as exc:
-            raise HTTPException(
-                status_code=400,
-                detail="Unable to read image file. The file may be corrupted or not a valid image format. Please try a different image."
-            ) from exc
-        except Exception as exc:  # noqa: BLE001
+            if len(contents_list) == 1:
+                detections, quality = await _detect_with_cache(contents_list[0], quality)
+            else:
+                per_image = await _detect_many_with_cache(contents_list, quality)
+                usable = []
+                for upload, result in zip(uploads, per_image):
+                    if isinstance(result, ImageRejected):
+                        # Skip this photo; the others may still show ingredients
+                        rejection = result
+                        image_detections.append({"filename": upload.filename, "rejected": result.reason})
+                        continue
+                    if isinstance(result, Exception):
+                        logger.warning(f"Could not decode uploaded image {upload.filename}: {result}")
+                        raise result
+                    usable.append(result)
+                    image_detections.append({
+                        "filename": upload.filename,
+                        "detections": [detection.as_dict() for detection in result],
+                    })
+                detections = merge_image_detections(usable)
+            detected_ingredients = [detection.name for detection in detections]
+        except ImageRejected as exc:
+            logger.info(f"Upload rejected by pre-screen ({exc.reason}): {exc.metrics}")
+            rejection = exc
+        except (UnidentifiedImageError, ImageDecodeError) as exc:
+            raise HTTPException(status_code=400, detail=_decode_error_message(exc)) from exc
+        except InferenceQueueFull as exc:
+            logger.warning(f"Rejecting image upload: {exc}")
             raise HTTPException(
-                status_code=400,
-                detail=f"Unable to process image file: {str(exc)}. Please ensure the file is a valid image and try again."
+                status_code=503,
+                detail="The server is busy processing other images. Please try again in a moment.",
             ) from exc
-
-        # Run YOLO detection
-        detected_ingredients = []
-        try:
-            detected_ingredients = detect_ingredients(img)
         except FileNotFoundError as exc:
             logger.error(f"Model file not found: {exc}", exc_info=True)
             # Continue with manual ingredients if available
@@ -158,26 +650,12 @@ async def recommend_recipes(
                 if name and name.strip():
                     user_ingredients.append(name.strip())
 
-    # If nothing at all, ask user to add something
-    if not detected_ingredients and not user_ingredients:
-        message = "No ingredients detected from the image. Please add ingredients manually or try uploading a clearer image with visible ingredients."
-        if file:
-            message = "No ingredients were detected in your image. Please add ingredients manually or try uploading a different image with clearly visible ingredients."
-        return JSONResponse(
-            status_code=200,
-            content={
-                "ingredients": [],
-                "detectedIngredients": [],
-                "manualIngredients": [],
-                "recipes": [],
-                "message": message,
-            },
-        )
-    
     # Provide helpful message if YOLO failed but user has manual ingredients
     yolo_failed_message = None
-    if file and not detected_ingredients and user_ingredients:
+    if uploads and not detected_ingredients and user_ingredients:
         yolo_failed_message = "Could not detect ingredients from the image, but using your manually added ingredients."
+        if rejection is not None:
+            yolo_failed_message = f"{rejection.message} Using your manually added ingredients for now."
 
     # 3) Merge + deduplicate
     # Track which ingredients came from which source for better UX
@@ -205,12 +683,16 @@ async def recommend_recipes(
     dietary_list: List[str] = []
     if dietary_preferences:
         dietary_list = [p.strip() for p in dietary_preferences.split(",") if p.strip()]
-    
-    # 5) Query Gemini to generate recipe ideas based on ingredients
-    try:
-        client = GeminiClient()
-        raw_recipes = client.generate_recipes(merged, dietary_preferences=dietary_list)
-    except RuntimeError as exc:
+
+    return _RecommendInput(
+        merged, detected_ingredients, user_ingredients, dietary_list,
+        detections, image_detections, quality, rejection, yolo_failed_message,
+    )
+
+
+def _recipe_service_error(exc: Exception) -> HTTPException:
+    """Map a recipe generation failure to the HTTP error returned to the client."""
+    if isinstance(exc, RuntimeError):
         error_msg = str(exc).lower()
         if "timeout" in error_msg or "timed out" in error_msg:
             detail = "Recipe generation timed out. Please try again with fewer ingredients or try again later."
@@ -220,52 +702,124 @@ async def recommend_recipes(
             detail = "API authentication failed. Please contact support."
         else:
             detail = f"Recipe generation service error: {exc}. Please try again."
-        raise HTTPException(
-            status_code=502,
-            detail=detail,
-        ) from exc
-    except requests.exceptions.Timeout as exc:
-        raise HTTPException(
-            status_code=504,
-            detail="Request to recipe service timed out. Please try again.",
-        ) from exc
-    except requests.exceptions.ConnectionError as exc:
-        raise HTTPException(
+        return HTTPException(status_code=502, detail=detail)
+    if isinstance(exc, httpx.TimeoutException):
+        return HTTPException(status_code=504, detail="Request to recipe service timed out. Please try again.")
+    if isinstance(exc, httpx.TransportError):
+        return HTTPException(
             status_code=503,
             detail="Unable to connect to recipe service. Please check your connection and try again.",
-        ) from exc
+        )
+    logger.error(f"Unexpected error while generating recipes: {exc}", exc_info=True)
+    return HTTPException(
+        status_code=500,
+        detail="An unexpected error occurred while generating recipes. Please try again.",
+    )
+
+
+async def _generate_and_learn(ingredients: List[str], dietary_list: List[str]) -> List[Dict[str, Any]]:
+    recipes = await get_client().generate_recipes_async(
+        ingredients, dietary_preferences=dietary_list, summary=RECIPE_SUMMARY_MODE
+    )
+    # Summaries have no steps; their details are learned once generated (see /recipes/{id})
+    if RECIPE_CORPUS_LEARN and recipes and not RECIPE_SUMMARY_MODE:
+        await asyncio.to_thread(get_recipe_corpus().learn, recipes, dietary_list)
+    return recipes
+
+
+async def _search_corpus(request: _RecommendInput) -> List[Dict[str, Any]]:
+    if RECIPE_CORPUS_MIN_RESULTS <= 0:
+        return []
+    # Off the event loop: the first search may still be waiting for the corpus to load
+    return await asyncio.to_thread(lambda: get_recipe_corpus().search(request.merged, request.dietary_list))
+
+
+async def _recommend(request: _RecommendInput) -> Tuple[List[Dict[str, Any]], str]:
+    """
+    Recipes for the request and where they came from ("corpus" or "gemini").
+    The local corpus answers when it has enough matches; otherwise Gemini does,
+    unless it is slower than RECIPE_CORPUS_HEDGE_MS and the corpus has some
+    matches, or it fails and the corpus has some matches.
+    """
+    local = await _search_corpus(request)
+    if RECIPE_CORPUS_MIN_RESULTS > 0 and len(local) >= RECIPE_CORPUS_MIN_RESULTS:
+        return local, "corpus"
+
+    generation = asyncio.ensure_future(_generate_and_learn(request.merged, request.dietary_list))
+    try:
+        if local and RECIPE_CORPUS_HEDGE_MS > 0:
+            done, _ = await asyncio.wait({generation}, timeout=RECIPE_CORPUS_HEDGE_MS / 1000)
+            get_recipe_corpus().record_hedge(won=not done)
+            if not done:
+                # Gemini keeps going in the background and still fills the caches and the corpus
+                generation.add_done_callback(lambda task: task.cancelled() or task.exception())
+                return local, "corpus"
+        return await generation, "gemini"
     except Exception as exc:  # noqa: BLE001
-        logger.error(f"Unexpected error while generating recipes: {exc}", exc_info=True)
-        raise HTTPException(
-            status_code=500,
-            detail="An unexpected error occurred while generating recipes. Please try again.",
-        ) from exc
+        if not local:
+            raise
+        logger.warning(f"Recipe generation failed, answering from the local corpus: {exc}")
+        return local, "corpus"
+
+
+@app.post("/recommend")
+async def recommend_recipes(
+    file: Optional[UploadFile] = File(None),
+    files: Optional[List[UploadFile]] = File(None),
+    extra_ingredients: Optional[str] = Form(None),
+    dietary_preferences: Optional[str] = Form(None),
+    include_detections: bool = Form(False),
+) -> JSONResponse:
+    """
+    Main endpoint:
+    - Accepts an optional image file (or several as `files`) and optional comma-separated extra ingredients.
+    - Detects ingredients via YOLO if images are provided (several images in one batched call)
+      (with include_detections=true, per-ingredient confidence, count and boxes are returned too).
+    - Merges + deduplicates all ingredients.
+    - Answers from the local recipe corpus if it has enough matches, otherwise queries Gemini
+      (with RECIPE_SUMMARY_MODE, for summaries marked `"summary": true`, see /recipes/{id}).
+    """
+    uploads = ([file] if file else []) + (files or [])
+    _check_batch_size(uploads)
+    request = await _gather_ingredients(uploads, extra_ingredients, dietary_preferences)
+
+    # If nothing at all, ask user to add something
+    if not request.merged:
+        return JSONResponse(status_code=200, content=request.no_ingredients_content(bool(uploads)))
+
+    # 5) Look the ingredients up in the local corpus, or query Gemini to generate recipe ideas
+    try:
+        raw_recipes, source = await _recommend(request)
+    except Exception as exc:  # noqa: BLE001
+        raise _recipe_service_error(exc) from exc
+    logger.info(f"/recommend answered from {source}: {len(raw_recipes)} recipes")
 
     if not raw_recipes:
-        return JSONResponse(
-            status_code=200,
-            content={
-                "ingredients": merged,
-                "detectedIngredients": detected_ingredients,
-                "manualIngredients": user_ingredients,
-                "recipes": [],
-                "message": "No recipes found for these ingredients.",
-            },
-        )
+        content = {
+            "ingredients": request.merged,
+            "detectedIngredients": request.detected_ingredients,
+            "manualIngredients": request.user_ingredients,
+            "recipes": [],
+            "message": "No recipes found for these ingredients.",
+        }
+        content.update(request.detection_fields(include_detections))
+        return JSONResponse(status_code=200, content=content)
     
     # Gemini client already returns normalized recipes, with coverageScore etc.
     top5 = raw_recipes[:5]
 
     response_content = {
-        "ingredients": merged,
-        "detectedIngredients": detected_ingredients,
-        "manualIngredients": user_ingredients,
+        "ingredients": request.merged,
+        "detectedIngredients": request.detected_ingredients,
+        "manualIngredients": request.user_ingredients,
         "recipes": top5,
         "fallback": False,
+        "recipeSource": source,
     }
+    response_content.update(request.detection_fields(include_detections))
     
-    if yolo_failed_message:
-        response_content["message"] = yolo_failed_message
+    if request.message:
+        response_content["message"] = request.message
     
     return JSONResponse(
         status_code=200,
@@ -273,3 +827,102 @@ async def recommend_recipes(
     )
 
 
+def _sse_event(event: str, data: Any) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+@app.post("/recommend/stream")
+async def recommend_recipes_stream(
+    file: Optional[UploadFile] = File(None),
+    files: Optional[List[UploadFile]] = File(None),
+    extra_ingredients: Optional[str] = Form(None),
+    dietary_preferences: Optional[str] = Form(None),
+    include_detections: bool = Form(False),
+) -> StreamingResponse:
+    """
+    Streaming variant of /recommend (same form fields), answered as server-sent events:
+    - `ingredients`: merged/detected/manual ingredients (and detection details), sent first
+    - `recipe`: one normalized recipe, sent as soon as Gemini has finished writing it
+      (or right away when the local recipe corpus has enough matches)
+    - `done`: recipe count (and a message, e.g. when no ingredients were found)
+    - `error`: the same detail /recommend would return with its error status
+    Upload errors (bad image, full inference queue) are still plain HTTP errors.
+    """
+    uploads = ([file] if file else []) + (files or [])
+    _check_batch_size(uploads)
+    request = await _gather_ingredients(uploads, extra_ingredients, dietary_preferences)
+
+    async def events() -> AsyncIterator[str]:
+        if not request.merged:
+            content = request.no_ingredients_content(bool(uploads))
+            message = content.pop("message")
+            content.pop("recipes")
+            yield _sse_event("ingredients", content)
+            yield _sse_event("done", {"count": 0, "message": message})
+            return
+
+        ingredients_event: Dict[str, Any] = {
+            "ingredients": request.merged,
+            "detectedIngredients": request.detected_ingredients,
+            "manualIngredients": request.user_ingredients,
+        }
+        ingredients_event.update(request.detection_fields(include_detections))
+        if request.message:
+            ingredients_event["message"] = request.message
+        yield _sse_event("ingredients", ingredients_event)
+
+        local = await _search_corpus(request)
+        if RECIPE_CORPUS_MIN_RESULTS > 0 and len(local) >= RECIPE_CORPUS_MIN_RESULTS:
+            logger.info(f"/recommend/stream answered from corpus: {len(local)} recipes")
+            for recipe in local:
+                yield _sse_event("recipe", recipe)
+            yield _sse_event("done", {"count": len(local)})
+            return
+
+        streamed: List[Dict[str, Any]] = []
+        try:
+            async for recipe in get_client().generate_recipes_stream(
+                request.merged, dietary_preferences=request.dietary_list, summary=RECIPE_SUMMARY_MODE
+            ):
+                # Keep consuming past the fifth recipe so the complete answer still gets cached
+                if len(streamed) < 5:
+                    yield _sse_event("recipe", recipe)
+                streamed.append(recipe)
+        except Exception as exc:  # noqa: BLE001
+            error = _recipe_service_error(exc)
+            yield _sse_event("error", {"status": error.status_code, "detail": error.detail})
+            return
+        logger.info(f"/recommend/stream answered from gemini: {len(streamed)} recipes")
+        if RECIPE_CORPUS_LEARN and not RECIPE_SUMMARY_MODE and streamed:
+            await asyncio.to_thread(get_recipe_corpus().learn, streamed, request.dietary_list)
+        count = len(streamed)
+        done: Dict[str, Any] = {"count": min(count, 5)}
+        if not count:
+            done["message"] = "No recipes found for these ingredients."
+        yield _sse_event("done", done)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@app.get("/recipes/{recipe_id}")
+async def recipe_details(recipe_id: str) -> dict:
+    """
+    Full recipe (ingredient quantities and steps) for a summary returned by
+    /recommend, generated the first time it is opened and cached after that.
+    404 if the ID isn't a summary seen within the recipe cache TTL.
+    """
+    if not _RECIPE_ID.fullmatch(recipe_id):
+        raise HTTPException(status_code=404, detail="Unknown recipe.")
+    try:
+        details = await get_client().generate_recipe_details_async(recipe_id)
+    except Exception as exc:  # noqa: BLE001
+        raise _recipe_service_error(exc) from exc
+    if details is None:
+        raise HTTPException(status_code=404, detail="Unknown or expired recipe. Please search again.")
+    if RECIPE_CORPUS_LEARN:
+        await asyncio.to_thread(get_recipe_corpus().learn, [details["recipe"]], details["dietary"])
+    return {"recipe": details["recipe"]}
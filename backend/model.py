@@ -1,20 +1,91 @@
 import logging
 import os
-from functools import lru_cache
-from typing import List
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from functools import lru_cache, partial
+from typing import Any, Dict, Iterator, List, Optional, Tuple, Union
 
-from PIL import Image
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - Windows development machines
+    fcntl = None  # type: ignore[assignment]
+
+import numpy as np
+import torch
+from PIL import Image, UnidentifiedImageError
 from ultralytics import YOLO
+from ultralytics.engine.results import Results
 
-from ingredient_normalizer import normalize_ingredients_batch
+from detections import (
+    ClassDetection,
+    IngredientDetection,
+    group_detections,
+    merge_by_ingredient,
+    min_confidence_threshold,
+)
+from image_prescreen import ImageRejected, check_image
+from image_preprocessing import (  # noqa: F401 (ImageDecodeError is re-exported)
+    ImageDecodeError,
+    crop_array,
+    peek_image_size,
+    prepare_image,
+    to_model_array,
+    track_copies,
+)
+from inference_batcher import ENABLE_YOLO_BATCHING, YOLO_BATCH_MAX_SIZE, YOLO_BATCH_MAX_WAIT_MS, MicroBatcher
+from inference_pool import INFERENCE_POOL_ADDRESS, InferencePoolClient, InferencePoolError
+from ingredient_normalizer import normalize_ingredients_mapping
+from tiling import (
+    YOLO_TILE_SIZE,
+    YOLO_TILING_MAX_SIDE,
+    class_aware_nms,
+    make_tiles,
+    should_tile,
+)
 
 logger = logging.getLogger(__name__)
 
+# Inference runtime: "torch" (default), "onnx", "openvino" or "onnx-int8"
+# ("onnx-int8" must be built first with `python model_tools.py quantize`)
+YOLO_BACKENDS = ("torch", "onnx", "openvino", "onnx-int8")
+YOLO_BACKEND = os.environ.get("YOLO_BACKEND", "torch").lower()
+# Longest image side used for inference (and for exported models)
+INFERENCE_IMAGE_SIZE = int(os.environ.get("YOLO_IMAGE_SIZE", "640"))
+
+# Load the model and run warmup inferences at startup instead of on the first request
+PRELOAD_MODEL = os.environ.get("PRELOAD_MODEL", "true").lower() == "true"
+MODEL_WARMUP_RUNS = int(os.environ.get("MODEL_WARMUP_RUNS", "2"))
+
+# Threads decoding the images of a multi-image upload in parallel
+IMAGE_DECODE_THREADS = int(os.environ.get("IMAGE_DECODE_THREADS", "4"))
+
+# Send inference to the shared worker pool (inference_pool.py) instead of loading
+# the model in this process
+USE_INFERENCE_POOL = bool(INFERENCE_POOL_ADDRESS)
+
+# The YOLO predictor is not thread-safe; serialize direct (non-batched) calls
+_model_lock = threading.Lock()
+
 
-@lru_cache(maxsize=1)
 def get_model() -> YOLO:
     """
     Lazily load the custom YOLO model for ingredient detection.
+    Safe to call from several inference threads at once.
+    """
+    with _model_lock:
+        return _load_model()
+
+
+@lru_cache(maxsize=1)
+def _load_model() -> YOLO:
+    return load_model(YOLO_BACKEND)
+
+
+def resolve_model_path() -> str:
+    """
+    Return the absolute path of the PyTorch weights (MODEL_PATH or backend/my_model.pt).
     """
     model_path = os.environ.get("MODEL_PATH")
     
@@ -32,8 +103,88 @@ def get_model() -> YOLO:
             f"Model file not found at {model_path}. "
             f"Please set MODEL_PATH environment variable or place my_model.pt in the backend directory."
         )
+    return model_path
+
+
+def exported_model_path(model_path: str, backend: str) -> str:
+    """Location of the cached export of `model_path` for the given backend (next to the weights)."""
+    stem = os.path.splitext(model_path)[0]
+    if backend == "onnx":
+        return f"{stem}.onnx"
+    if backend == "openvino":
+        return f"{stem}_openvino_model"
+    if backend == "onnx-int8":
+        return f"{stem}.int8.onnx"
+    raise ValueError(f"Unsupported YOLO backend '{backend}'. Choose one of: {', '.join(YOLO_BACKENDS)}")
+
+
+def export_model(model_path: str, backend: str) -> str:
+    """
+    Export the PyTorch weights for `backend` once and return the cached artifact path.
+    The export is redone when the weights are newer than the cached artifact.
+    """
+    target = exported_model_path(model_path, backend)
+    if backend == "onnx-int8":
+        # Quantization needs calibration images, so it is never done implicitly
+        if not os.path.exists(target):
+            raise FileNotFoundError(
+                f"Quantized model not found at {target}. "
+                f"Build it with: python model_tools.py quantize --calibration-dir <images>"
+            )
+        if os.path.getmtime(target) < os.path.getmtime(model_path):
+            logger.warning(f"Quantized model {target} is older than {model_path}; re-run quantize")
+        return target
+
+    with _export_lock(model_path):
+        if os.path.exists(target) and os.path.getmtime(target) >= os.path.getmtime(model_path):
+            return target
+
+        logger.info(f"Exporting {model_path} to {backend} (one-time, cached at {target})")
+        # dynamic=True keeps batched and reduced-size inference working on the exported model
+        exported = YOLO(model_path).export(
+            format=backend,
+            imgsz=INFERENCE_IMAGE_SIZE,
+            dynamic=True,
+            verbose=False,
+        )
+        return str(exported)
+
+
+@contextmanager
+def _export_lock(model_path: str) -> Iterator[None]:
+    """Stop several worker processes from exporting the same model at once."""
+    if fcntl is None:
+        yield
+        return
+    with open(f"{os.path.splitext(model_path)[0]}.export.lock", "w") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def load_model(backend: str = "torch", fallback: bool = True) -> YOLO:
+    """
+    Load the ingredient model with the given inference backend (see YOLO_BACKENDS).
+
+    Non-torch backends are exported from the PyTorch weights on first use. If export or
+    loading fails, the PyTorch model is used instead, unless `fallback` is False: tools
+    that measure a backend must fail rather than silently measure PyTorch.
+    """
+    model_path = resolve_model_path()
     
     try:
+        if backend != "torch":
+            try:
+                model = YOLO(export_model(model_path, backend), task="detect")
+                logger.info(f"YOLO model loaded with {backend} backend: {len(model.names)} classes")
+                return model
+            except Exception as e:
+                if not fallback:
+                    raise
+                logger.error(f"Failed to load {backend} backend, falling back to torch: {e}")
+
         model = YOLO(model_path)
         logger.info(f"YOLO model loaded: {len(model.names)} classes")
         return model
@@ -42,7 +193,142 @@ def get_model() -> YOLO:
         raise
 
 
-def resize_image_for_inference(img: Image.Image, max_size: int = 640) -> Image.Image:
+def _predict_batch(images: List[Any], **kwargs: Any) -> List[Any]:
+    """Run one batched forward pass and return one result per image."""
+    return get_model()(images, verbose=False, **kwargs)
+
+
+@lru_cache(maxsize=1)
+def get_batcher() -> MicroBatcher:
+    """
+    Lazily start the micro-batcher that groups concurrent inference calls.
+    """
+    return MicroBatcher(
+        _predict_batch,
+        max_batch_size=YOLO_BATCH_MAX_SIZE,
+        max_wait_ms=YOLO_BATCH_MAX_WAIT_MS,
+    )
+
+
+@lru_cache(maxsize=1)
+def get_pool_client() -> InferencePoolClient:
+    """Client of the shared inference pool (only used when INFERENCE_POOL_ADDRESS is set)."""
+    return InferencePoolClient(INFERENCE_POOL_ADDRESS)
+
+
+def _predict_pool(images: List[Any], **kwargs: Any) -> List[Results]:
+    """
+    Run images on the inference pool. Pixels travel through shared memory and the
+    returned boxes are wrapped in regular ultralytics Results.
+    """
+    client = get_pool_client()
+    arrays = [img if isinstance(img, np.ndarray) else to_model_array(img) for img in images]
+    names = client.names()
+    return [
+        Results(orig_img=pixels, path="", names=names, boxes=torch.from_numpy(data))
+        for pixels, data in zip(arrays, client.predict_many(arrays, **kwargs))
+    ]
+
+
+def predict(img: Any, **kwargs: Any) -> Any:
+    """
+    Run the model on a single image, going through the inference pool or the
+    micro-batcher when enabled.
+    """
+    if USE_INFERENCE_POOL:
+        return _predict_pool([img], **kwargs)[0]
+    if ENABLE_YOLO_BATCHING:
+        return get_batcher().predict(img, **kwargs)
+    model = get_model()
+    with _model_lock:
+        return model([img], verbose=False, **kwargs)[0]
+
+
+def predict_many(images: List[Any], **kwargs: Any) -> List[Any]:
+    """
+    Run the model on several images as one batch (through the inference pool or the
+    micro-batcher when enabled).
+    """
+    if USE_INFERENCE_POOL:
+        return _predict_pool(images, **kwargs)
+    if ENABLE_YOLO_BATCHING:
+        batcher = get_batcher()
+        futures = [batcher.submit(img, **kwargs) for img in images]
+        return [future.result() for future in futures]
+    model = get_model()
+    with _model_lock:
+        return model(images, verbose=False, **kwargs)
+
+
+def get_batching_stats() -> Dict[str, Any]:
+    """Get batch-size and queue-wait statistics of the micro-batcher."""
+    if not ENABLE_YOLO_BATCHING:
+        return {"enabled": False}
+    return {"enabled": True, **get_batcher().stats()}
+
+
+def get_pool_stats() -> Dict[str, Any]:
+    """Get per-worker health and throughput statistics of the inference pool."""
+    if not USE_INFERENCE_POOL:
+        return {"enabled": False}
+    try:
+        return {"enabled": True, **get_pool_client().stats()}
+    except InferencePoolError as e:
+        return {"enabled": True, "error": str(e)}
+
+
+def get_pool_health() -> Optional[str]:
+    """None if the inference pool (when used) can serve detections, otherwise why it can't."""
+    if not USE_INFERENCE_POOL:
+        return None
+    try:
+        status = get_pool_client().ping()
+    except InferencePoolError as e:
+        return str(e)
+    if status.get("failed_workers"):
+        return (
+            f"{status['failed_workers']} of {status['workers']} inference pool workers "
+            "kept crashing on startup and were given up."
+        )
+    if not status["ready_workers"]:
+        return "No inference pool workers are ready."
+    return None
+
+
+def warmup_model(runs: int = MODEL_WARMUP_RUNS, imgsz: int = INFERENCE_IMAGE_SIZE) -> Dict[str, Any]:
+    """
+    Load the model and run `runs` dummy inferences at the configured image size so the
+    first real request doesn't pay for model load and allocator/JIT warmup.
+
+    Returns:
+        Load time and per-run warmup latency in milliseconds.
+    """
+    started = time.perf_counter()
+    if USE_INFERENCE_POOL:
+        # The pool workers load and warm up their own model
+        get_pool_client().wait_ready()
+    else:
+        get_model()
+    load_time_ms = (time.perf_counter() - started) * 1000
+
+    dummy = Image.new("RGB", (imgsz, imgsz), (114, 114, 114))
+    latencies: List[float] = []
+    for _ in range(max(0, runs)):
+        run_started = time.perf_counter()
+        predict(dummy, conf=0.25, imgsz=imgsz)
+        latencies.append(round((time.perf_counter() - run_started) * 1000, 2))
+
+    logger.info(f"Model warmed up: load {load_time_ms:.0f} ms, warmup runs {latencies} ms")
+    return {
+        "backend": "pool" if USE_INFERENCE_POOL else YOLO_BACKEND,
+        "image_size": imgsz,
+        "load_time_ms": round(load_time_ms, 2),
+        "warmup_runs": len(latencies),
+        "warmup_latency_ms": latencies,
+    }
+
+
+def resize_image_for_inference(img: Image.Image, max_size: int = INFERENCE_IMAGE_SIZE) -> Image.Image:
     """Resize image preserving aspect ratio so the longest side == max_size."""
     w, h = img.size
     scale = min(max_size / float(w), max_size / float(h), 1.0)
@@ -52,48 +338,245 @@ def resize_image_for_inference(img: Image.Image, max_size: int = 640) -> Image.I
     return img.resize((new_w, new_h))
 
 
-def detect_ingredients(img: Image.Image) -> List[str]:
+def get_confidence_threshold() -> float:
+    """
+    Confidence the model is run at: the lowest of YOLO_CONFIDENCE_THRESHOLD and the
+    per-class thresholds (read once, see detections.py). Stricter per-class
+    thresholds are applied afterwards.
+    """
+    return min_confidence_threshold()
+
+
+def _result_arrays(result: Any) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Boxes (xyxy), confidences and class ids of one result as numpy arrays."""
+    data = result.boxes.data.cpu().numpy()
+    return data[:, :4], data[:, 4], data[:, 5]
+
+
+def _detect_tiled(img: Image.Image, confidence_threshold: float) -> List[ClassDetection]:
     """
-    Run YOLO on the given PIL image and return a list of normalized ingredient names.
+    Run the model on overlapping native-resolution tiles plus a downscaled overview
+    of the whole image in one batch, merge the boxes with class-aware NMS and
+    group the kept boxes by class.
+    """
+    pixels = to_model_array(img)
+    height, width = pixels.shape[:2]
+    tiles = make_tiles(width, height)
+
+    # The overview keeps objects larger than a tile from being split into fragments
+    overview = resize_image_for_inference(img, max_size=YOLO_TILE_SIZE)
+    overview_scale = width / float(overview.width)
+    inputs = [to_model_array(overview)] + [crop_array(pixels, tile) for tile in tiles]
+    offsets = [(0, 0, overview_scale)] + [(x0, y0, 1.0) for x0, y0, _, _ in tiles]
+
+    results = predict_many(inputs, conf=confidence_threshold, imgsz=YOLO_TILE_SIZE)
+    names = results[0].names
+
+    all_boxes, all_scores, all_classes = [], [], []
+    for result, (dx, dy, scale) in zip(results, offsets):
+        xyxy, scores, classes = _result_arrays(result)
+        if len(scores) == 0:
+            continue
+        xyxy = xyxy * scale
+        xyxy += np.array([dx, dy, dx, dy], dtype=xyxy.dtype)
+        all_boxes.append(xyxy)
+        all_scores.append(scores)
+        all_classes.append(classes.astype(int))
+
+    if not all_boxes:
+        logger.warning(f"No ingredients detected in tiled mode ({len(tiles)} tiles)")
+        return []
+
+    boxes, scores, classes = np.concatenate(all_boxes), np.concatenate(all_scores), np.concatenate(all_classes)
+    keep = class_aware_nms(boxes, scores, classes)
+    logger.info(f"Tiled detection: {len(tiles)} tiles, {len(classes)} boxes merged into {len(keep)}")
+    return group_detections(boxes[keep], scores[keep], classes[keep], names, (width, height))
+
+
+def normalize_class_names(raw_classes: List[str]) -> Dict[str, str]:
+    """
+    Map raw model class names to normalized ingredient names with the dictionary
+    and the AI cache. Runs in the inference workers, so it never calls Gemini:
+    with ENABLE_AI_NORMALIZATION, the names it doesn't know are normalized by
+    Gemini on the event loop afterwards (see main._normalize_detections).
+    """
+    return normalize_ingredients_mapping(raw_classes, use_ai=False)
+
+
+def detect_ingredients_detailed(
+    img: Union[Image.Image, np.ndarray],
+    tiled: bool = False,
+    image_size: int = INFERENCE_IMAGE_SIZE,
+    augment: bool = False,
+) -> List[IngredientDetection]:
+    """
+    Run YOLO on the given image and return per-ingredient detections (normalized
+    name, highest confidence, instance count and boxes relative to the image size).
+
+    Accepts a PIL image or an already prepared uint8 BGR array (see to_model_array),
+    which is passed to the model without further conversion. With `tiled=True` the
+    (PIL) image is run as overlapping native-resolution tiles instead of being
+    downscaled to `image_size`. `augment` enables test-time augmentation.
     """
     try:
-        model = get_model()
-        resized = resize_image_for_inference(img)
-
-        # Run inference with confidence threshold (default 0.25 for YOLO)
-        confidence_threshold = float(os.environ.get("YOLO_CONFIDENCE_THRESHOLD", "0.25"))
-        results = model(resized, verbose=False, conf=confidence_threshold)[0]
-        names = results.names
-
-        raw_classes: List[str] = []
-        for box in results.boxes:
-            cls_idx = int(box.cls.item())
-            raw_name = names.get(cls_idx, "").strip()
-            if not raw_name:
-                continue
-            raw_classes.append(raw_name)
-        
-        if not raw_classes:
-            logger.warning(f"No ingredients detected from image ({len(results.boxes)} boxes found)")
-        
+        if not USE_INFERENCE_POOL:
+            get_model()
+
+        # Run at the lowest configured threshold; per-class thresholds are applied below
+        confidence_threshold = get_confidence_threshold()
+        if tiled and isinstance(img, Image.Image):
+            class_detections = _detect_tiled(img, confidence_threshold)
+        else:
+            resized = img if isinstance(img, np.ndarray) else resize_image_for_inference(img, image_size)
+            results = predict(resized, conf=confidence_threshold, imgsz=image_size, augment=augment)
+            height, width = results.orig_shape
+            xyxy, confidences, classes = _result_arrays(results)
+            class_detections = group_detections(xyxy, confidences, classes, results.names, (width, height))
+
+            if not class_detections:
+                logger.warning(f"No ingredients detected from image ({len(classes)} boxes found)")
+
+        raw_classes = [detection.name for detection in class_detections]
         logger.info(f"Detected {len(raw_classes)} ingredients: {raw_classes}")
+        return merge_by_ingredient(class_detections, normalize_class_names(raw_classes))
+    except FileNotFoundError as e:
+        raise RuntimeError(f"Model file error: {e}") from e
+    except Exception as e:
+        raise RuntimeError(f"Error during YOLO inference: {e}") from e
 
-        # IMPORTANT: Disable AI normalization by default to avoid rate limits
-        # AI normalization can be enabled via ENABLE_AI_NORMALIZATION=true env var
-        # Dictionary lookup handles most common ingredients without API calls
-        try:
-            # Default to False to avoid rate limits - dictionary lookup is sufficient for most cases
-            use_ai_default = os.environ.get("ENABLE_AI_NORMALIZATION", "false").lower() == "true"
-            normalized = normalize_ingredients_batch(raw_classes, use_ai=use_ai_default)
-            return normalized
-        except Exception as e:
-            logger.error(f"Error during ingredient normalization: {e}")
-            # Fallback: basic normalization without AI
-            normalized = normalize_ingredients_batch(raw_classes, use_ai=False)
-            return normalized
+
+def detect_ingredients(img: Union[Image.Image, np.ndarray], tiled: bool = False) -> List[str]:
+    """
+    Run YOLO on the given image and return a list of normalized ingredient names
+    (see detect_ingredients_detailed).
+    """
+    return [detection.name for detection in detect_ingredients_detailed(img, tiled=tiled)]
+
+
+def detect_ingredients_from_bytes(
+    contents: bytes,
+    image_size: int = INFERENCE_IMAGE_SIZE,
+    allow_tiling: bool = True,
+    augment: bool = False,
+) -> List[IngredientDetection]:
+    """
+    Decode uploaded image bytes and run ingredient detection on them.
+    Meant to be submitted to the inference executor as a single job.
+    `image_size`, `allow_tiling` and `augment` come from the adaptive quality level.
+
+    Raises:
+        ImageRejected: If the pre-screen finds the image too dark, blank or blurry.
+    """
+    with track_copies():
+        # Large photos may be run as native-resolution tiles (YOLO_TILING)
+        if allow_tiling and should_tile(peek_image_size(contents)):
+            img = prepare_image(contents, YOLO_TILING_MAX_SIDE)
+            check_image(img)
+            return detect_ingredients_detailed(img, tiled=True)
+
+        # Decodes straight to the inference size, so detect_ingredients doesn't resize again
+        img = prepare_image(contents, image_size)
+        pixels = to_model_array(img)
+    check_image(pixels)
+    return detect_ingredients_detailed(pixels, image_size=image_size, augment=augment)
+
+
+@lru_cache(maxsize=1)
+def _decode_pool() -> ThreadPoolExecutor:
+    # Pillow releases the GIL while decoding, so threads decode in parallel
+    return ThreadPoolExecutor(max_workers=IMAGE_DECODE_THREADS, thread_name_prefix="decode")
+
+
+def _decode_upload(contents: bytes, image_size: int, allow_tiling: bool) -> Union[Image.Image, np.ndarray, Exception]:
+    """
+    Decode one image of a multi-image upload: a model-ready array, a PIL image for
+    tiled detection, or the decode / pre-screen error if it is not a usable image.
+    """
+    try:
+        with track_copies():
+            if allow_tiling and should_tile(peek_image_size(contents)):
+                img: Union[Image.Image, np.ndarray] = prepare_image(contents, YOLO_TILING_MAX_SIDE)
+            else:
+                img = to_model_array(prepare_image(contents, image_size))
+        check_image(img)
+        return img
+    except (UnidentifiedImageError, ImageDecodeError, ImageRejected) as e:
+        return e
+
+
+def detect_classes_many(
+    images: List[np.ndarray],
+    image_size: int = INFERENCE_IMAGE_SIZE,
+    augment: bool = False,
+) -> List[List[ClassDetection]]:
+    """
+    Run model-ready arrays (see to_model_array) through the model in one batched call
+    and group the boxes kept by the per-class thresholds, per image and class.
+    """
+    if not images:
+        return []
+    results = predict_many(images, conf=get_confidence_threshold(), imgsz=image_size, augment=augment)
+    per_image = []
+    for result in results:
+        height, width = result.orig_shape
+        xyxy, confidences, classes = _result_arrays(result)
+        per_image.append(group_detections(xyxy, confidences, classes, result.names, (width, height)))
+    return per_image
+
+
+def detect_ingredients_batch_from_bytes(
+    uploads: List[bytes],
+    image_size: int = INFERENCE_IMAGE_SIZE,
+    allow_tiling: bool = True,
+    augment: bool = False,
+) -> List[Union[List[IngredientDetection], Exception]]:
+    """
+    Detect ingredients in several uploaded images (e.g. fridge, pantry and counter
+    photos of one session). The images are decoded in parallel and run through the
+    model in one batched call; raw class names of all images are normalized together.
+    Meant to be submitted to the inference executor as a single job.
+    `image_size`, `allow_tiling` and `augment` come from the adaptive quality level.
+
+    Returns:
+        Per image, its detections, or the UnidentifiedImageError / ImageDecodeError /
+        ImageRejected raised while decoding or pre-screening it.
+    """
+    decode = partial(_decode_upload, image_size=image_size, allow_tiling=allow_tiling)
+    decoded = list(_decode_pool().map(decode, uploads))
+    try:
+        if not USE_INFERENCE_POOL:
+            get_model()
+
+        per_image: Dict[int, List[ClassDetection]] = {}
+
+        batched = [i for i, item in enumerate(decoded) if isinstance(item, np.ndarray)]
+        batch = [decoded[i] for i in batched]
+        for i, detections in zip(batched, detect_classes_many(batch, image_size=image_size, augment=augment)):
+            per_image[i] = detections
+
+        for i, item in enumerate(decoded):
+            if isinstance(item, Image.Image):
+                per_image[i] = _detect_tiled(item, get_confidence_threshold())
+
+        raw_classes = [detection.name for detections in per_image.values() for detection in detections]
+        logger.info(f"Detected {len(raw_classes)} ingredients in {len(per_image)} images: {raw_classes}")
+        normalized = normalize_class_names(raw_classes)
     except FileNotFoundError as e:
         raise RuntimeError(f"Model file error: {e}") from e
     except Exception as e:
         raise RuntimeError(f"Error during YOLO inference: {e}") from e
 
+    return [
+        item if isinstance(item, Exception) else merge_by_ingredient(per_image[i], normalized)
+        for i, item in enumerate(decoded)
+    ]
+
 
+def merge_image_detections(per_image: List[List[IngredientDetection]]) -> List[IngredientDetection]:
+    """
+    Merge the detections of several images into one deduplicated ingredient list
+    (counts are summed). Boxes are dropped since they refer to different images.
+    """
+    detections = [detection for image_detections in per_image for detection in image_detections]
+    normalized = normalize_ingredients_mapping([detection.name for detection in detections], use_ai=False)
+    return [detection._replace(boxes=[]) for detection in merge_by_ingredient(detections, normalized)]
@@ -0,0 +1,388 @@
+"""
+Command-line tools for the ingredient detection model.
+
+Needs the optional runtimes (pip install -r requirements-backends.txt).
+
+Usage (from the backend directory):
+    python model_tools.py export --backend onnx
+    python model_tools.py parity --backends onnx openvino --image-dir ./photos
+    python model_tools.py quantize --calibration-dir ./calibration_images
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+import time
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+from PIL import Image, ImageDraw
+
+from model import (
+    INFERENCE_IMAGE_SIZE,
+    YOLO_BACKENDS,
+    export_model,
+    exported_model_path,
+    load_model,
+    resolve_model_path,
+)
+
+logger = logging.getLogger(__name__)
+
+# A detection only counts as a mismatch when its confidence is clearly above the
+# threshold; boxes hovering right at the threshold may legitimately flip between runtimes.
+PARITY_CONFIDENCE_MARGIN = 0.05
+PARITY_IOU_THRESHOLD = 0.5
+
+Detection = Tuple[int, float, np.ndarray]  # (class index, confidence, xyxy box)
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp", ".webp")
+
+
+def synthetic_images(count: int, seed: int = 0) -> List[Image.Image]:
+    """Generate reproducible RGB images with random shapes, textures and sizes."""
+    rng = np.random.default_rng(seed)
+    images: List[Image.Image] = []
+    for _ in range(count):
+        w, h = int(rng.integers(320, 1280)), int(rng.integers(320, 1280))
+        base = rng.integers(0, 256, size=3)
+        noise = rng.normal(0, 25, size=(h, w, 3))
+        arr = np.clip(base + noise, 0, 255).astype(np.uint8)
+        img = Image.fromarray(arr, "RGB")
+        draw = ImageDraw.Draw(img)
+        for _ in range(int(rng.integers(3, 12))):
+            x0, y0 = int(rng.integers(0, w - 20)), int(rng.integers(0, h - 20))
+            x1, y1 = x0 + int(rng.integers(10, w // 2)), y0 + int(rng.integers(10, h // 2))
+            color = tuple(int(c) for c in rng.integers(0, 256, size=3))
+            if rng.random() < 0.5:
+                draw.ellipse((x0, y0, x1, y1), fill=color)
+            else:
+                draw.rectangle((x0, y0, x1, y1), fill=color)
+        images.append(img)
+    return images
+
+
+def load_backend(backend: str) -> Any:
+    """
+    Load the model for exactly `backend` (no fallback to PyTorch) and run one inference,
+    so a missing runtime or a broken export fails here instead of being measured as torch.
+    """
+    model = load_model(backend, fallback=False)
+    model(Image.new("RGB", (64, 64)), verbose=False, imgsz=INFERENCE_IMAGE_SIZE)
+    return model
+
+
+def run_detections(model: Any, images: List[Image.Image], conf: float) -> List[List[Detection]]:
+    """Run the model on each image and return (class, confidence, box) tuples."""
+    detections: List[List[Detection]] = []
+    for img in images:
+        result = model(img, verbose=False, conf=conf, imgsz=INFERENCE_IMAGE_SIZE)[0]
+        boxes = result.boxes
+        classes = boxes.cls.cpu().numpy().astype(int)
+        confidences = boxes.conf.cpu().numpy()
+        xyxy = boxes.xyxy.cpu().numpy()
+        detections.append(list(zip(classes.tolist(), confidences.tolist(), xyxy)))
+    return detections
+
+
+def load_image_folder(folder: str, limit: Optional[int] = None) -> List[Image.Image]:
+    """Load the RGB images of a local folder, sorted by file name."""
+    paths = sorted(
+        os.path.join(folder, name)
+        for name in os.listdir(folder)
+        if name.lower().endswith(IMAGE_EXTENSIONS)
+    )
+    if limit:
+        paths = paths[:limit]
+    if not paths:
+        raise FileNotFoundError(f"No images found in {folder}")
+    return [Image.open(path).convert("RGB") for path in paths]
+
+
+def letterbox(img: Image.Image, size: int = INFERENCE_IMAGE_SIZE) -> np.ndarray:
+    """Resize keeping aspect ratio, pad to a size x size square and return a 1x3xHxW float tensor."""
+    w, h = img.size
+    scale = min(size / float(w), size / float(h))
+    new_w, new_h = max(1, int(round(w * scale))), max(1, int(round(h * scale)))
+    canvas = Image.new("RGB", (size, size), (114, 114, 114))
+    canvas.paste(img.resize((new_w, new_h), Image.Resampling.BILINEAR), ((size - new_w) // 2, (size - new_h) // 2))
+    arr = np.asarray(canvas, dtype=np.float32) / 255.0
+    return np.ascontiguousarray(arr.transpose(2, 0, 1)[None])
+
+
+def quantize_model(calibration_dir: str, max_images: int = 200) -> str:
+    """
+    Build an INT8 (QDQ) ONNX model from the FP32 ONNX export, calibrated on local images.
+
+    Returns:
+        Path of the quantized model, which get_model() loads with YOLO_BACKEND=onnx-int8.
+    """
+    import onnx
+    from onnxruntime.quantization import (
+        CalibrationDataReader,
+        CalibrationMethod,
+        QuantFormat,
+        QuantType,
+        quantize_static,
+    )
+
+    model_path = resolve_model_path()
+    fp32_path = export_model(model_path, "onnx")
+    int8_path = exported_model_path(model_path, "onnx-int8")
+    fp32_model = onnx.load(fp32_path)
+    input_name = fp32_model.graph.input[0].name
+    images = load_image_folder(calibration_dir, limit=max_images)
+    logger.info(f"Calibrating INT8 model on {len(images)} images from {calibration_dir}")
+
+    class _FolderReader(CalibrationDataReader):
+        def __init__(self) -> None:
+            self._batches: Iterator[np.ndarray] = (letterbox(img) for img in images)
+
+        def get_next(self) -> Optional[Dict[str, np.ndarray]]:
+            batch = next(self._batches, None)
+            return None if batch is None else {input_name: batch}
+
+    quantize_static(
+        fp32_path,
+        int8_path,
+        _FolderReader(),
+        quant_format=QuantFormat.QDQ,
+        activation_type=QuantType.QUInt8,
+        weight_type=QuantType.QInt8,
+        per_channel=True,
+        # Only the convolution/matmul heavy parts; box decoding stays in FP32
+        op_types_to_quantize=["Conv", "MatMul"],
+        calibrate_method=CalibrationMethod.MinMax,
+    )
+
+    # Keep the export metadata (class names, stride, imgsz) so ultralytics can load the model
+    int8_model = onnx.load(int8_path)
+    del int8_model.metadata_props[:]
+    int8_model.metadata_props.extend(fp32_model.metadata_props)
+    onnx.save(int8_model, int8_path)
+    logger.info(f"INT8 model written to {int8_path}")
+    return int8_path
+
+
+def timed_detections(model: Any, images: List[Image.Image], conf: float, warmup: int = 2) -> Tuple[List[List[Detection]], List[float]]:
+    """Run detections one image at a time and record the latency of each call in milliseconds."""
+    for img in images[:warmup]:
+        model(img, verbose=False, conf=conf, imgsz=INFERENCE_IMAGE_SIZE)
+    detections: List[List[Detection]] = []
+    latencies: List[float] = []
+    for img in images:
+        started = time.perf_counter()
+        detections.extend(run_detections(model, [img], conf))
+        latencies.append((time.perf_counter() - started) * 1000)
+    return detections, latencies
+
+
+def _percentile(values: List[float], pct: float) -> float:
+    return round(float(np.percentile(values, pct)), 2) if values else 0.0
+
+
+def compare_models(reference_backend: str, candidate_backend: str, images: List[Image.Image], conf: float) -> Dict[str, Any]:
+    """
+    Compare a candidate backend against a reference: per-class detection agreement and latency.
+
+    Agreement for a class is the share of images where both models agree on whether
+    the class is present (images where neither model sees it are ignored).
+    """
+    # Strict loads: a candidate silently replaced by the PyTorch model would report perfect agreement
+    reference_model = load_backend(reference_backend)
+    candidate_model = load_backend(candidate_backend)
+    names = reference_model.names
+    reference, reference_ms = timed_detections(reference_model, images, conf)
+    candidate, candidate_ms = timed_detections(candidate_model, images, conf)
+
+    per_class: Dict[str, Dict[str, Any]] = {}
+    for ref, cand in zip(reference, candidate):
+        ref_classes = {cls for cls, _, _ in ref}
+        cand_classes = {cls for cls, _, _ in cand}
+        for cls in ref_classes | cand_classes:
+            entry = per_class.setdefault(names.get(cls, str(cls)), {"both": 0, "reference_only": 0, "candidate_only": 0})
+            if cls in ref_classes and cls in cand_classes:
+                entry["both"] += 1
+            elif cls in ref_classes:
+                entry["reference_only"] += 1
+            else:
+                entry["candidate_only"] += 1
+    for entry in per_class.values():
+        seen = entry["both"] + entry["reference_only"] + entry["candidate_only"]
+        entry["agreement"] = round(entry["both"] / seen, 3) if seen else 1.0
+
+    total_seen = sum(e["both"] + e["reference_only"] + e["candidate_only"] for e in per_class.values())
+    total_both = sum(e["both"] for e in per_class.values())
+    return {
+        "reference": reference_backend,
+        "candidate": candidate_backend,
+        "images": len(images),
+        "confidence_threshold": conf,
+        "overall_agreement": round(total_both / total_seen, 3) if total_seen else 1.0,
+        "per_class": dict(sorted(per_class.items())),
+        "latency_ms": {
+            reference_backend: {"p50": _percentile(reference_ms, 50), "p95": _percentile(reference_ms, 95)},
+            candidate_backend: {"p50": _percentile(candidate_ms, 50), "p95": _percentile(candidate_ms, 95)},
+        },
+    }
+
+
+def _iou(a: np.ndarray, b: np.ndarray) -> float:
+    ix0, iy0 = max(a[0], b[0]), max(a[1], b[1])
+    ix1, iy1 = min(a[2], b[2]), min(a[3], b[3])
+    inter = max(0.0, ix1 - ix0) * max(0.0, iy1 - iy0)
+    union = (a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - inter
+    return float(inter / union) if union > 0 else 0.0
+
+
+def _unmatched(reference: List[Detection], candidate: List[Detection], conf: float) -> int:
+    """Count confident reference detections with no same-class, overlapping candidate box."""
+    used = set()
+    missing = 0
+    for cls, score, box in reference:
+        if score < conf + PARITY_CONFIDENCE_MARGIN:
+            continue
+        match = None
+        for j, (other_cls, _, other_box) in enumerate(candidate):
+            if j not in used and other_cls == cls and _iou(box, other_box) >= PARITY_IOU_THRESHOLD:
+                match = j
+                break
+        if match is None:
+            missing += 1
+        else:
+            used.add(match)
+    return missing
+
+
+def check_parity(backends: List[str], images: List[Image.Image], conf: float) -> Dict[str, Dict[str, Any]]:
+    """
+    Compare detections of each backend against the PyTorch model on `images`.
+
+    Returns:
+        Per-backend report with the number of images whose detections differ, or the
+        error of a backend that could not be loaded (which fails the check).
+    """
+    reference_model = load_backend("torch")
+    reference = run_detections(reference_model, images, conf)
+    reference_names = reference_model.names
+
+    report: Dict[str, Dict[str, Any]] = {}
+    for backend in backends:
+        try:
+            model = load_backend(backend)
+            candidate = run_detections(model, images, conf)
+        except Exception as e:  # noqa: BLE001
+            logger.error(f"Could not run the {backend} backend: {e}")
+            report[backend] = {"error": f"{type(e).__name__}: {e}"}
+            continue
+        mismatched_images = 0
+        missing = extra = 0
+        for ref, cand in zip(reference, candidate):
+            img_missing = _unmatched(ref, cand, conf)
+            img_extra = _unmatched(cand, ref, conf)
+            missing += img_missing
+            extra += img_extra
+            if img_missing or img_extra:
+                mismatched_images += 1
+        report[backend] = {
+            "class_names_match": dict(model.names) == dict(reference_names),
+            "images": len(images),
+            "reference_detections": sum(len(r) for r in reference),
+            "backend_detections": sum(len(c) for c in candidate),
+            "missing_detections": missing,
+            "extra_detections": extra,
+            "mismatched_images": mismatched_images,
+        }
+    return report
+
+
+def _cmd_export(args: argparse.Namespace) -> int:
+    path = export_model(resolve_model_path(), args.backend)
+    print(f"Exported {args.backend} model: {path}")
+    return 0
+
+
+def parity_passed(stats: Dict[str, Any]) -> bool:
+    """
+    Whether a backend's check_parity report passes. Without any reference
+    detection there is nothing to compare, so that fails too.
+    """
+    return (
+        "error" not in stats
+        and stats["class_names_match"]
+        and stats["reference_detections"] > 0
+        and stats["mismatched_images"] == 0
+    )
+
+
+def _cmd_parity(args: argparse.Namespace) -> int:
+    if args.image_dir:
+        images = load_image_folder(args.image_dir, limit=args.images)
+    else:
+        # Shapes and noise rarely look like ingredients; real photos exercise the boxes
+        images = synthetic_images(args.images, seed=args.seed)
+    report = check_parity(args.backends, images, args.conf)
+    ok = True
+    for backend, stats in report.items():
+        passed = parity_passed(stats)
+        ok = ok and passed
+        print(f"[{'PASS' if passed else 'FAIL'}] {backend}: {stats}")
+    return 0 if ok else 1
+
+
+def _cmd_quantize(args: argparse.Namespace) -> int:
+    int8_path = quantize_model(args.calibration_dir, max_images=args.max_images)
+    images = load_image_folder(args.eval_dir or args.calibration_dir, limit=args.max_images)
+    try:
+        report = compare_models(args.reference, "onnx-int8", images, args.conf)
+    except Exception as e:  # noqa: BLE001
+        print(f"[FAIL] Could not compare onnx-int8 with {args.reference}: {type(e).__name__}: {e}")
+        return 1
+    report_path = args.report or f"{os.path.splitext(int8_path)[0]}_report.json"
+    with open(report_path, "w") as f:
+        json.dump(report, f, indent=2)
+
+    latency = report["latency_ms"]
+    print(f"INT8 model: {int8_path}")
+    print(f"Overall detection agreement vs {args.reference}: {report['overall_agreement']:.1%}")
+    for backend, stats in latency.items():
+        print(f"  {backend:>10}: p50 {stats['p50']:.1f} ms, p95 {stats['p95']:.1f} ms")
+    print(f"Full report: {report_path}")
+    return 0
+
+
+def main(argv: List[str]) -> int:
+    parser = argparse.ArgumentParser(description="Ingredient model tools")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    export = sub.add_parser("export", help="Export and cache the model for a backend")
+    export.add_argument("--backend", choices=["onnx", "openvino"], required=True)
+    export.set_defaults(func=_cmd_export)
+
+    parity = sub.add_parser("parity", help="Check detections match across backends")
+    parity.add_argument("--backends", nargs="+", default=["onnx", "openvino"],
+                        choices=[b for b in YOLO_BACKENDS if b != "torch"])
+    parity.add_argument("--image-dir", help="Folder of photos to compare on (synthetic images otherwise)")
+    parity.add_argument("--images", type=int, default=24, help="Number of images")
+    parity.add_argument("--conf", type=float, default=0.25, help="Confidence threshold")
+    parity.add_argument("--seed", type=int, default=0)
+    parity.set_defaults(func=_cmd_parity)
+
+    quantize = sub.add_parser("quantize", help="Build an INT8 ONNX model and an accuracy/latency report")
+    quantize.add_argument("--calibration-dir", required=True, help="Folder of representative images")
+    quantize.add_argument("--eval-dir", help="Folder of images for the report (defaults to the calibration folder)")
+    quantize.add_argument("--max-images", type=int, default=200)
+    quantize.add_argument("--reference", default="torch", choices=["torch", "onnx"],
+                          help="FP32 model to compare against")
+    quantize.add_argument("--conf", type=float, default=0.25, help="Confidence threshold")
+    quantize.add_argument("--report", help="Where to write the JSON report")
+    quantize.set_defaults(func=_cmd_quantize)
+
+    args = parser.parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,146 @@
+"""
+Load-adaptive detection quality.
+
+When the inference queue backs up, a slightly worse detection is better than a
+timeout. The controller picks a quality level for each request from the current
+inference queue depth and the recent p95 detection latency:
+
+    full      YOLO_IMAGE_SIZE, tiling and test-time augmentation as configured
+    reduced   ADAPTIVE_QUALITY_SIZES[1], no tiling, no augmentation
+    minimal   ADAPTIVE_QUALITY_SIZES[2], no tiling, no augmentation
+
+It moves one level at a time. Separate degrade/recover thresholds plus a minimum
+time between changes (hysteresis) keep it from flapping.
+"""
+import logging
+import os
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Deque, Dict, List, NamedTuple, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+ADAPTIVE_QUALITY = os.environ.get("ADAPTIVE_QUALITY", "false").lower() == "true"
+# Inference sizes of the full, reduced and minimal levels
+ADAPTIVE_QUALITY_SIZES = [
+    int(size) for size in os.environ.get("ADAPTIVE_QUALITY_SIZES", "640,480,320").split(",") if size.strip()
+]
+# Test-time augmentation at full quality (slower, slightly better recall)
+YOLO_AUGMENT = os.environ.get("YOLO_AUGMENT", "false").lower() == "true"
+# Degrade when either limit is exceeded...
+ADAPTIVE_QUALITY_QUEUE_HIGH = int(os.environ.get("ADAPTIVE_QUALITY_QUEUE_HIGH", "4"))
+ADAPTIVE_QUALITY_P95_HIGH_MS = float(os.environ.get("ADAPTIVE_QUALITY_P95_HIGH_MS", "3000"))
+# ...and recover only once both are back under the lower limits
+ADAPTIVE_QUALITY_QUEUE_LOW = int(os.environ.get("ADAPTIVE_QUALITY_QUEUE_LOW", "1"))
+ADAPTIVE_QUALITY_P95_LOW_MS = float(os.environ.get("ADAPTIVE_QUALITY_P95_LOW_MS", "1500"))
+# Minimum seconds between two level changes
+ADAPTIVE_QUALITY_DWELL_S = float(os.environ.get("ADAPTIVE_QUALITY_DWELL_S", "10"))
+# Latency samples older than this are ignored for the p95
+ADAPTIVE_QUALITY_WINDOW_S = float(os.environ.get("ADAPTIVE_QUALITY_WINDOW_S", "30"))
+
+_LEVEL_NAMES = ("full", "reduced", "minimal")
+
+
+class QualityLevel(NamedTuple):
+    level: int
+    name: str
+    image_size: int
+    tiling: bool
+    augment: bool
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "level": self.level,
+            "name": self.name,
+            "imageSize": self.image_size,
+            "tiling": self.tiling,
+            "augment": self.augment,
+        }
+
+
+def build_levels(full_size: int, sizes: List[int] = ADAPTIVE_QUALITY_SIZES) -> List[QualityLevel]:
+    """Quality levels from best to cheapest; the first one uses the configured full size."""
+    levels = [QualityLevel(0, _LEVEL_NAMES[0], full_size, True, YOLO_AUGMENT)]
+    for index, size in enumerate(sizes[1:len(_LEVEL_NAMES)], start=1):
+        levels.append(QualityLevel(index, _LEVEL_NAMES[index], min(size, full_size), False, False))
+    return levels
+
+
+class QualityController:
+    """
+    Thread-safe controller choosing the quality level from queue depth and recent p95 latency.
+    """
+
+    def __init__(self, levels: List[QualityLevel], queue_depth: Callable[[], int],
+                 enabled: bool = ADAPTIVE_QUALITY) -> None:
+        self.levels = levels
+        self.enabled = enabled
+        self._queue_depth = queue_depth
+        self._lock = threading.Lock()
+        self._level = 0
+        self._changed_at = float("-inf")
+        self._changes = 0
+        self._latencies: Deque[Tuple[float, float]] = deque(maxlen=500)  # (timestamp, ms)
+        self._requests = [0] * len(levels)
+
+    def _p95(self, now: float) -> Optional[float]:
+        while self._latencies and now - self._latencies[0][0] > ADAPTIVE_QUALITY_WINDOW_S:
+            self._latencies.popleft()
+        if not self._latencies:
+            return None
+        values = sorted(ms for _, ms in self._latencies)
+        return values[int(0.95 * (len(values) - 1))]
+
+    def record_latency(self, elapsed_ms: float) -> None:
+        """Record the end-to-end time (queue wait + inference) of one detection job."""
+        with self._lock:
+            self._latencies.append((time.monotonic(), elapsed_ms))
+
+    def select(self) -> QualityLevel:
+        """Pick the quality level for a new detection request."""
+        if not self.enabled:
+            with self._lock:
+                self._requests[0] += 1
+            return self.levels[0]
+
+        queue_depth = self._queue_depth()
+        with self._lock:
+            now = time.monotonic()
+            p95 = self._p95(now)
+            if now - self._changed_at >= ADAPTIVE_QUALITY_DWELL_S:
+                overloaded = queue_depth >= ADAPTIVE_QUALITY_QUEUE_HIGH or (
+                    p95 is not None and p95 > ADAPTIVE_QUALITY_P95_HIGH_MS
+                )
+                relaxed = queue_depth <= ADAPTIVE_QUALITY_QUEUE_LOW and (
+                    p95 is None or p95 < ADAPTIVE_QUALITY_P95_LOW_MS
+                )
+                if overloaded and self._level < len(self.levels) - 1:
+                    self._change(self._level + 1, now, queue_depth, p95)
+                elif relaxed and self._level > 0:
+                    self._change(self._level - 1, now, queue_depth, p95)
+            self._requests[self._level] += 1
+            return self.levels[self._level]
+
+    def _change(self, level: int, now: float, queue_depth: int, p95: Optional[float]) -> None:
+        logger.warning(
+            f"Detection quality {self.levels[self._level].name} -> {self.levels[level].name} "
+            f"(queue depth {queue_depth}, p95 {'n/a' if p95 is None else f'{p95:.0f} ms'})"
+        )
+        self._level = level
+        self._changed_at = now
+        self._changes += 1
+        # Latencies measured at the previous level no longer describe the current one
+        self._latencies.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            p95 = self._p95(time.monotonic())
+            return {
+                "enabled": self.enabled,
+                "current": self.levels[self._level].as_dict(),
+                "level_changes": self._changes,
+                "queue_depth": self._queue_depth(),
+                "p95_latency_ms": round(p95, 2) if p95 is not None else None,
+                "requests_per_level": {level.name: count for level, count in zip(self.levels, self._requests)},
+            }
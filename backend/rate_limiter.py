@@ -0,0 +1,225 @@
+"""
+Token-bucket rate limiter for Gemini API calls.
+
+Two buckets are kept: requests per minute (GEMINI_RPM) and tokens per minute
+(GEMINI_TPM, estimated from the prompt and corrected with the usage the API
+reports). A call reserves its cost up front and is told how long to wait until
+the buckets cover it; async callers await that delay, so waiting never blocks
+the event loop and concurrent callers are served in arrival order. A logical
+call's tokens are reserved once: a retry only takes another request slot.
+
+By default the buckets live in the process. With GEMINI_RATE_LIMIT_FILE set,
+their state is kept in that file under an fcntl lock, so all uvicorn workers
+(and scripts) on the host share one budget; async callers then update it from
+a worker thread, since the lock may have to wait for another process.
+"""
+import asyncio
+import json
+import logging
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple, TypeVar
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None  # type: ignore[assignment]
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# 0 disables a budget
+GEMINI_RPM = float(os.environ.get("GEMINI_RPM", "60"))
+GEMINI_TPM = float(os.environ.get("GEMINI_TPM", "0"))
+# Seconds of budget that can be spent at once after an idle period
+GEMINI_RATE_BURST_S = float(os.environ.get("GEMINI_RATE_BURST_S", "1"))
+# Shared bucket state for all workers on the host (empty = per process)
+GEMINI_RATE_LIMIT_FILE = os.environ.get("GEMINI_RATE_LIMIT_FILE", "")
+# Output tokens reserved per call before the real usage is known
+GEMINI_EXPECTED_OUTPUT_TOKENS = int(os.environ.get("GEMINI_EXPECTED_OUTPUT_TOKENS", "1500"))
+
+Bucket = Tuple[float, float]  # level, updated at (wall clock, comparable across processes)
+
+
+def estimate_tokens(prompt: str) -> int:
+    """Rough token cost of a call: ~4 characters per prompt token plus the expected answer."""
+    return len(prompt) // 4 + GEMINI_EXPECTED_OUTPUT_TOKENS
+
+
+class TokenBucketLimiter:
+    """
+    Thread-safe requests-per-minute / tokens-per-minute limiter.
+
+    Buckets may go negative: a reservation that has to wait is deducted right
+    away, so later callers queue up behind it instead of racing for the refill.
+    """
+
+    def __init__(self, rpm: float = GEMINI_RPM, tpm: float = GEMINI_TPM,
+                 burst_seconds: float = GEMINI_RATE_BURST_S, state_file: str = GEMINI_RATE_LIMIT_FILE) -> None:
+        self.rates = (rpm / 60.0, tpm / 60.0)  # per second
+        self.capacities = tuple(max(rate * burst_seconds, 1.0) for rate in self.rates)
+        self.state_file = state_file if fcntl is not None else ""
+        if state_file and fcntl is None:
+            logger.warning("GEMINI_RATE_LIMIT_FILE needs fcntl; using a per-process rate limit")
+        self._lock = threading.Lock()
+        self._buckets: List[Bucket] = [(capacity, time.time()) for capacity in self.capacities]
+        self._file: Optional[Any] = None
+        self._file_pid = 0
+        self._acquired = 0
+        self._delayed = 0
+        self._total_wait = 0.0
+        self._max_wait = 0.0
+        self._token_corrections = 0
+
+    # -- bucket state ----------------------------------------------------------------
+
+    def _open_state_file(self) -> Any:
+        # A forked child must not share the parent's open file (and thus its lock)
+        if self._file is None or self._file_pid != os.getpid():
+            self._file = open(self.state_file, "a+")
+            self._file_pid = os.getpid()
+        return self._file
+
+    def _update(self, apply: Any) -> Any:
+        """Run `apply(buckets) -> (result, buckets)` on the (possibly shared) bucket state."""
+        with self._lock:
+            if not self.state_file:
+                result, self._buckets = apply(self._buckets)
+                return result
+            f = self._open_state_file()
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                f.seek(0)
+                raw = f.read()
+                try:
+                    buckets = [tuple(bucket) for bucket in json.loads(raw)] if raw else self._buckets
+                except ValueError:
+                    buckets = self._buckets
+                result, buckets = apply(buckets)
+                f.seek(0)
+                f.truncate()
+                f.write(json.dumps(buckets))
+                f.flush()
+                return result
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _refilled(self, buckets: List[Bucket], now: float) -> List[float]:
+        return [
+            min(capacity, level + max(0.0, now - updated) * rate)
+            for (level, updated), rate, capacity in zip(buckets, self.rates, self.capacities)
+        ]
+
+    def reserve(self, tokens: int = 0) -> float:
+        """Deduct one request and `tokens` from the buckets; returns the seconds to wait before calling."""
+        costs = (1.0, float(tokens))
+
+        def apply(buckets: List[Bucket]) -> Tuple[float, List[Bucket]]:
+            now = time.time()
+            levels = self._refilled(buckets, now)
+            wait = 0.0
+            for level, cost, rate, capacity in zip(levels, costs, self.rates, self.capacities):
+                if rate > 0:
+                    # A call costing more than a full bucket only waits for the bucket to fill up
+                    wait = max(wait, (min(cost, capacity) - level) / rate)
+            return wait, [
+                (level - cost if rate > 0 else level, now)
+                for level, cost, rate in zip(levels, costs, self.rates)
+            ]
+
+        return max(0.0, self._update(apply))
+
+    def refund(self, requests: float = 0.0, tokens: float = 0.0) -> None:
+        """Give back (or, with negative values, charge) budget after the fact."""
+        def apply(buckets: List[Bucket]) -> Tuple[None, List[Bucket]]:
+            now = time.time()
+            levels = self._refilled(buckets, now)
+            return None, [
+                (min(capacity, level + amount), now)
+                for level, amount, capacity in zip(levels, (requests, tokens), self.capacities)
+            ]
+
+        self._update(apply)
+
+    # -- acquisition -----------------------------------------------------------------
+
+    def _record_wait(self, wait: float) -> None:
+        with self._lock:
+            self._acquired += 1
+            if wait > 0:
+                self._delayed += 1
+                self._total_wait += wait
+                self._max_wait = max(self._max_wait, wait)
+
+    async def _run(self, update: Callable[..., T], *args: Any) -> T:
+        # File-backed updates take an flock and do file I/O: keep them off the event loop
+        if self.state_file:
+            return await asyncio.to_thread(update, *args)
+        return update(*args)
+
+    async def acquire(self, tokens: int = 0) -> float:
+        """Wait (without blocking the event loop) until a call costing `tokens` fits the budget."""
+        wait = await self._run(self.reserve, tokens)
+        self._record_wait(wait)
+        if wait > 0:
+            try:
+                await asyncio.sleep(wait)
+            except asyncio.CancelledError:
+                # The call will not happen; don't let its reservation hold back the others
+                await self._run(self.refund, 1.0, float(tokens))
+                raise
+        return wait
+
+    def acquire_sync(self, tokens: int = 0) -> float:
+        """Blocking variant of acquire (for scripts and worker threads)."""
+        wait = self.reserve(tokens)
+        self._record_wait(wait)
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+    def record_usage(self, estimated_tokens: int, actual_tokens: Optional[int]) -> None:
+        """Correct a reservation once the API reports the real token usage."""
+        if actual_tokens is None or self.rates[1] <= 0 or actual_tokens == estimated_tokens:
+            return
+        self.refund(tokens=float(estimated_tokens - actual_tokens))
+        with self._lock:
+            self._token_corrections += 1
+
+    async def record_usage_async(self, estimated_tokens: int, actual_tokens: Optional[int]) -> None:
+        """record_usage for async callers (off the event loop when the state is shared)."""
+        await self._run(self.record_usage, estimated_tokens, actual_tokens)
+
+    def stats(self) -> Dict[str, Any]:
+        """Budgets plus wait counters of this process."""
+        with self._lock:
+            return {
+                "rpm": self.rates[0] * 60,
+                "tpm": self.rates[1] * 60,
+                "shared": bool(self.state_file),
+                "acquired": self._acquired,
+                "delayed": self._delayed,
+                "total_wait_s": round(self._total_wait, 3),
+                "max_wait_s": round(self._max_wait, 3),
+                "avg_wait_ms": round(self._total_wait / self._acquired * 1000, 2) if self._acquired else 0.0,
+                "token_corrections": self._token_corrections,
+            }
+
+
+_limiter: Optional[TokenBucketLimiter] = None
+_limiter_lock = threading.Lock()
+
+
+def get_rate_limiter() -> TokenBucketLimiter:
+    """Process-wide limiter for Gemini calls."""
+    global _limiter
+    with _limiter_lock:
+        if _limiter is None:
+            _limiter = TokenBucketLimiter()
+        return _limiter
+
+
+def get_rate_limit_stats() -> Dict[str, Any]:
+    return get_rate_limiter().stats()
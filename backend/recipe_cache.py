@@ -0,0 +1,244 @@
+"""
+Recipe cache for generate_recipes, keyed by the MD5 key of the ingredient set.
+
+Two tiers:
+
+- memory: a small per-process LRU (ttl_cache.LRUCache) in front of everything
+- sqlite: a local on-disk table (WAL mode) shared by every worker process on the
+  host and surviving restarts and deploys (if RECIPE_CACHE_PATH is on a volume)
+
+Entries expire after RECIPE_CACHE_TTL seconds and each tier is bounded in size:
+memory evicts the least recently used entries, disk the oldest ones. Recipes are stored on disk as zlib-compressed
+compact JSON. Disk errors are logged and treated as misses; the cache never
+fails a request.
+"""
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from typing import Any, Dict, List, Optional
+
+from ttl_cache import LRUCache
+
+logger = logging.getLogger(__name__)
+
+# "memory" (per process) or "sqlite" (memory tier in front of a shared on-disk tier)
+RECIPE_CACHE_BACKEND = os.environ.get("RECIPE_CACHE_BACKEND", "sqlite").lower()
+RECIPE_CACHE_PATH = os.environ.get("RECIPE_CACHE_PATH", "/tmp/recipe-cache.sqlite3")
+RECIPE_CACHE_TTL = int(os.environ.get("RECIPE_CACHE_TTL", "3600"))  # seconds
+RECIPE_CACHE_MEMORY_SIZE = int(os.environ.get("RECIPE_CACHE_MEMORY_SIZE", "100"))
+# Bound on the (approximate, JSON-encoded) size of the memory tier
+RECIPE_CACHE_MEMORY_MAX_BYTES = int(os.environ.get("RECIPE_CACHE_MEMORY_MAX_BYTES", str(8 * 1024 * 1024)))
+RECIPE_CACHE_MAX_ENTRIES = int(os.environ.get("RECIPE_CACHE_MAX_ENTRIES", "10000"))
+
+Recipes = List[Dict[str, Any]]
+
+_FORMAT_VERSION = b"\x01"
+# Eviction needs a COUNT(*); only run it every few writes
+_EVICT_EVERY = 32
+
+
+def encode_recipes(recipes: Recipes) -> bytes:
+    """Compact serialization of normalized recipe dicts."""
+    payload = json.dumps(recipes, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+    return _FORMAT_VERSION + zlib.compress(payload, 6)
+
+
+def recipes_size(recipes: Recipes) -> int:
+    """Approximate size of a recipe set, for the memory tier's byte bound."""
+    return len(json.dumps(recipes, separators=(",", ":")))
+
+
+def decode_recipes(blob: bytes) -> Recipes:
+    if blob[:1] != _FORMAT_VERSION:
+        raise ValueError(f"Unknown recipe cache format {blob[:1]!r}")
+    return json.loads(zlib.decompress(blob[1:]).decode("utf-8"))
+
+
+class SQLiteRecipeCache:
+    """
+    On-disk tier in a SQLite database in WAL mode: readers don't block the
+    writer, and every process/thread uses its own connection.
+    """
+
+    def __init__(self, path: str = RECIPE_CACHE_PATH, ttl: int = RECIPE_CACHE_TTL,
+                 max_entries: int = RECIPE_CACHE_MAX_ENTRIES, table: str = "recipes") -> None:
+        self.path = path
+        self.table = table
+        self.ttl = ttl
+        self.max_entries = max(1, max_entries)
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._writes = 0
+        self._evictions = 0
+        self._errors = 0
+        # Create the table right away so a broken path is noticed at startup
+        self._connection()
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None or getattr(self._local, "pid", None) != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                f"CREATE TABLE IF NOT EXISTS {self.table} ("
+                "key TEXT PRIMARY KEY, created REAL NOT NULL, data BLOB NOT NULL)"
+            )
+            conn.execute(f"CREATE INDEX IF NOT EXISTS {self.table}_created ON {self.table} (created)")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def _count(self, counter: str) -> None:
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def get(self, key: str) -> Optional[tuple]:
+        """Return (recipes, created timestamp), or None on a miss."""
+        try:
+            row = self._connection().execute(
+                f"SELECT data, created FROM {self.table} WHERE key = ? AND created > ?",
+                (key, time.time() - self.ttl),
+            ).fetchone()
+            if row is None:
+                self._count("_misses")
+                return None
+            recipes = decode_recipes(row[0])
+        except (sqlite3.Error, ValueError, zlib.error) as e:
+            logger.warning(f"Recipe cache read failed for {key[:8]}: {e}")
+            self._count("_errors")
+            return None
+        self._count("_hits")
+        return recipes, row[1]
+
+    def set(self, key: str, recipes: Recipes) -> None:
+        try:
+            conn = self._connection()
+            conn.execute(
+                f"INSERT OR REPLACE INTO {self.table} (key, created, data) VALUES (?, ?, ?)",
+                (key, time.time(), sqlite3.Binary(encode_recipes(recipes))),
+            )
+            with self._lock:
+                self._writes += 1
+                evict = self._writes % _EVICT_EVERY == 1
+            if evict:
+                self._evict(conn)
+        except sqlite3.Error as e:
+            logger.warning(f"Recipe cache write failed for {key[:8]}: {e}")
+            self._count("_errors")
+
+    def _evict(self, conn: sqlite3.Connection) -> None:
+        """Drop expired entries, then the oldest ones beyond max_entries."""
+        expired = conn.execute(f"DELETE FROM {self.table} WHERE created <= ?", (time.time() - self.ttl,)).rowcount
+        overflow = conn.execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()[0] - self.max_entries
+        if overflow > 0:
+            conn.execute(
+                f"DELETE FROM {self.table} WHERE key IN (SELECT key FROM {self.table} ORDER BY created LIMIT ?)",
+                (overflow,),
+            )
+        removed = max(expired, 0) + max(overflow, 0)
+        if removed:
+            with self._lock:
+                self._evictions += removed
+            logger.info(f"Recipe cache evicted {removed} entries from {self.table}")
+
+    def clear(self) -> None:
+        try:
+            self._connection().execute(f"DELETE FROM {self.table}")
+        except sqlite3.Error as e:
+            logger.warning(f"Recipe cache clear failed: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        try:
+            size, data_bytes = self._connection().execute(
+                f"SELECT COUNT(*), COALESCE(SUM(LENGTH(data)), 0) FROM {self.table}"
+            ).fetchone()
+        except sqlite3.Error:
+            size, data_bytes = None, None
+        with self._lock:
+            return {
+                "path": self.path,
+                "table": self.table,
+                "size": size,
+                "data_bytes": data_bytes,
+                "max_entries": self.max_entries,
+                "hits": self._hits,
+                "misses": self._misses,
+                "writes": self._writes,
+                "evictions": self._evictions,
+                "errors": self._errors,
+            }
+
+
+class RecipeCache:
+    """
+    The memory tier, optionally in front of the shared on-disk tier. Disk hits
+    are promoted to memory (keeping their original creation time for the TTL).
+    """
+
+    def __init__(self, memory: "LRUCache[Recipes]", disk: Optional[SQLiteRecipeCache] = None) -> None:
+        self.memory = memory
+        self.disk = disk
+
+    def get_memory(self, key: str) -> Optional[Recipes]:
+        """Memory-only lookup (never touches the disk, safe on the event loop)."""
+        return self.memory.get(key)
+
+    def get(self, key: str) -> Optional[Recipes]:
+        recipes = self.memory.get(key)
+        if recipes is not None:
+            return recipes
+        return self.get_disk(key)
+
+    def get_disk(self, key: str) -> Optional[Recipes]:
+        """Disk-only lookup, promoting a hit to memory. Blocking; call it off the event loop."""
+        if self.disk is None:
+            return None
+        entry = self.disk.get(key)
+        if entry is None:
+            return None
+        recipes, created = entry
+        self.memory.put(key, recipes, ttl=max(0.0, created + self.disk.ttl - time.time()))
+        return recipes
+
+    def set(self, key: str, recipes: Recipes) -> None:
+        self.memory.put(key, recipes)
+        if self.disk is not None:
+            self.disk.set(key, recipes)
+
+    def clear(self) -> None:
+        self.memory.clear()
+        if self.disk is not None:
+            self.disk.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "backend": "sqlite" if self.disk is not None else "memory",
+            "memory": self.memory.stats(),
+            "disk": self.disk.stats() if self.disk is not None else None,
+        }
+
+
+def build_recipe_cache(backend: str = RECIPE_CACHE_BACKEND, table: str = "recipes",
+                       memory_size: int = RECIPE_CACHE_MEMORY_SIZE) -> RecipeCache:
+    """
+    Build the configured cache (one table of the shared database per kind of
+    entry); falls back to memory only if the database can't be opened.
+    """
+    memory: "LRUCache[Recipes]" = LRUCache(
+        memory_size, ttl=RECIPE_CACHE_TTL,
+        max_bytes=RECIPE_CACHE_MEMORY_MAX_BYTES, sizeof=recipes_size,
+    )
+    if backend != "sqlite":
+        return RecipeCache(memory)
+    try:
+        return RecipeCache(memory, SQLiteRecipeCache(table=table))
+    except sqlite3.Error as e:
+        logger.error(f"Could not open recipe cache at {RECIPE_CACHE_PATH}, using memory only: {e}")
+        return RecipeCache(memory)
@@ -0,0 +1,294 @@
+"""
+Local recipe corpus: a fast path for /recommend that doesn't need Gemini.
+
+Recipes are loaded from RECIPE_CORPUS_PATH (a JSON list, a JSON object with a
+"recipes" list, or JSONL with one recipe per line) and, with
+RECIPE_CORPUS_LEARN, filled with the recipes Gemini generates (appended to the
+file if it is JSONL, so they survive restarts). Without RECIPE_CORPUS_PATH,
+learning and the fast path are off unless enabled explicitly. A recipe is either in the form
+/recommend returns or simply:
+
+    {"title": "...", "ingredients": ["egg", {"name": "milk", "quantity": "1 cup"}],
+     "dietary": ["vegetarian"], "steps": ["..."]}
+
+Ingredient names are reduced to a vocabulary of token sets ("Eggs" and "egg"
+are one entry), and an inverted index maps each entry to the recipes using it.
+A search matches the user's ingredients against the (small) vocabulary, counts
+per recipe how many of them it uses with numpy over the posting lists (so it
+stays in the low milliseconds for 100k recipes) and keeps the recipes that follow the same
+rules the Gemini prompt asks for: use at least RECIPE_CORPUS_MIN_USAGE of the
+listed ingredients, at most RECIPE_CORPUS_MAX_MISSING missing ones, and every
+requested dietary tag.
+"""
+import json
+import logging
+import math
+import os
+import threading
+import time
+from array import array
+from typing import Any, Dict, FrozenSet, List, Optional, Set
+
+import numpy as np
+
+from gemini_client import GeminiClient
+from recipe_similarity import adapt_recipes, ingredient_tokens
+
+logger = logging.getLogger(__name__)
+
+RECIPE_CORPUS_PATH = os.environ.get("RECIPE_CORPUS_PATH", "")
+# Learning and the fast path are on by default only with a configured corpus, so a
+# default deploy always answers with fresh generations
+_CORPUS_CONFIGURED = bool(RECIPE_CORPUS_PATH)
+# Add Gemini's recipes to the corpus
+RECIPE_CORPUS_LEARN = os.environ.get(
+    "RECIPE_CORPUS_LEARN", "true" if _CORPUS_CONFIGURED else "false"
+).lower() == "true"
+# Answer from the corpus when it has at least this many matching recipes (0 disables the fast path)
+RECIPE_CORPUS_MIN_RESULTS = int(os.environ.get("RECIPE_CORPUS_MIN_RESULTS", "3" if _CORPUS_CONFIGURED else "0"))
+# Same rules as the Gemini prompt: share of the user's ingredients used, missing ingredients
+RECIPE_CORPUS_MIN_USAGE = float(os.environ.get("RECIPE_CORPUS_MIN_USAGE", "0.6"))
+RECIPE_CORPUS_MAX_MISSING = int(os.environ.get("RECIPE_CORPUS_MAX_MISSING", "5"))
+# With fewer matches than that, answer with them if Gemini takes longer than this (0 = always wait)
+RECIPE_CORPUS_HEDGE_MS = float(os.environ.get("RECIPE_CORPUS_HEDGE_MS", "0"))
+
+Recipe = Dict[str, Any]
+
+
+def _tags(values: Optional[List[str]]) -> FrozenSet[str]:
+    return frozenset(v.lower().strip() for v in values or [] if v and v.strip())
+
+
+def _from_entry(entry: Dict[str, Any]) -> Optional[Recipe]:
+    """Normalize one corpus entry to the /recommend recipe shape, with all ingredients as used."""
+    if not isinstance(entry, dict):
+        return None
+    ingredients = entry.get("ingredients")
+    if ingredients is None:
+        ingredients = list(entry.get("usedIngredients") or []) + list(
+            entry.get("missedIngredients") or entry.get("missingIngredients") or []
+        )
+    recipe = GeminiClient._normalize_recipe(
+        {**entry, "usedIngredients": ingredients, "missingIngredients": []}, []
+    )
+    if "id" in entry:
+        recipe["id"] = str(entry["id"])
+    recipe["dietary"] = sorted(_tags(entry.get("dietary")))
+    return recipe
+
+
+class RecipeCorpus:
+    """Thread-safe in-memory corpus with an ingredient -> recipe inverted index."""
+
+    def __init__(self, min_usage: float = RECIPE_CORPUS_MIN_USAGE,
+                 max_missing: int = RECIPE_CORPUS_MAX_MISSING) -> None:
+        self.min_usage = min_usage
+        self.max_missing = max_missing
+        self._lock = threading.Lock()
+        self._recipes: List[Recipe] = []
+        self._recipe_sizes = array("i")  # distinct vocabulary entries of each recipe
+        self._recipe_tags: List[FrozenSet[str]] = []
+        self._ids: Set[str] = set()
+        self._vocabulary: Dict[FrozenSet[str], int] = {}
+        self._vocabulary_tokens: List[FrozenSet[str]] = []
+        self._token_names: Dict[str, Set[int]] = {}  # token -> vocabulary ids containing it
+        # vocabulary id -> recipe indexes (arrays, so numpy can read them without a copy)
+        self._postings: List["array[int]"] = []
+        self._learned = 0
+        self._searches = 0
+        self._answered = 0
+        self._search_s = 0.0
+        self._hedges = 0
+        self._hedges_won = 0
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._recipes)
+
+    def _name_id(self, tokens: FrozenSet[str]) -> int:
+        name_id = self._vocabulary.get(tokens)
+        if name_id is None:
+            name_id = self._vocabulary[tokens] = len(self._vocabulary_tokens)
+            self._vocabulary_tokens.append(tokens)
+            self._postings.append(array("i"))
+            for token in tokens:
+                self._token_names.setdefault(token, set()).add(name_id)
+        return name_id
+
+    def add(self, recipe: Recipe) -> bool:
+        """Index a normalized recipe (see _from_entry); returns False for a duplicate ID."""
+        with self._lock:
+            if recipe["id"] in self._ids:
+                return False
+            index = len(self._recipes)
+            name_ids: Set[int] = set()
+            for item in recipe["usedIngredients"]:
+                tokens = ingredient_tokens(item.get("name", ""))
+                if tokens:
+                    name_id = self._name_id(tokens)
+                    if name_id not in name_ids:
+                        name_ids.add(name_id)
+                        self._postings[name_id].append(index)
+            self._ids.add(recipe["id"])
+            self._recipes.append(recipe)
+            self._recipe_sizes.append(len(name_ids))
+            self._recipe_tags.append(frozenset(recipe.get("dietary") or ()))
+            return True
+
+    def load(self, path: str) -> int:
+        """Add the recipes of a JSON or JSONL file; returns how many were new."""
+        with open(path, encoding="utf-8") as f:
+            if path.endswith(".jsonl"):
+                entries = [json.loads(line) for line in f if line.strip()]
+            else:
+                data = json.load(f)
+                entries = data.get("recipes", []) if isinstance(data, dict) else data
+        added = 0
+        for entry in entries:
+            recipe = _from_entry(entry)
+            if recipe is not None and self.add(recipe):
+                added += 1
+        return added
+
+    def learn(self, recipes: List[Recipe], dietary_preferences: Optional[List[str]] = None,
+              path: str = RECIPE_CORPUS_PATH) -> int:
+        """
+        Add recipes generated by Gemini, tagged with the dietary preferences they
+        were generated for, and append the new ones to `path` if it is JSONL.
+        """
+        new_entries = []
+        for generated in recipes:
+            recipe = _from_entry({**generated, "dietary": dietary_preferences or []})
+            if recipe is not None and self.add(recipe):
+                new_entries.append(recipe)
+        if not new_entries:
+            return 0
+        with self._lock:
+            self._learned += len(new_entries)
+        if path.endswith(".jsonl"):
+            lines = "".join(json.dumps(_to_entry(recipe)) + "\n" for recipe in new_entries)
+            try:
+                with open(path, "a", encoding="utf-8") as f:
+                    f.write(lines)
+            except OSError as e:
+                logger.warning(f"Could not append learned recipes to {path}: {e}")
+        return len(new_entries)
+
+    def search(self, ingredients: List[str], dietary_preferences: Optional[List[str]] = None,
+               limit: int = 5) -> List[Recipe]:
+        """
+        The best `limit` recipes for the user's ingredients (most of them used,
+        then fewest missing), with used/missing ingredients and coverage computed
+        like for a Gemini answer.
+        """
+        started = time.perf_counter()
+        queries = list({tokens for tokens in map(ingredient_tokens, ingredients) if tokens})
+        wanted_tags = _tags(dietary_preferences)
+        with self._lock:
+            ranked = self._rank(queries, wanted_tags, limit) if queries and self._recipes else []
+            results = [self._recipes[index] for index in ranked]
+            self._searches += 1
+            self._answered += bool(results)
+            self._search_s += time.perf_counter() - started
+        return adapt_recipes(results, ingredients)
+
+    def _matching_names(self, query: FrozenSet[str]) -> List[int]:
+        """Vocabulary entries naming the ingredient: "onion" matches "red onion" and vice versa."""
+        candidates: Set[int] = set()
+        for token in query:
+            candidates.update(self._token_names.get(token, ()))
+        return [
+            name_id for name_id in candidates
+            if query <= self._vocabulary_tokens[name_id] or self._vocabulary_tokens[name_id] <= query
+        ]
+
+    def _rank(self, queries: List[FrozenSet[str]], wanted_tags: FrozenSet[str], limit: int) -> List[int]:
+        # Called with the lock held. The numpy views of the posting arrays must not outlive
+        # this call: an array can't grow while a view of it exists.
+        count = len(self._recipes)
+        usage = np.zeros(count, dtype=np.int32)  # how many of the user's ingredients each recipe uses
+        available: Set[int] = set()
+        for query in queries:
+            matched = self._matching_names(query)
+            if not matched:
+                continue
+            available.update(matched)
+            uses = np.zeros(count, dtype=bool)
+            for name_id in matched:
+                uses[np.frombuffer(self._postings[name_id], dtype=np.intc)] = True
+            usage += uses
+        if not available:
+            return []
+
+        have = np.zeros(count, dtype=np.int32)  # how many of each recipe's ingredients the user has
+        for name_id in available:
+            have[np.frombuffer(self._postings[name_id], dtype=np.intc)] += 1
+        missing = np.frombuffer(self._recipe_sizes, dtype=np.intc) - have
+
+        needed = max(1, math.ceil(self.min_usage * len(queries) - 1e-9))
+        candidates = np.flatnonzero((usage >= needed) & (missing <= self.max_missing))
+        # Most ingredients used, then fewest missing; ties go to the recipe added first
+        order = candidates[np.lexsort((candidates, missing[candidates], -usage[candidates]))]
+        ranked: List[int] = []
+        for index in order.tolist():
+            if wanted_tags <= self._recipe_tags[index]:
+                ranked.append(index)
+                if len(ranked) == limit:
+                    break
+        return ranked
+
+    def record_hedge(self, won: bool) -> None:
+        """Count a request that raced Gemini with too few corpus matches, and whether the corpus answered it."""
+        with self._lock:
+            self._hedges += 1
+            self._hedges_won += won
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "recipes": len(self._recipes),
+                "learned": self._learned,
+                "vocabulary": len(self._vocabulary_tokens),
+                "searches": self._searches,
+                "searches_with_results": self._answered,
+                "avg_search_ms": round(self._search_s / self._searches * 1000, 3) if self._searches else 0.0,
+                "hedges": self._hedges,
+                "hedges_won": self._hedges_won,
+            }
+
+
+def _to_entry(recipe: Recipe) -> Dict[str, Any]:
+    """Corpus file form of a normalized recipe."""
+    entry = {key: value for key, value in recipe.items() if key not in (
+        "usedIngredients", "missedIngredients", "usedIngredientCount", "missedIngredientCount", "coverageScore",
+    )}
+    entry["ingredients"] = recipe["usedIngredients"]
+    return entry
+
+
+_corpus: Optional[RecipeCorpus] = None
+_corpus_lock = threading.Lock()
+
+
+def get_recipe_corpus() -> RecipeCorpus:
+    """Process-wide corpus, loaded from RECIPE_CORPUS_PATH on first use."""
+    global _corpus
+    with _corpus_lock:
+        if _corpus is None:
+            corpus = RecipeCorpus()
+            if RECIPE_CORPUS_PATH and os.path.exists(RECIPE_CORPUS_PATH):
+                started = time.perf_counter()
+                try:
+                    added = corpus.load(RECIPE_CORPUS_PATH)
+                    logger.info(
+                        f"Loaded {added} recipes from {RECIPE_CORPUS_PATH} "
+                        f"in {(time.perf_counter() - started) * 1000:.0f} ms"
+                    )
+                except (OSError, ValueError) as e:
+                    logger.error(f"Could not load recipe corpus from {RECIPE_CORPUS_PATH}: {e}")
+            _corpus = corpus
+        return _corpus
+
+
+def get_corpus_stats() -> Dict[str, Any]:
+    return get_recipe_corpus().stats()
@@ -0,0 +1,288 @@
+"""
+Structured output for Gemini calls and the one-pass decode of its answers.
+
+With GEMINI_STRUCTURED_OUTPUT, recipe and batch-normalization requests send a
+response schema and ask for application/json, so the answer is the bare JSON
+document (no markdown fences, no prose) with every field of the right type.
+Such an answer is decoded once (orjson if installed, the json module otherwise),
+checked by the hand-written validator for that schema and turned into Recipe
+tuples without per-field conversions. Anything that doesn't validate returns
+None, and the caller falls back to the tolerant parser.
+
+Summaries (for the two-phase /recommend) use a smaller schema: ingredient names
+without quantities and no steps, which are generated later for the one recipe
+the user opens.
+"""
+import hashlib
+import json
+import os
+from typing import Any, Callable, Dict, List, NamedTuple, Optional
+
+try:
+    import orjson
+except ImportError:
+    orjson = None  # type: ignore[assignment]
+
+GEMINI_STRUCTURED_OUTPUT = os.environ.get("GEMINI_STRUCTURED_OUTPUT", "true").lower() == "true"
+
+JSON_LIBRARY = "orjson" if orjson is not None else "json"
+# Both raise a ValueError subclass on malformed input
+loads: Callable[[Any], Any] = orjson.loads if orjson is not None else json.loads
+
+_INGREDIENT_SCHEMA = {
+    "type": "OBJECT",
+    "properties": {"name": {"type": "STRING"}, "quantity": {"type": "STRING"}},
+    "required": ["name", "quantity"],
+}
+_RECIPE_FIELDS = [
+    "title", "description", "prepTime", "cookTime", "totalTime", "servings", "difficulty",
+    "usedIngredients", "missingIngredients", "coverageScore", "steps",
+]
+RECIPE_SCHEMA: Dict[str, Any] = {
+    "type": "OBJECT",
+    "properties": {
+        "title": {"type": "STRING"},
+        "description": {"type": "STRING"},
+        "prepTime": {"type": "INTEGER"},
+        "cookTime": {"type": "INTEGER"},
+        "totalTime": {"type": "INTEGER"},
+        "servings": {"type": "INTEGER"},
+        "difficulty": {"type": "STRING", "enum": ["Easy", "Medium", "Hard"]},
+        "usedIngredients": {"type": "ARRAY", "items": _INGREDIENT_SCHEMA},
+        "missingIngredients": {"type": "ARRAY", "items": _INGREDIENT_SCHEMA},
+        "coverageScore": {"type": "NUMBER"},
+        "steps": {"type": "ARRAY", "items": {"type": "STRING"}},
+    },
+    "required": _RECIPE_FIELDS,
+    "propertyOrdering": _RECIPE_FIELDS,
+}
+RECIPES_RESPONSE_SCHEMA: Dict[str, Any] = {
+    "type": "OBJECT",
+    "properties": {"recipes": {"type": "ARRAY", "items": RECIPE_SCHEMA}},
+    "required": ["recipes"],
+}
+INGREDIENT_NAMES_SCHEMA: Dict[str, Any] = {"type": "ARRAY", "items": {"type": "STRING"}}
+
+_SUMMARY_FIELDS = [
+    "title", "description", "prepTime", "cookTime", "totalTime", "servings", "difficulty",
+    "usedIngredients", "missingIngredients", "coverageScore",
+]
+RECIPE_SUMMARY_SCHEMA: Dict[str, Any] = {
+    "type": "OBJECT",
+    "properties": {
+        **{name: RECIPE_SCHEMA["properties"][name] for name in _SUMMARY_FIELDS},
+        "usedIngredients": INGREDIENT_NAMES_SCHEMA,
+        "missingIngredients": INGREDIENT_NAMES_SCHEMA,
+    },
+    "required": _SUMMARY_FIELDS,
+    "propertyOrdering": _SUMMARY_FIELDS,
+}
+SUMMARIES_RESPONSE_SCHEMA: Dict[str, Any] = {
+    "type": "OBJECT",
+    "properties": {"recipes": {"type": "ARRAY", "items": RECIPE_SUMMARY_SCHEMA}},
+    "required": ["recipes"],
+}
+
+
+def generation_config(schema: Dict[str, Any]) -> Dict[str, Any]:
+    """`generationConfig` of a request whose answer must follow `schema`."""
+    return {"responseMimeType": "application/json", "responseSchema": schema}
+
+
+# Hand-written checks for the schemas above (keep them in sync): exact types,
+# so a bool is not an INTEGER, and every required field present.
+_DIFFICULTIES = frozenset(RECIPE_SCHEMA["properties"]["difficulty"]["enum"])
+_RECIPE_KEYS = frozenset(_RECIPE_FIELDS)
+_SUMMARY_KEYS = frozenset(_SUMMARY_FIELDS)
+
+
+def is_valid_ingredient_names(v: Any) -> bool:
+    """Matches INGREDIENT_NAMES_SCHEMA: a list of strings."""
+    return type(v) is list and all(type(name) is str for name in v)
+
+
+def _is_ingredient_list(v: Any) -> bool:
+    if type(v) is not list:
+        return False
+    for item in v:
+        if type(item) is not dict or type(item.get("name")) is not str or type(item.get("quantity")) is not str:
+            return False
+    return True
+
+
+def _has_summary_fields(r: Dict[str, Any]) -> bool:
+    """The scalar fields a recipe and a summary share."""
+    difficulty = r["difficulty"]
+    return (
+        type(r["title"]) is str
+        and type(r["description"]) is str
+        and type(r["prepTime"]) is int
+        and type(r["cookTime"]) is int
+        and type(r["totalTime"]) is int
+        and type(r["servings"]) is int
+        and type(difficulty) is str
+        and difficulty in _DIFFICULTIES
+        and type(r["coverageScore"]) in (int, float)
+    )
+
+
+def is_valid_recipe(r: Any) -> bool:
+    """Matches RECIPE_SCHEMA."""
+    return (
+        type(r) is dict
+        and _RECIPE_KEYS.issubset(r)
+        and _has_summary_fields(r)
+        and _is_ingredient_list(r["usedIngredients"])
+        and _is_ingredient_list(r["missingIngredients"])
+        and is_valid_ingredient_names(r["steps"])
+    )
+
+
+def is_valid_summary(r: Any) -> bool:
+    """Matches RECIPE_SUMMARY_SCHEMA."""
+    return (
+        type(r) is dict
+        and _SUMMARY_KEYS.issubset(r)
+        and _has_summary_fields(r)
+        and is_valid_ingredient_names(r["usedIngredients"])
+        and is_valid_ingredient_names(r["missingIngredients"])
+    )
+
+
+def is_valid_recipes_response(v: Any) -> bool:
+    """Matches RECIPES_RESPONSE_SCHEMA."""
+    if type(v) is not dict:
+        return False
+    recipes = v.get("recipes")
+    return type(recipes) is list and all(is_valid_recipe(r) for r in recipes)
+
+
+def is_valid_summaries_response(v: Any) -> bool:
+    """Matches SUMMARIES_RESPONSE_SCHEMA."""
+    if type(v) is not dict:
+        return False
+    recipes = v.get("recipes")
+    return type(recipes) is list and all(is_valid_summary(r) for r in recipes)
+
+
+Ingredient = Dict[str, str]  # {"name": ..., "quantity": ...}
+
+
+class Recipe(NamedTuple):
+    """A recipe from a schema-valid answer; the validated lists are kept as they are."""
+
+    id: str
+    title: str
+    description: str
+    prep_time: int
+    cook_time: int
+    total_time: int
+    servings: int
+    difficulty: str
+    used: List[Ingredient]
+    missing: List[Ingredient]
+    coverage: float
+    steps: List[str]
+
+    @classmethod
+    def from_valid(cls, r: Dict[str, Any]) -> "Recipe":
+        """Build from a recipe object that passed is_valid_recipe (no further checks or conversions)."""
+        title = r["title"] or "Untitled recipe"
+        description = r["description"]
+        return cls(
+            hashlib.md5(f"{title}-{description}".encode("utf-8")).hexdigest(),
+            title,
+            description,
+            r["prepTime"],
+            r["cookTime"],
+            r["totalTime"],
+            r["servings"],
+            r["difficulty"],
+            r["usedIngredients"],
+            r["missingIngredients"],
+            float(r["coverageScore"]),
+            r["steps"],
+        )
+
+    @classmethod
+    def from_valid_summary(cls, r: Dict[str, Any]) -> "Recipe":
+        """Build from a summary object that passed the summary schema (no quantities, no steps yet)."""
+        title = r["title"] or "Untitled recipe"
+        description = r["description"]
+        return cls(
+            hashlib.md5(f"{title}-{description}".encode("utf-8")).hexdigest(),
+            title,
+            description,
+            r["prepTime"],
+            r["cookTime"],
+            r["totalTime"],
+            r["servings"],
+            r["difficulty"],
+            [{"name": name, "quantity": ""} for name in r["usedIngredients"]],
+            [{"name": name, "quantity": ""} for name in r["missingIngredients"]],
+            float(r["coverageScore"]),
+            [],
+        )
+
+    def as_dict(self) -> Dict[str, Any]:
+        """Same shape as GeminiClient._normalize_recipe."""
+        return {
+            "id": self.id,
+            "title": self.title,
+            "description": self.description,
+            "prepTime": self.prep_time,
+            "cookTime": self.cook_time,
+            "totalTime": self.total_time,
+            "servings": self.servings,
+            "difficulty": self.difficulty,
+            "usedIngredients": self.used,
+            "missedIngredients": self.missing,
+            "usedIngredientCount": len(self.used),
+            "missedIngredientCount": len(self.missing),
+            "coverageScore": self.coverage,
+            "steps": self.steps,
+        }
+
+
+def decode_recipes(text: str) -> Optional[List[Recipe]]:
+    """One-pass decode of a structured recipe answer; None if it isn't schema-valid JSON."""
+    try:
+        data = loads(text)
+    except ValueError:
+        return None
+    if not is_valid_recipes_response(data):
+        return None
+    return [Recipe.from_valid(r) for r in data["recipes"]]
+
+
+def decode_summaries(text: str) -> Optional[List[Recipe]]:
+    """One-pass decode of a structured summary answer; None if it isn't schema-valid JSON."""
+    try:
+        data = loads(text)
+    except ValueError:
+        return None
+    if not is_valid_summaries_response(data):
+        return None
+    return [Recipe.from_valid_summary(r) for r in data["recipes"]]
+
+
+def decode_recipe(text: str) -> Optional[Recipe]:
+    """One-pass decode of a structured single-recipe answer; None if it isn't schema-valid JSON."""
+    try:
+        data = loads(text)
+    except ValueError:
+        return None
+    if not is_valid_recipe(data):
+        return None
+    return Recipe.from_valid(data)
+
+
+def decode_ingredient_names(text: str, expected: int) -> Optional[List[str]]:
+    """One-pass decode of a structured batch-normalization answer; None if it isn't valid."""
+    try:
+        data = loads(text)
+    except ValueError:
+        return None
+    if not is_valid_ingredient_names(data) or len(data) != expected:
+        return None
+    return data
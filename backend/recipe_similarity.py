@@ -0,0 +1,164 @@
+"""
+Near-match lookups in the recipe cache.
+
+The recipe cache is keyed by the exact ingredient set, so "egg, tomato, onion"
+and "egg, tomato, onion, salt" would each cost a Gemini call. This index keeps
+the ingredient set of every cached answer in an inverted index (ingredient ->
+cache keys, separately per set of dietary preferences, which must match
+exactly, and per kind of answer, e.g. full recipes or summaries) and finds the cached set with the highest Jaccard similarity
+|A ∩ B| / |A ∪ B| to a new one. Only the sets that share an ingredient with the
+query are scored.
+
+A near hit's recipes are adapted to the new set: used/missing ingredients and
+the coverage score are recomputed, the cached copy is left untouched.
+"""
+import os
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Any, Dict, FrozenSet, Iterable, List, Optional, Set, Tuple
+
+# Minimum Jaccard similarity for serving a cached answer (0 disables near matches)
+RECIPE_SIMILARITY_THRESHOLD = float(os.environ.get("RECIPE_SIMILARITY_THRESHOLD", "0.75"))
+RECIPE_SIMILARITY_MAX_ENTRIES = int(os.environ.get("RECIPE_SIMILARITY_MAX_ENTRIES", "10000"))
+
+Recipes = List[Dict[str, Any]]
+
+
+def _clean(names: Iterable[str]) -> FrozenSet[str]:
+    # Same normalization as the exact cache key
+    return frozenset(name.lower().strip() for name in names if name and name.strip())
+
+
+def _partition(dietary_preferences: Optional[List[str]], variant: str) -> str:
+    return variant + "|" + ",".join(sorted(_clean(dietary_preferences or [])))
+
+
+class SimilarRecipeIndex:
+    """Thread-safe, bounded (least recently added/hit first out) index of cached ingredient sets."""
+
+    def __init__(self, threshold: float = RECIPE_SIMILARITY_THRESHOLD,
+                 max_entries: int = RECIPE_SIMILARITY_MAX_ENTRIES) -> None:
+        self.threshold = threshold
+        self.max_entries = max(1, max_entries)
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, Tuple[str, FrozenSet[str]]]" = OrderedDict()  # key -> dietary, ingredients
+        self._postings: Dict[Tuple[str, str], Set[str]] = {}  # (dietary, ingredient) -> keys
+        self._lookups = 0
+        self._hits = 0
+        self._similarity_sum = 0.0
+
+    @property
+    def enabled(self) -> bool:
+        return self.threshold > 0
+
+    def add(self, key: str, ingredients: List[str], dietary_preferences: Optional[List[str]] = None,
+            variant: str = "") -> None:
+        """Index the ingredient set cached under `key`."""
+        if not self.enabled:
+            return
+        dietary = _partition(dietary_preferences, variant)
+        names = _clean(ingredients)
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                return
+            self._entries[key] = (dietary, names)
+            for name in names:
+                self._postings.setdefault((dietary, name), set()).add(key)
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+
+    def discard(self, key: str) -> None:
+        """Forget `key` (e.g. once its cache entry has expired)."""
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+
+    def _remove(self, key: str) -> None:
+        dietary, names = self._entries.pop(key)
+        for name in names:
+            posting = self._postings.get((dietary, name))
+            if posting is not None:
+                posting.discard(key)
+                if not posting:
+                    del self._postings[(dietary, name)]
+
+    def candidates(self, ingredients: List[str], dietary_preferences: Optional[List[str]] = None,
+                   variant: str = "", limit: int = 3) -> List[Tuple[float, str]]:
+        """Up to `limit` (similarity, key) pairs at or above the threshold, most similar first."""
+        if not self.enabled:
+            return []
+        dietary = _partition(dietary_preferences, variant)
+        query = _clean(ingredients)
+        if not query:
+            return []
+        with self._lock:
+            shared: Dict[str, int] = {}
+            for name in query:
+                for key in self._postings.get((dietary, name), ()):
+                    shared[key] = shared.get(key, 0) + 1
+            scored = []
+            for key, overlap in shared.items():
+                similarity = overlap / (len(query) + len(self._entries[key][1]) - overlap)
+                if similarity >= self.threshold:
+                    scored.append((similarity, key))
+        scored.sort(reverse=True)
+        return scored[:limit]
+
+    def record_lookup(self, similarity: Optional[float]) -> None:
+        """Count a near-match lookup (after an exact miss) and, if served, its similarity."""
+        with self._lock:
+            self._lookups += 1
+            if similarity is not None:
+                self._hits += 1
+                self._similarity_sum += similarity
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "threshold": self.threshold,
+                "indexed": len(self._entries),
+                "max_entries": self.max_entries,
+                "lookups": self._lookups,
+                "near_hits": self._hits,
+                "near_hit_rate": round(self._hits / self._lookups, 3) if self._lookups else 0.0,
+                "avg_similarity": round(self._similarity_sum / self._hits, 3) if self._hits else None,
+            }
+
+
+@lru_cache(maxsize=8192)
+def ingredient_tokens(name: str) -> FrozenSet[str]:
+    """Lower-cased, roughly singular words of an ingredient name, for fuzzy matching."""
+    return frozenset(word[:-1] if len(word) > 3 and word.endswith("s") else word
+                     for word in name.lower().replace(",", " ").split())
+
+
+def has_ingredient(name: str, available: List[FrozenSet[str]]) -> bool:
+    """Whether one of the `available` token sets names the ingredient ("eggs" ~ "egg", "red onion" ~ "onion")."""
+    words = ingredient_tokens(name)
+    return bool(words) and any(tokens and (tokens <= words or words <= tokens) for tokens in available)
+
+
+def adapt_recipes(recipes: Recipes, ingredients: List[str]) -> Recipes:
+    """
+    Copies of cached recipes with used/missing ingredients and coverage
+    recomputed for the ingredients the user has now.
+    """
+    available = [ingredient_tokens(ing) for ing in ingredients]
+    adapted = []
+    for recipe in recipes:
+        needed = list(recipe.get("usedIngredients") or []) + list(recipe.get("missedIngredients") or [])
+        used = [item for item in needed if has_ingredient(item.get("name", ""), available)]
+        missing = [item for item in needed if not has_ingredient(item.get("name", ""), available)]
+        used_tokens = [ingredient_tokens(item.get("name", "")) for item in used]
+        hits = sum(1 for tokens in available if tokens and any(tokens <= u or u <= tokens for u in used_tokens))
+        adapted.append({
+            **recipe,
+            "usedIngredients": used,
+            "missedIngredients": missing,
+            "usedIngredientCount": len(used),
+            "missedIngredientCount": len(missing),
+            "coverageScore": hits / (len(ingredients) or 1),
+        })
+    return adapted
@@ -0,0 +1,98 @@
+"""
+Incremental parsing of a streamed `{"recipes": [...]}` answer.
+
+Gemini's streaming endpoint returns the answer text in arbitrary chunks. The
+parser scans each chunk once, tracking string/escape state and brace depth,
+and hands back every element of the "recipes" array as soon as its closing
+brace arrives, so the first recipe can be sent long before the last one is
+written. Text around the JSON (markdown fences, prose) is ignored.
+"""
+import logging
+from typing import Any, Dict, List
+
+from recipe_schema import loads
+
+logger = logging.getLogger(__name__)
+
+_RECIPES_KEY = '"recipes"'
+
+
+class RecipeStreamParser:
+    """Feed answer text chunks in order; `feed` returns the recipe objects completed by each chunk."""
+
+    def __init__(self) -> None:
+        self._buffer = ""
+        self._pos = 0  # next character of the buffer to scan
+        self._in_array = False
+        self._array_done = False
+        self._depth = 0  # brace depth inside the current recipe object
+        self._start = -1  # buffer offset of the current recipe object
+        self._in_string = False
+        self._escaped = False
+        self.recipes_seen = 0
+
+    @property
+    def text(self) -> str:
+        """All text fed so far (for a whole-answer fallback parse)."""
+        return self._buffer
+
+    def _find_array(self) -> bool:
+        key = self._buffer.find(_RECIPES_KEY, max(0, self._pos - len(_RECIPES_KEY)))
+        if key == -1:
+            self._pos = len(self._buffer)
+            return False
+        bracket = self._buffer.find("[", key + len(_RECIPES_KEY))
+        if bracket == -1:
+            self._pos = key
+            return False
+        self._in_array = True
+        self._pos = bracket + 1
+        return True
+
+    def feed(self, chunk: str) -> List[Dict[str, Any]]:
+        self._buffer += chunk
+        completed: List[Dict[str, Any]] = []
+        if self._array_done or (not self._in_array and not self._find_array()):
+            return completed
+
+        buffer = self._buffer
+        pos = self._pos
+        while pos < len(buffer):
+            char = buffer[pos]
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif char == "\\":
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+            elif char == '"':
+                self._in_string = True
+            elif char == "{":
+                if self._depth == 0:
+                    self._start = pos
+                self._depth += 1
+            elif char == "}":
+                self._depth -= 1
+                if self._depth == 0:
+                    recipe = self._decode(buffer[self._start:pos + 1])
+                    if recipe is not None:
+                        completed.append(recipe)
+            elif char == "]" and self._depth == 0:
+                self._array_done = True
+                pos += 1
+                break
+            pos += 1
+        self._pos = pos
+        return completed
+
+    def _decode(self, raw: str) -> Any:
+        try:
+            recipe = loads(raw)
+        except ValueError as e:
+            logger.warning(f"Skipping malformed streamed recipe: {e}")
+            return None
+        if not isinstance(recipe, dict):
+            return None
+        self.recipes_seen += 1
+        return recipe
@@ -0,0 +1,110 @@
+"""
+Single-flight coalescing of identical upstream calls.
+
+While a call for a key is in flight, concurrent callers with the same key
+wait for it and share its result or error instead of starting their own.
+Nothing is kept once the call completes; caching is left to the caller.
+"""
+import asyncio
+import threading
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Tuple, TypeVar
+
+T = TypeVar("T")
+
+
+class _Call:
+    """An in-flight blocking call."""
+
+    def __init__(self) -> None:
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+
+
+def _consume_exception(task: "asyncio.Future[Any]") -> None:
+    # Avoid "exception was never retrieved" when every waiter was cancelled
+    if not task.cancelled():
+        task.exception()
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls per key, for coroutines (`run`) and blocking
+    functions (`run_sync`, e.g. from inference worker threads).
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._tasks: Dict[Hashable, "asyncio.Future[Any]"] = {}
+        self._calls: Dict[Hashable, _Call] = {}
+        self._calls_started = 0
+        self._coalesced = 0
+
+    async def run(self, key: Hashable, fn: Callable[[], Awaitable[T]]) -> T:
+        """Await `fn()`, or the in-flight call for `key` if there is one."""
+        task, _ = self.start(key, fn)
+        return await asyncio.shield(task)
+
+    def start(self, key: Hashable, fn: Callable[[], Awaitable[T]]) -> "Tuple[asyncio.Future[T], bool]":
+        """
+        The task of the in-flight call for `key`, or of a new `fn()` call, without
+        awaiting it; the flag is True if this caller started it. Lets a caller
+        consume partial output of its own call (e.g. a stream) while others just
+        wait for the result.
+        """
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            task = self._tasks.get(key)
+            if task is not None and not task.done() and task.get_loop() is loop:
+                self._coalesced += 1
+                return task, False
+            # The upstream call runs as its own task, so a cancelled caller
+            # (e.g. a client that disconnected) doesn't cancel it for the others
+            task = asyncio.ensure_future(fn())
+            task.add_done_callback(_consume_exception)
+            task.add_done_callback(lambda done, key=key: self._forget(key, done))
+            self._tasks[key] = task
+            self._calls_started += 1
+            return task, True
+
+    def _forget(self, key: Hashable, task: "asyncio.Future[Any]") -> None:
+        with self._lock:
+            if self._tasks.get(key) is task:
+                del self._tasks[key]
+
+    def run_sync(self, key: Hashable, fn: Callable[[], T]) -> T:
+        """Call `fn()`, or wait for the in-flight call for `key` if there is one."""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self._calls_started += 1
+            else:
+                self._coalesced += 1
+        assert call is not None
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+            return call.result
+        except BaseException as exc:
+            call.error = exc
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "upstream_calls": self._calls_started,
+                "coalesced": self._coalesced,
+                "in_flight": len(self._tasks) + len(self._calls),
+            }
@@ -3,5 +3,25 @@
 # This ensures PORT environment variable is properly expanded
 
 PORT=${PORT:-8000}
-exec uvicorn main:app --host 0.0.0.0 --port "$PORT"
 
+# Optional shared inference pool: N model workers serve every uvicorn worker
+# (WEB_CONCURRENCY) through a local socket, so the host holds N model copies.
+INFERENCE_POOL_WORKERS=${INFERENCE_POOL_WORKERS:-0}
+if [ "$INFERENCE_POOL_WORKERS" -gt 0 ]; then
+    # Pool messages are pickled: a fresh random key per boot, and a socket in a private (0700) directory
+    export INFERENCE_POOL_AUTHKEY=${INFERENCE_POOL_AUTHKEY:-$(python -c 'import secrets; print(secrets.token_hex(32))')}
+    export INFERENCE_POOL_ADDRESS=${INFERENCE_POOL_ADDRESS:-$(mktemp -d /tmp/recipe-inference.XXXXXX)/pool.sock}
+    python inference_pool.py --workers "$INFERENCE_POOL_WORKERS" --address "$INFERENCE_POOL_ADDRESS" &
+    # Wait for the pool socket so the API's startup warmup can reach it
+    for _ in $(seq 1 60); do
+        [ -S "$INFERENCE_POOL_ADDRESS" ] && break
+        sleep 1
+    done
+fi
+
+# Several uvicorn workers share one Gemini rate-limit budget through a lock file
+if [ "${WEB_CONCURRENCY:-1}" -gt 1 ]; then
+    export GEMINI_RATE_LIMIT_FILE=${GEMINI_RATE_LIMIT_FILE:-/tmp/recipe-gemini-ratelimit.json}
+fi
+
+exec uvicorn main:app --host 0.0.0.0 --port "$PORT" --workers "${WEB_CONCURRENCY:-1}"
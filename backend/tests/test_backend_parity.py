@@ -0,0 +1,45 @@
+"""
+The exported ONNX Runtime and OpenVINO models must find the same classes and
+boxes as the PyTorch model.
+
+Runs on a folder of photos the model detects ingredients in (PARITY_IMAGE_DIR),
+since synthetic images rarely produce a detection to compare. Needs the weights
+(MODEL_PATH or backend/my_model.pt) and the runtimes from requirements-backends.txt;
+skipped when any of them is missing.
+"""
+import os
+
+import pytest
+
+PARITY_IMAGE_DIR = os.environ.get("PARITY_IMAGE_DIR")
+PARITY_CONFIDENCE = float(os.environ.get("PARITY_CONFIDENCE", "0.25"))
+
+_RUNTIMES = {"onnx": "onnxruntime", "openvino": "openvino"}
+
+
+@pytest.fixture(scope="module")
+def images():
+    if not PARITY_IMAGE_DIR:
+        pytest.skip("Set PARITY_IMAGE_DIR to a folder of photos the model detects ingredients in")
+    from model import resolve_model_path
+    from model_tools import load_image_folder
+
+    try:
+        resolve_model_path()
+    except FileNotFoundError as e:
+        pytest.skip(str(e))
+    return load_image_folder(PARITY_IMAGE_DIR)
+
+
+@pytest.mark.parametrize("backend", sorted(_RUNTIMES))
+def test_backend_matches_torch(backend, images):
+    pytest.importorskip(_RUNTIMES[backend])
+    from model_tools import check_parity, parity_passed
+
+    stats = check_parity([backend], images, PARITY_CONFIDENCE)[backend]
+
+    assert "error" not in stats, stats.get("error")
+    assert stats["reference_detections"] > 0, "No PyTorch detections on PARITY_IMAGE_DIR; nothing was compared"
+    assert stats["class_names_match"], stats
+    assert stats["missing_detections"] == 0 and stats["extra_detections"] == 0, stats
+    assert parity_passed(stats)
@@ -0,0 +1,125 @@
+"""
+Thread-safe LRU cache with per-entry TTL, an entry/byte bound and counters.
+
+get and put are O(1): entries live in an OrderedDict ordered from least to most
+recently used, hits move an entry to the end, and eviction pops from the front.
+Expired entries are dropped lazily when they are looked up or reach the front.
+"""
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Generic, Hashable, List, Optional, Tuple, TypeVar
+
+V = TypeVar("V")
+
+
+class LRUCache(Generic[V]):
+    """
+    Least-recently-used cache bounded by `max_entries` and, if `sizeof` is given,
+    by `max_bytes` (as measured by `sizeof(value)`). `ttl` is the default
+    lifetime in seconds; None means entries only leave through eviction.
+    """
+
+    def __init__(self, max_entries: int, ttl: Optional[float] = None, max_bytes: Optional[int] = None,
+                 sizeof: Optional[Callable[[V], int]] = None) -> None:
+        self.max_entries = max(1, max_entries)
+        self.ttl = ttl
+        self.max_bytes = max_bytes if sizeof is not None else None
+        self._sizeof = sizeof
+        self._entries: "OrderedDict[Hashable, Tuple[V, float, int]]" = OrderedDict()  # value, expires at, size
+        self._lock = threading.Lock()
+        self._bytes = 0
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._expirations = 0
+
+    def _drop(self, key: Hashable) -> None:
+        _, _, size = self._entries.pop(key)
+        self._bytes -= size
+
+    def get(self, key: Hashable, default: Optional[V] = None) -> Optional[V]:
+        """Return the live value for `key` (marking it most recently used), or `default`."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] <= time.monotonic():
+                self._drop(key)
+                self._expirations += 1
+                entry = None
+            if entry is None:
+                self._misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self._hits += 1
+            return entry[0]
+
+    def put(self, key: Hashable, value: V, ttl: Optional[float] = None) -> None:
+        """Insert or replace `key`; `ttl` overrides the cache's default lifetime."""
+        ttl = self.ttl if ttl is None else ttl
+        expires_at = time.monotonic() + ttl if ttl is not None else float("inf")
+        size = self._sizeof(value) if self._sizeof is not None else 0
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = (value, expires_at, size)
+            self._bytes += size
+            self._evict()
+
+    def _evict(self) -> None:
+        now = time.monotonic()
+        while self._entries and (
+            len(self._entries) > self.max_entries
+            or (self.max_bytes is not None and self._bytes > self.max_bytes and len(self._entries) > 1)
+        ):
+            key, (_, expires_at, _) = next(iter(self._entries.items()))
+            self._drop(key)
+            if expires_at <= now:
+                self._expirations += 1
+            else:
+                self._evictions += 1
+
+    def pop(self, key: Hashable) -> Optional[V]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            self._drop(key)
+            return entry[0]
+
+    def items(self) -> List[Tuple[Hashable, V]]:
+        """Live entries, least recently used first (doesn't count as hits or refresh them)."""
+        now = time.monotonic()
+        with self._lock:
+            return [(key, value) for key, (value, expires_at, _) in self._entries.items() if expires_at > now]
+
+    def __contains__(self, key: Hashable) -> bool:
+        """Whether a live entry exists (doesn't count as a hit or refresh it)."""
+        with self._lock:
+            entry = self._entries.get(key)
+            return entry is not None and entry[1] > time.monotonic()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        """Size, bounds and hit/miss/eviction counters."""
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_entries,
+                "bytes": self._bytes if self._sizeof is not None else None,
+                "max_bytes": self.max_bytes,
+                "ttl": self.ttl,
+                "hits": self._hits,
+                "misses": self._misses,
+                "evictions": self._evictions,
+                "expirations": self._expirations,
+                "hit_rate": round(self._hits / lookups, 3) if lookups else 0.0,
+            }
@@ -0,0 +1,232 @@
+"""
+Ingredient detection on a short sweep video (or a sequence of still frames).
+
+Frames are decoded one at a time and discarded once processed (a video is read
+from a file on disk, still frames from one file each), so memory stays bounded
+by the batch size whatever the clip length:
+
+- Frames are sampled adaptively: starting at VIDEO_SAMPLE_FPS, the sampling step
+  doubles while the camera dwells on the same view and resets once the view changes.
+- Near-duplicate frames are skipped using the mean absolute difference of tiny
+  grayscale thumbnails, which is cheap compared to a model call.
+- Kept frames are run through the model in batches of VIDEO_BATCH_SIZE.
+- A class is reported only if it was detected in at least VIDEO_MIN_FRAMES_SEEN
+  kept frames, which filters out single-frame false positives.
+"""
+import logging
+import os
+import time
+from typing import Any, Dict, Iterable, Iterator, List, NamedTuple, Optional
+
+import cv2
+import numpy as np
+
+from detections import ClassDetection, IngredientDetection, merge_by_ingredient
+from image_preprocessing import ImageDecodeError, prepare_image, to_model_array
+from model import INFERENCE_IMAGE_SIZE, detect_classes_many, normalize_class_names
+
+logger = logging.getLogger(__name__)
+
+# Also the limit on the total size of a still-frame sequence
+VIDEO_MAX_FILE_SIZE_MB = int(os.environ.get("VIDEO_MAX_FILE_SIZE_MB", "50"))
+VIDEO_MAX_SECONDS = float(os.environ.get("VIDEO_MAX_SECONDS", "60"))
+# Initial frame sampling rate (frames per second of video)
+VIDEO_SAMPLE_FPS = float(os.environ.get("VIDEO_SAMPLE_FPS", "2"))
+# Maximum frames sent to the model per clip
+VIDEO_MAX_FRAMES = int(os.environ.get("VIDEO_MAX_FRAMES", "32"))
+# Maximum still images accepted as a frame sequence
+VIDEO_MAX_FRAME_UPLOADS = int(os.environ.get("VIDEO_MAX_FRAME_UPLOADS", "120"))
+VIDEO_BATCH_SIZE = int(os.environ.get("VIDEO_BATCH_SIZE", "8"))
+# Mean absolute thumbnail difference (0-1) below which a frame counts as a duplicate
+VIDEO_DEDUP_THRESHOLD = float(os.environ.get("VIDEO_DEDUP_THRESHOLD", "0.04"))
+VIDEO_MIN_FRAMES_SEEN = int(os.environ.get("VIDEO_MIN_FRAMES_SEEN", "2"))
+
+_THUMB_SIZE = (32, 32)
+# The sampling step grows up to this multiple of the initial step on static footage
+_MAX_STEP_FACTOR = 8
+
+
+class VideoDetectionResult(NamedTuple):
+    detections: List[IngredientDetection]
+    frames_seen: Dict[str, int]  # ingredient -> kept frames it was detected in
+    stats: Dict[str, Any]
+
+
+def _thumbnail(frame: np.ndarray) -> np.ndarray:
+    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+    return cv2.resize(gray, _THUMB_SIZE, interpolation=cv2.INTER_AREA).astype(np.float32) / 255.0
+
+
+def _fit_inference_size(frame: np.ndarray, max_size: int = INFERENCE_IMAGE_SIZE) -> np.ndarray:
+    """Downscale a BGR frame so its longest side is at most max_size (no upscaling)."""
+    height, width = frame.shape[:2]
+    scale = min(max_size / float(width), max_size / float(height), 1.0)
+    if scale == 1.0:
+        return np.ascontiguousarray(frame)
+    size = (max(1, int(width * scale)), max(1, int(height * scale)))
+    return cv2.resize(frame, size, interpolation=cv2.INTER_AREA)
+
+
+class FrameSampler:
+    """
+    Decides which frames are kept: skips near-duplicates of the last kept frame and
+    adapts the sampling step (in frames) to how fast the view changes.
+    """
+
+    def __init__(self, base_step: int = 1, dedup_threshold: float = VIDEO_DEDUP_THRESHOLD) -> None:
+        self.base_step = max(1, base_step)
+        self.step = self.base_step
+        self.dedup_threshold = dedup_threshold
+        self._last_thumb: Optional[np.ndarray] = None
+        self.sampled = 0
+        self.kept = 0
+        self.duplicates = 0
+
+    def keep(self, frame: np.ndarray) -> bool:
+        """Return whether `frame` is kept, updating the sampling step."""
+        self.sampled += 1
+        thumb = _thumbnail(frame)
+        if self._last_thumb is not None:
+            difference = float(np.mean(np.abs(thumb - self._last_thumb)))
+            if difference < self.dedup_threshold:
+                self.duplicates += 1
+                self.step = min(self.step * 2, self.base_step * _MAX_STEP_FACTOR)
+                return False
+            if difference > 2 * self.dedup_threshold:
+                self.step = self.base_step
+        self._last_thumb = thumb
+        self.kept += 1
+        return True
+
+
+def iter_video_frames(path: str, sampler: FrameSampler, max_frames: int = VIDEO_MAX_FRAMES) -> Iterator[np.ndarray]:
+    """
+    Yield the kept frames of a video file, downscaled to the inference size.
+
+    Raises:
+        ImageDecodeError: If the file cannot be opened as a video.
+    """
+    capture = cv2.VideoCapture(path)
+    if not capture.isOpened():
+        raise ImageDecodeError("Unable to open the video. Please upload an MP4, MOV or WebM clip.")
+    try:
+        fps = capture.get(cv2.CAP_PROP_FPS)
+        fps = fps if fps and fps > 0 else 30.0
+        sampler.base_step = sampler.step = max(1, int(round(fps / VIDEO_SAMPLE_FPS)))
+        last_frame = int(fps * VIDEO_MAX_SECONDS)
+
+        index, next_sample, kept = 0, 0, 0
+        while index < last_frame and kept < max_frames:
+            # grab() skips a frame without converting it; only sampled frames are retrieved
+            if not capture.grab():
+                break
+            if index == next_sample:
+                ok, frame = capture.retrieve()
+                if not ok:
+                    break
+                if sampler.keep(frame):
+                    kept += 1
+                    yield _fit_inference_size(frame)
+                next_sample = index + sampler.step
+            index += 1
+    finally:
+        capture.release()
+
+
+def iter_image_frames(paths: Iterable[str], sampler: FrameSampler,
+                      max_frames: int = VIDEO_MAX_FRAMES) -> Iterator[np.ndarray]:
+    """Yield the kept frames of a sequence of encoded still images on disk, reading one at a time."""
+    kept = 0
+    for path in paths:
+        if kept >= max_frames:
+            break
+        with open(path, "rb") as f:
+            contents = f.read()
+        pixels = to_model_array(prepare_image(contents, INFERENCE_IMAGE_SIZE))
+        if sampler.keep(pixels):
+            kept += 1
+            yield pixels
+
+
+def aggregate_frames(frames: Iterable[np.ndarray], sampler: FrameSampler,
+                     min_frames_seen: int = VIDEO_MIN_FRAMES_SEEN,
+                     batch_size: int = VIDEO_BATCH_SIZE) -> VideoDetectionResult:
+    """
+    Run kept frames through the model in batches and vote across frames.
+
+    An ingredient's count is the most instances seen in a single frame (the same item
+    shows up in many frames), and its confidence the highest over all frames.
+    """
+    started = time.perf_counter()
+    votes: Dict[str, List[Any]] = {}  # raw class -> [frames seen, max confidence, max count]
+    batch: List[np.ndarray] = []
+    processed = 0
+
+    def flush() -> None:
+        nonlocal processed
+        # Model errors are reported like those of the image endpoints; decode errors are not wrapped
+        try:
+            per_frame = detect_classes_many(batch)
+        except FileNotFoundError as e:
+            raise RuntimeError(f"Model file error: {e}") from e
+        except Exception as e:
+            raise RuntimeError(f"Error during YOLO inference: {e}") from e
+        for frame_detections in per_frame:
+            for detection in frame_detections:
+                vote = votes.setdefault(detection.name, [0, 0.0, 0])
+                vote[0] += 1
+                vote[1] = max(vote[1], detection.confidence)
+                vote[2] = max(vote[2], detection.count)
+        processed += len(batch)
+        batch.clear()
+
+    for frame in frames:
+        batch.append(frame)
+        if len(batch) >= batch_size:
+            flush()
+    if batch:
+        flush()
+
+    # Very short clips still report what their few frames show
+    required = max(1, min(min_frames_seen, processed))
+    kept_classes = [
+        ClassDetection(name, confidence, count, [])
+        for name, (seen, confidence, count) in sorted(votes.items(), key=lambda item: -item[1][1])
+        if seen >= required
+    ]
+    normalized = normalize_class_names([detection.name for detection in kept_classes])
+    detections = merge_by_ingredient(kept_classes, normalized)
+
+    frames_seen: Dict[str, int] = {}
+    for detection in kept_classes:
+        name = (normalized.get(detection.name) or detection.name.lower()).lower()
+        frames_seen[name] = max(frames_seen.get(name, 0), votes[detection.name][0])
+
+    stats = {
+        "sampled_frames": sampler.sampled,
+        "duplicate_frames": sampler.duplicates,
+        "processed_frames": processed,
+        "min_frames_seen": required,
+        "rejected_classes": sorted(name for name, vote in votes.items() if vote[0] < required),
+        "processing_ms": round((time.perf_counter() - started) * 1000, 2),
+    }
+    logger.info(f"Video detection: {stats}")
+    return VideoDetectionResult(detections, frames_seen, stats)
+
+
+def detect_ingredients_from_video(path: str) -> VideoDetectionResult:
+    """
+    Detect ingredients in a video file on disk.
+    Meant to be submitted to the inference executor as a single job.
+    """
+    sampler = FrameSampler()
+    return aggregate_frames(iter_video_frames(path, sampler), sampler)
+
+
+def detect_ingredients_from_frames(paths: List[str]) -> VideoDetectionResult:
+    """
+    Detect ingredients in a sequence of still frames (encoded image files, in order).
+    Meant to be submitted to the inference executor as a single job.
+    """
+    sampler = FrameSampler()
+    return aggregate_frames(iter_image_frames(paths, sampler), sampler)